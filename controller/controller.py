@@ -1,20 +1,16 @@
-import importlib
+import dataclasses
 import time
 import typing as t
-from abc import abstractmethod
 
-import inputs
-from inputs import get_gamepad, devices
 import math
-import threading
-from enum import Enum
-
-from vehicle.constants import InputChannel, Relay, Camera, CAM_INDICES, BACKWARD_CAM_INDICES
-from logger import root_logger
 
+import numpy as np
 
-TRANSLATION_SENSITIVITY = 1
-ROTATIONAL_SENSITIVITY = 0.75
+from controller.gamepad import GamepadEvent, GamepadReader, InputState, find_gamepads
+from controller.mapping import InputMapping, to_channel_dict
+from controller.profile import BUTTON, HAT, CodeHandler, ControllerProfile, compile_dispatch, load_profile, \
+    load_profiles
+from vehicle.constants import InputChannel, Relay, CAM_INDICES, BACKWARD_CAM_INDICES
 
 from logger import root_logger
 logger = root_logger.getChild(__name__)
@@ -25,114 +21,158 @@ def apply_curve(value, exponential):
     return math.copysign(abs(value) ** exponential, value)
 
 
-def map_range(val, base_range, new_range):
-    return (val - base_range[0]) / (base_range[1] - base_range[0]) * (new_range[1] - new_range[0]) + new_range[0]
+@dataclasses.dataclass(frozen=True)
+class _CompiledProfile:
+    """Everything built from a profile, swapped as one attribute when it's reloaded"""
+    profile: ControllerProfile
+    state: InputState
+    mapping: InputMapping
+    dispatch: t.Dict[str, CodeHandler]
 
 
-class Controller:
-    class JoystickAxis(Enum):
-        pass
+def _compile(profile: ControllerProfile) -> _CompiledProfile:
+    # Normalized values of every control, written by the reader thread a whole event frame at a time
+    state = InputState(profile.controls)
+    mapping = InputMapping(profile.mapping, state.index, lambda m: profile.curve(m.control))
+    return _CompiledProfile(profile, state, mapping, compile_dispatch(profile))
 
-    class Trigger(Enum):
-        pass
 
-    class Button(Enum):
-        pass
+class Controller:
+    """
+    A gamepad driving the vehicle as its ControllerProfile describes. Events are handled with the profile's dispatch
+    table, and the profile is reloaded whenever its file is saved, without restarting the GUI. A profile that fails to
+    load is logged and the current one kept.
+    """
 
-    def __init__(self, get_big_video_index, joystick_curve_exponential=2, trigger_curve_exponential=2):
+    def __init__(self, profile: ControllerProfile, get_big_video_index):
         self.connected = False
 
-        self.JOY_RANGE = None
-        self.TRIG_RANGE = None
-
         self.switch_camera_callbacks = []
         self.toggle_relay_callbacks = []
         self.switch_mode_callbacks = []
 
         self.get_big_video_index = get_big_video_index
 
-        self.joystick_curve_exponential = joystick_curve_exponential
-        self.trigger_curve_exponential = trigger_curve_exponential
+        # Read once per call by other threads, so a reload is never seen half done
+        self._compiled = _compile(profile)
 
-        self.joystick_axes: t.Dict[Controller.JoystickAxis, float] = {}
-        self.triggers: t.Dict[Controller.Trigger, float] = {}
-        self.buttons: t.Dict[Controller.Button, bool] = {}
+        self._reader = GamepadReader(self._handle_event, self._commit, self._on_connection,
+                                     match=lambda device: self.profile.matches(device.name),
+                                     resync_callback=self._handle_resync)
+        self._reader.watch_file(profile.path, self._reload_profile)
 
-        self.joystick_axis_codes = [axis.value for axis in self.JoystickAxis]
-        self.trigger_codes = [trigger.value for trigger in self.Trigger]
-        self.button_codes = [button.value for button in self.Button]
+    @property
+    def profile(self) -> ControllerProfile:
+        return self._compiled.profile
 
-        self._monitor_thread = threading.Thread(target=self._monitor_controller, args=())
-        self._monitor_thread.daemon = True
+    @property
+    def state(self) -> InputState:
+        return self._compiled.state
 
     def start_monitoring(self):
-        self._monitor_thread.start()
-
-    def _monitor_controller(self):
-        while True:
-            try:
-                events = get_gamepad()
-            except OSError:
-                logger.info("Controller disconnected")
-                self.connected = False
-
-                # Reset all inputs to 0
-                for axis in self.joystick_axes.keys():
-                    self.joystick_axes[axis] = 0
-                for trigger in self.triggers.keys():
-                    self.triggers[trigger] = 0
-                for button in self.buttons.keys():
-                    self.buttons[button] = False
-
-                while True:
-                    # Keep reloading the module until it works (should only take one try)
-                    try:
-                        importlib.reload(inputs)
-                        from inputs import devices
-                        break
-                    except Exception:
-                        time.sleep(0.5)
+        self._reader.start()
+
+    def stop_monitoring(self):
+        self._reader.stop()
+
+    def _on_connection(self, connected: bool):
+        self.connected = connected
+        if not connected:
+            # Reset all inputs to 0
+            self.state.reset()
+
+    def _commit(self):
+        self._compiled.state.commit()
+
+    def _reload_profile(self):
+        """Runs on the reader thread when the profile's file changes"""
+        try:
+            compiled = _compile(load_profile(self.profile.path))
+        except (OSError, ValueError) as e:
+            logger.error(f"Keeping the current controller profile, the changed one can't be used: {e}")
+            return
+
+        # Fill in the new state from the gamepad's current raw state before publishing it, so the vehicle never sees
+        # the controls jump to zero. Bindings aren't run, saving the file shouldn't toggle a relay
+        for event in self._reader.current_events():
+            self._stage(compiled, event)
+        compiled.state.commit()
+        self._compiled = compiled
+        logger.info(f"Reloaded controller profile {compiled.profile.name} from {compiled.profile.path}")
+
+    @staticmethod
+    def _stage(compiled: _CompiledProfile, event: GamepadEvent) -> t.Optional[CodeHandler]:
+        handler = compiled.dispatch.get(event.code)
+        if handler is None:
+            return None
+        # Clamped, since the ranges are nominal and the input mapping relies on values staying inside them
+        value = min(max(event.state * handler.scale + handler.offset, handler.low), handler.high)
+        compiled.state.set(handler.control, value, event.timestamp)
+        return handler
+
+    def _handle_resync(self, event: GamepadEvent):
+        """The state of a gamepad that just connected. Staged without running bindings, held buttons aren't presses"""
+        self._stage(self._compiled, event)
+
+    def _handle_event(self, event: GamepadEvent):
+        compiled = self._compiled
+        handler = self._stage(compiled, event)
+        if handler is None:
+            logger.debug(f"Unrecognized: {event.code} {event.state}")
+            return
+
+        for binding in handler.bindings:
+            matched = bool(event.state) if binding.state is None else event.state == binding.state
+            if not matched:
                 continue
-            except inputs.UnpluggedError:
-                time.sleep(0.5)
-                devices._find_devices()
+            # Read the staged state, since this runs on the reader thread partway through a frame
+            if binding.while_held is not None and not compiled.state.staged(binding.while_held):
+                continue
+            if binding.unless_held is not None and compiled.state.staged(binding.unless_held):
                 continue
 
-            if not self.connected:
-                self.connected = True
-                logger.info("Controller connected")
-            for event in events:
-                self._handle_event(event)
-
-    def _handle_event(self, event):
-        code = event.code
-        if "SYN" in code or code == "MSC_SCAN":
-            return
-        if code in self.joystick_axis_codes:
-            self.joystick_axes[self.JoystickAxis(
-                code)] = map_range(event.state, self.JOY_RANGE, (-1, 1))  # normalize between -1 and 1
-        elif code in self.trigger_codes:
-            self.triggers[self.Trigger(code)] = map_range(event.state, self.TRIG_RANGE, (0, 1))
-        elif code in self.button_codes:
-            self.buttons[self.Button(code)] = bool(event.state)
-        else:
-            print(f"Unrecognized: {code} {event.state}")
-
-        self.check_for_camera_change(event)
-        self.check_for_relay_toggle(event)
-        self.check_for_mode_change(event)
-
-    def get(self, control: t.Union[JoystickAxis, Trigger, Button]) -> t.Union[float, bool]:
-        if isinstance(control, self.JoystickAxis):
-            return apply_curve(self.joystick_axes.get(control, 0), self.joystick_curve_exponential)
-        if isinstance(control, self.Trigger):
-            return apply_curve(self.triggers.get(control, 0), self.trigger_curve_exponential)
-        if isinstance(control, self.Button):
-            return self.buttons.get(control, False)
-
-    @abstractmethod
-    def get_vehicle_inputs(self):
-        pass
+            if binding.camera is not None:
+                self.call_camera_callbacks(CAM_INDICES[binding.camera])
+            elif binding.relay is not None:
+                backward = binding.backward_relay is not None and self.get_big_video_index() in BACKWARD_CAM_INDICES
+                self.call_relay_callbacks(binding.backward_relay if backward else binding.relay)
+            elif binding.mode is not None:
+                self.call_mode_callbacks(binding.mode)
+
+    def get(self, control: str, snapshot: t.Optional[np.ndarray] = None) -> t.Union[float, bool]:
+        """The value of a control, from snapshot if given so several controls can be read from the same frame"""
+        compiled = self._compiled
+        value = compiled.state.get(control, snapshot)
+        kind = compiled.profile.kind(control)
+        if kind == BUTTON:
+            return bool(value)
+        if kind == HAT:
+            return value
+        return apply_curve(value, compiled.profile.curve(control)[0])
+
+    def get_input_vector(self) -> np.ndarray:
+        """Vehicle inputs in controller.mapping.VEHICLE_CHANNELS order, all from the same frame"""
+        compiled = self._compiled
+        return compiled.mapping(compiled.state.snapshot())
+
+    def get_input_frame(self) -> t.Tuple[np.ndarray, np.ndarray]:
+        """
+        Vehicle inputs like get_input_vector, and the time.monotonic() of the newest input event behind each, for
+        tracing latency
+        """
+        compiled = self._compiled
+        values, timestamps = compiled.state.snapshot_with_times()
+        return compiled.mapping(values), compiled.mapping.event_times(timestamps)
+
+    def get_vehicle_inputs(self) -> t.Dict[InputChannel, float]:
+        return to_channel_dict(self.get_input_vector())
+
+    def inject_events(self, data: bytes):
+        """
+        Handle raw input_events as if they came from the gamepad, e.g. synthetic ones from
+        controller.gamepad.encode_events for benchmarks. Only for use while monitoring isn't running
+        """
+        self._reader.feed(data)
 
     def register_camera_callback(self, callback):
         self.switch_camera_callbacks.append(callback)
@@ -141,10 +181,6 @@ class Controller:
         for callback in self.switch_camera_callbacks:
             callback(index)
 
-    def check_for_camera_change(self, event):
-        """Process an event and call the switch camera callbacks if appropriate"""
-        pass
-
     def register_mode_callback(self, callback):
         self.switch_mode_callbacks.append(callback)
 
@@ -153,10 +189,6 @@ class Controller:
         for callback in self.switch_mode_callbacks:
             callback(mode)
 
-    def check_for_mode_change(self, event):
-        """Process and event and call the switch mode callback if appropriate"""
-        pass
-
     def register_relay_callback(self, relay: Relay, callback):
         self.toggle_relay_callbacks.append((relay, callback))
 
@@ -165,269 +197,27 @@ class Controller:
             if r == relay:
                 callback()
 
-    def check_for_relay_toggle(self, event):
-        """Process an event and call the toggle relay callbacks if appropriate"""
-        pass
-
-
-class SteamController(Controller):
-    def __init__(self, get_big_video_index):
-        super().__init__(get_big_video_index)
-        self.JOY_RANGE = (-32767, 32768)
-        self.TRIG_RANGE = (0, 256)
-
-    class JoystickAxis(Controller.JoystickAxis):
-        ThumbstickX = "ABS_X"
-        ThumbstickY = "ABS_Y"
-        LeftPadX = "ABS_HAT0X"
-        LeftPadY = "ABS_HAT0Y"
-        RightPadX = "ABS_RX"
-        RightPadY = "ABS_RY"
-
-    class Trigger(Controller.Trigger):
-        LeftTrigger = "ABS_HAT2Y"
-        RightTrigger = "ABS_HAT2X"
-
-    class Button(Controller.Button):
-        LeftTrigger = "BTN_TL2"
-        RightTrigger = "BTN_TR2"
-        LeftBumper = "BTN_TL"
-        RightBumper = "BTN_TR"
-        A = "BTN_SOUTH"
-        X = "BTN_NORTH"
-        Y = "BTN_WEST"
-        B = "BTN_EAST"
-        Back = "BTN_SELECT"
-        Start = "BTN_START"
-        LeftPadTouch = "BTN_THUMB"
-        RightPadTouch = "BTN_THUMB2"
-        RightPadClick = "BTN_THUMBR"
-        RightPad = "BTN_THUMB2-"
-        DPadLeft = "BTN_DPAD_LEFT"
-        DPadRight = "BTN_DPAD_RIGHT"
-        DPadUp = "BTN_DPAD_UP"
-        DPadDown = "BTN_DPAD_DOWN"
-        LeftGrip = "BTN_GEAR_DOWN"
-        RightGrip = "BTN_GEAR_UP"
-
-    def get_vehicle_inputs(self):
-        roll_mode = self.get(SteamController.Button.LeftGrip)
-
-        return {
-            InputChannel.FORWARD: -self.get(
-                SteamController.JoystickAxis.ThumbstickY) * TRANSLATION_SENSITIVITY,
-            InputChannel.LATERAL: self.get(SteamController.JoystickAxis.ThumbstickX) * TRANSLATION_SENSITIVITY,
-            InputChannel.THROTTLE: (self.get(SteamController.Trigger.RightTrigger) -
-                                    self.get(SteamController.Trigger.LeftTrigger)) * TRANSLATION_SENSITIVITY,
-            InputChannel.PITCH: self.get(SteamController.JoystickAxis.RightPadY) * ROTATIONAL_SENSITIVITY,
-            InputChannel.YAW: 0 if roll_mode else self.get(
-                SteamController.JoystickAxis.RightPadX) * ROTATIONAL_SENSITIVITY,
-            InputChannel.ROLL: 0 if not roll_mode else self.get(
-                SteamController.JoystickAxis.RightPadX) * ROTATIONAL_SENSITIVITY,
-        }
-
-
-class XboxController(Controller):
-    def __init__(self, get_big_video_index):
-        super().__init__(get_big_video_index)
-        self.JOY_RANGE = (-32767, 32768)
-        self.TRIG_RANGE = (0, 1024)
-
-    class JoystickAxis(Controller.JoystickAxis):
-        LeftStickX = "ABS_X"
-        LeftStickY = "ABS_Y"
-        RightStickX = "ABS_RX"
-        RightStickY = "ABS_RY"
-        DPadX = "ABS_HAT0X"
-        DPadY = "ABS_HAT0Y"
-
-    class Trigger(Controller.Trigger):
-        LeftTrigger = "ABS_Z"
-        RightTrigger = "ABS_RZ"
-
-    class Button(Controller.Button):
-        LeftBumper = "BTN_TL"
-        RightBumper = "BTN_TR"
-        A = "BTN_SOUTH"
-        X = "BTN_NORTH"
-        Y = "BTN_WEST"
-        B = "BTN_EAST"
-        LeftStick = "BTN_THUMBL"
-        RightStick = "BTN_THUMBR"
-        Back = "BTN_SELECT"
-        Start = "BTN_START"
-        Xbox = "BTN_MODE"
-
-    def _handle_event(self, event):
-        # The Xbox Dpad is special because it is an axis with range -1 to 1
-        if event.code in (self.JoystickAxis.DPadX.value, self.JoystickAxis.DPadY.value):
-            self.joystick_axes[self.JoystickAxis(event.code)] = event.state
-            self.check_for_camera_change(event)
-        else:
-            super()._handle_event(event)
-
-    def get_vehicle_inputs(self):
-        roll_mode = self.get(XboxController.Button.A)
-
-        return {
-            InputChannel.FORWARD: -self.get(
-                XboxController.JoystickAxis.LeftStickY) * TRANSLATION_SENSITIVITY,
-            InputChannel.LATERAL: 0 if roll_mode else self.get(
-                XboxController.JoystickAxis.LeftStickX) * TRANSLATION_SENSITIVITY,
-            InputChannel.THROTTLE: (self.get(XboxController.Trigger.RightTrigger) -
-                                    self.get(XboxController.Trigger.LeftTrigger)) * TRANSLATION_SENSITIVITY,
-            InputChannel.PITCH: self.get(XboxController.JoystickAxis.RightStickY) * ROTATIONAL_SENSITIVITY,
-            InputChannel.YAW: self.get(
-                XboxController.JoystickAxis.RightStickX) * ROTATIONAL_SENSITIVITY,
-            InputChannel.ROLL: 0 if not roll_mode else self.get(
-                XboxController.JoystickAxis.LeftStickX) * ROTATIONAL_SENSITIVITY,
-        }
-
-    def check_for_camera_change(self, event):
-        if event.code == self.JoystickAxis.DPadX.value and event.state != 0:
-            self.call_camera_callbacks(CAM_INDICES[Camera.BOTTOM])
-        if event.code == self.JoystickAxis.DPadY.value:
-            if event.state == -1:
-                self.call_camera_callbacks(CAM_INDICES[Camera.FRONT])
-            elif event.state == 1:
-                self.call_camera_callbacks(CAM_INDICES[Camera.DUAL])
-
-    def check_for_relay_toggle(self, event):
-        if not event.state:
-            return
-        if event.code == self.Button.LeftBumper.value:
-            self.call_relay_callbacks(
-                Relay.PVC_BACK if self.get_big_video_index() in BACKWARD_CAM_INDICES else Relay.PVC_FRONT)
-        elif event.code == self.Button.RightBumper.value:
-            self.call_relay_callbacks(
-                Relay.CLAW_BACK if self.get_big_video_index() in BACKWARD_CAM_INDICES else Relay.CLAW_FRONT)
-        elif event.code == self.Button.X.value:
-            self.call_relay_callbacks(Relay.MAGNET)
-        elif event.code == self.Button.Y.value:
-            self.call_relay_callbacks(Relay.LIGHTS_FRONT)
-
-
-class PS5Controller(Controller):
-    def __init__(self, get_big_video_index):
-        super().__init__(get_big_video_index)
-        self.JOY_RANGE = (0, 256)
-        self.TRIG_RANGE = (0, 256)
-
-    class JoystickAxis(Controller.JoystickAxis):
-        LeftStickX = "ABS_X"
-        LeftStickY = "ABS_Y"
-        RightStickX = "ABS_RX"
-        RightStickY = "ABS_RY"
-        DPadX = "ABS_HAT0X"
-        DPadY = "ABS_HAT0Y"
-
-    class Trigger(Controller.Trigger):
-        LeftTrigger = "ABS_Z"
-        RightTrigger = "ABS_RZ"
-
-    class Button(Controller.Button):
-        X = "BTN_SOUTH"
-        Triangle = "BTN_NORTH"
-        Square = "BTN_WEST"
-        Circle = "BTN_EAST"
-        LeftBumper = "BTN_TL"
-        RightBumper = "BTN_TR"
-        LeftStick = "BTN_SELECT"
-        RightStick = "BTN_START"
-        PlayStation = "BTN_MODE"
-        Microphone = "BTN_THUMBR"
-        Touchpad = "BTN_THUMBL"
-        Create = "BTN_TL2"
-        Options = "BTN_TR2"
-
-    def get_vehicle_inputs(self):
-        roll_mode = self.get(self.Button.X)
-
-        return {
-            InputChannel.FORWARD: -self.get(
-                self.JoystickAxis.LeftStickY) * TRANSLATION_SENSITIVITY,
-            InputChannel.LATERAL: 0 if roll_mode else self.get(
-                self.JoystickAxis.LeftStickX) * TRANSLATION_SENSITIVITY,
-            InputChannel.THROTTLE: (self.get(self.Trigger.RightTrigger) -
-                                    self.get(self.Trigger.LeftTrigger)) * TRANSLATION_SENSITIVITY,
-            InputChannel.PITCH: self.get(self.JoystickAxis.RightStickY) * ROTATIONAL_SENSITIVITY,
-            InputChannel.YAW: self.get(
-                self.JoystickAxis.RightStickX) * ROTATIONAL_SENSITIVITY,
-            InputChannel.ROLL: 0 if not roll_mode else self.get(
-                self.JoystickAxis.LeftStickX) * ROTATIONAL_SENSITIVITY,
-        }
-
-    def _handle_event(self, event):
-        # The PS Dpad is special because it is an axis with range -1 to 1
-        if event.code in (self.JoystickAxis.DPadX.value, self.JoystickAxis.DPadY.value):
-            self.joystick_axes[self.JoystickAxis(event.code)] = event.state
-            self.check_for_camera_change(event)
-            self.check_for_mode_change(event)
-        else:
-            super()._handle_event(event)
-
-    def check_for_camera_change(self, event):        
-        if self.get(self.Button.Circle):
-            return
-        
-        if event.code == self.JoystickAxis.DPadX.value and event.state != 0:
-            self.call_camera_callbacks(CAM_INDICES[Camera.BOTTOM])
-        if event.code == self.JoystickAxis.DPadY.value:
-            if event.state == -1:
-                self.call_camera_callbacks(CAM_INDICES[Camera.FRONT])
-            elif event.state == 1:
-                self.call_camera_callbacks(CAM_INDICES[Camera.DUAL])
-
-    def check_for_relay_toggle(self, event):
-        if not event.state:
-            return
-        if event.code == self.Button.LeftBumper.value:
-            self.call_relay_callbacks(
-                Relay.PVC_BACK if self.get_big_video_index() in BACKWARD_CAM_INDICES else Relay.PVC_FRONT)
-        elif event.code == self.Button.RightBumper.value:
-            self.call_relay_callbacks(
-                Relay.CLAW_BACK if self.get_big_video_index() in BACKWARD_CAM_INDICES else Relay.CLAW_FRONT)
-        elif event.code == self.Button.Square.value:
-            self.call_relay_callbacks(Relay.MAGNET)
-        elif event.code == self.Button.Triangle.value:
-            self.call_relay_callbacks(Relay.LIGHTS_FRONT)  # Actually toggles all lights
-
-    def check_for_mode_change(self, event):
-        if not self.get(self.Button.Circle):
-            return
-        
-        if event.code == self.JoystickAxis.DPadX.value and event.state != 0:
-            self.call_mode_callbacks("STABILIZE")
-        if event.code == self.JoystickAxis.DPadY.value:
-            if event.state == -1:
-                self.call_mode_callbacks("MANUAL")
-            elif event.state == 1:
-                self.call_mode_callbacks("ALT_HOLD")
-
-
-def get_active_controller_type():
-    if len(devices.gamepads) == 0:
-        return None
-    for device in devices.gamepads:
-        name = device.name.lower()
-        if "sony" in name:
-            return PS5Controller
-        if "xbox" in name or "x-box" in name or "microsoft" in name:
-            return XboxController
-        if "steam" in name:
-            return SteamController
+
+def get_active_profile() -> t.Optional[ControllerProfile]:
+    """The profile of the first connected gamepad that has one"""
+    profiles = load_profiles()
+    for device in find_gamepads():
+        for profile in profiles:
+            if profile.matches(device.name):
+                return profile
+    return None
 
 
-def get_active_controller(get_big_video_index):
-    controller_class = get_active_controller_type()
+def get_active_controller(get_big_video_index) -> t.Optional[Controller]:
+    profile = get_active_profile()
 
-    if controller_class is None:
+    if profile is None:
         return None
-    return controller_class(get_big_video_index)
+    return Controller(profile, get_big_video_index)
 
 
 if __name__ == '__main__':
-    for device in devices.gamepads:
+    for device in find_gamepads():
         print(device)
 
     controller = get_active_controller(lambda: 0)
@@ -0,0 +1,453 @@
+import ctypes
+import dataclasses
+import errno
+import fcntl
+import os
+import selectors
+import struct
+import threading
+import time
+import typing as t
+from glob import glob
+
+import numpy as np
+from inputs import EVENT_MAP
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+INPUT_DIR = "/dev/input"
+
+# struct input_event from linux/input.h: timeval, type, code, value
+EVENT_FORMAT = "llHHi"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+READ_SIZE = EVENT_SIZE * 64
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0x00
+SYN_DROPPED = 0x03
+
+KEY_MAX = 0x2ff
+ABS_MAX = 0x3f
+BTN_GAMEPAD = 0x130  # Every gamepad reports this button (BTN_SOUTH)
+
+# Code names the controller enums are written in, taken from the inputs library so they match what it reported
+CODE_NAMES = {
+    EV_KEY: dict(dict(EVENT_MAP)["Key"]),
+    EV_ABS: dict(dict(EVENT_MAP)["Absolute"]),
+}
+CODES = {name: (ev_type, code) for ev_type, names in CODE_NAMES.items() for code, name in names.items()}
+
+# Event timestamps are taken from this clock, so they can be compared with time.monotonic()
+CLOCK_MONOTONIC = 1
+
+# inotify, which isn't wrapped by the standard library
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT_FORMAT = "iIII"  # wd, mask, cookie, len, followed by len bytes of name
+INOTIFY_EVENT_SIZE = struct.calcsize(INOTIFY_EVENT_FORMAT)
+
+
+def _ioc_read(nr: int, size: int) -> int:
+    """The _IOR('E', nr, size) request number of an evdev ioctl"""
+    return (2 << 30) | (size << 16) | (ord('E') << 8) | nr
+
+
+def EVIOCGNAME(length: int) -> int:
+    return _ioc_read(0x06, length)
+
+
+def EVIOCGKEY(length: int) -> int:
+    return _ioc_read(0x18, length)
+
+
+def EVIOCGBIT(ev_type: int, length: int) -> int:
+    return _ioc_read(0x20 + ev_type, length)
+
+
+def EVIOCGABS(code: int) -> int:
+    return _ioc_read(0x40 + code, struct.calcsize("6i"))
+
+
+def EVIOCSCLOCKID() -> int:
+    """_IOW('E', 0xa0, int)"""
+    return (1 << 30) | (struct.calcsize("i") << 16) | (ord('E') << 8) | 0xa0
+
+
+def _has_bit(bits: bytes, bit: int) -> bool:
+    return bit // 8 < len(bits) and bool(bits[bit // 8] & (1 << (bit % 8)))
+
+
+def code_name(ev_type: int, code: int) -> str:
+    name = CODE_NAMES[ev_type].get(code)
+    if name is None:
+        return f"{'BTN' if ev_type == EV_KEY else 'ABS'}_{code:#x}"
+    return name
+
+
+def encode_events(states: t.Dict[str, int], timestamp: t.Optional[float] = None) -> bytes:
+    """
+    One frame of raw input_events setting each named code (e.g. "ABS_X") to a raw state, for GamepadReader.feed.
+    The timestamp defaults to now on the monotonic clock, like a real device's
+    """
+    if timestamp is None:
+        timestamp = time.monotonic()
+    sec, usec = int(timestamp), int(timestamp % 1 * 1e6)
+    events = [struct.pack(EVENT_FORMAT, sec, usec, *CODES[name], state) for name, state in states.items()]
+    events.append(struct.pack(EVENT_FORMAT, sec, usec, EV_SYN, SYN_REPORT, 0))
+    return b"".join(events)
+
+
+@dataclasses.dataclass
+class GamepadEvent:
+    code: str  # e.g. "ABS_X" or "BTN_SOUTH", like the inputs library
+    state: int
+    timestamp: float  # time.monotonic() seconds the kernel received the event
+
+
+@dataclasses.dataclass
+class GamepadDevice:
+    path: str
+    name: str
+
+
+def _read_device_name(fd: int) -> str:
+    buffer = bytearray(256)
+    length = fcntl.ioctl(fd, EVIOCGNAME(len(buffer)), buffer)
+    return bytes(buffer[:max(length - 1, 0)]).decode(errors="replace")
+
+
+def _is_gamepad(fd: int) -> bool:
+    keys = bytearray(KEY_MAX // 8 + 1)
+    fcntl.ioctl(fd, EVIOCGBIT(EV_KEY, len(keys)), keys)
+    return _has_bit(keys, BTN_GAMEPAD)
+
+
+def find_gamepads() -> t.List[GamepadDevice]:
+    """Every readable gamepad in INPUT_DIR"""
+    gamepads = []
+    for device_path in sorted(glob(os.path.join(INPUT_DIR, "event*"))):
+        try:
+            fd = os.open(device_path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            if _is_gamepad(fd):
+                gamepads.append(GamepadDevice(device_path, _read_device_name(fd)))
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return gamepads
+
+
+class InputState:
+    """
+    The value of every control of a gamepad in an array, and the time of the event that set it. The reader thread
+    stages changes with set and publishes them all at once with commit at the end of each kernel event frame
+    (SYN_REPORT), and readers take a consistent snapshot, so they never see half of a frame, e.g. a stick's X without
+    its Y.
+
+    commit publishes new copies of the staged arrays rather than writing into the published ones, so taking a
+    snapshot is a single attribute read with no lock or copy. Snapshots must not be modified.
+    """
+
+    def __init__(self, controls: t.Iterable):
+        self.index = {control: i for i, control in enumerate(controls)}
+        self._staged = np.zeros(len(self.index))
+        self._staged_times = np.zeros(len(self.index))
+        self._frame = (self._staged.copy(), self._staged_times.copy())
+        self.frames = 0  # Frames committed
+
+    def set(self, control, value: float, timestamp: float = 0.0):
+        i = self.index[control]
+        self._staged[i] = value
+        self._staged_times[i] = timestamp
+
+    def staged(self, control) -> float:
+        return float(self._staged[self.index[control]])
+
+    def commit(self):
+        self._frame = (self._staged.copy(), self._staged_times.copy())
+        self.frames += 1
+
+    def reset(self):
+        self._staged[:] = 0
+        self.commit()
+
+    def snapshot(self) -> np.ndarray:
+        return self._frame[0]
+
+    def snapshot_with_times(self) -> t.Tuple[np.ndarray, np.ndarray]:
+        """The values and the time.monotonic() of the event behind each, from the same frame"""
+        return self._frame
+
+    def get(self, control, snapshot: t.Optional[np.ndarray] = None) -> float:
+        return float((self._frame[0] if snapshot is None else snapshot)[self.index[control]])
+
+
+class _Inotify:
+    """Just enough of inotify to notice new input devices and changed files"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, directory: str, mask: int) -> int:
+        """Watch a directory, returning the watch descriptor its events will carry"""
+        wd = self._libc.inotify_add_watch(self.fd, directory.encode(), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Couldn't watch {directory}")
+        return wd
+
+    def read_events(self) -> t.List[t.Tuple[int, str]]:
+        """The (watch descriptor, file name) of every pending event"""
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + INOTIFY_EVENT_SIZE <= len(data):
+            wd, _, _, length = struct.unpack_from(INOTIFY_EVENT_FORMAT, data, offset)
+            offset += INOTIFY_EVENT_SIZE
+            events.append((wd, data[offset:offset + length].rstrip(b"\0").decode()))
+            offset += length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class GamepadReader(threading.Thread):
+    """
+    Reads raw Linux input events from a gamepad in /dev/input without polling. The device, an inotify watch on
+    /dev/input and a wakeup pipe share one selector, so the thread sleeps until there's input, a device appears, or
+    stop is called, and a replugged gamepad is picked up as soon as udev has set its permissions.
+
+    Events are decoded into GamepadEvents and passed to event_callback, then frame_callback is called at each
+    SYN_REPORT. If the kernel's buffer overflows (SYN_DROPPED), the rest of the frame is discarded and the current
+    state is read back from the device, and only the controls that changed are reported. The state read when a
+    gamepad connects goes to resync_callback instead if there is one, since buttons already held then aren't new
+    presses. feed runs the same decoding on bytes read from elsewhere, so a stream recorded with e.g.
+    `cat /dev/input/eventN > recording` can be replayed.
+
+    Files registered with watch_file share the same inotify instance, and their callbacks run on this thread between
+    event frames, so they can change how events are handled without any locking.
+    """
+
+    def __init__(self, event_callback: t.Callable[[GamepadEvent], None], frame_callback: t.Callable[[], None],
+                 connection_callback: t.Callable[[bool], None] = lambda connected: None,
+                 match: t.Callable[[GamepadDevice], bool] = lambda device: True,
+                 resync_callback: t.Optional[t.Callable[[GamepadEvent], None]] = None):
+        super().__init__(daemon=True, name="gamepad-reader")
+        self.event_callback = event_callback
+        self.resync_callback = event_callback if resync_callback is None else resync_callback
+        self.frame_callback = frame_callback
+        self.connection_callback = connection_callback
+        self.match = match
+
+        self.device: t.Optional[GamepadDevice] = None
+        self._fd: t.Optional[int] = None
+        self._buffer = b""
+        self._dropped = False
+        self._last_values: t.Dict[t.Tuple[int, int], int] = {}  # (type, code) -> raw value, to resync after drops
+        self._clock_offset = 0.0  # Added to event timestamps to put them on the monotonic clock
+        self._file_watches: t.Dict[str, t.Dict[str, t.Callable[[], None]]] = {}  # Directory -> file name -> callback
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._running = True
+
+    def watch_file(self, file_path: str, callback: t.Callable[[], None]):
+        """
+        Call callback on the reader thread whenever file_path is written or replaced. Must be called before start.
+        The directory is watched rather than the file, so editors that save by renaming a new file over it are seen
+        """
+        directory, name = os.path.split(os.path.abspath(file_path))
+        self._file_watches.setdefault(directory, {})[name] = callback
+
+    def current_events(self) -> t.List[GamepadEvent]:
+        """The last raw state of every key and axis seen, e.g. to fill in a new InputState. Reader thread only"""
+        return [GamepadEvent(code_name(ev_type, code), value, 0.0)
+                for (ev_type, code), value in self._last_values.items()]
+
+    def stop(self):
+        self._running = False
+        os.write(self._wakeup_write, b"\0")
+        self.join()
+
+    def run(self):
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, "wakeup")
+        inotify = None
+        hotplug_wd = None
+        file_callbacks: t.Dict[int, t.Dict[str, t.Callable[[], None]]] = {}  # Watch descriptor -> file name -> callback
+        try:
+            inotify = _Inotify()
+            self._selector.register(inotify.fd, selectors.EVENT_READ, "inotify")
+        except OSError as e:
+            logger.warning(f"Can't use inotify, new gamepads and changed files won't be noticed: {e}")
+        if inotify is not None:
+            try:
+                hotplug_wd = inotify.add_watch(INPUT_DIR, IN_CREATE | IN_ATTRIB)
+            except OSError as e:
+                logger.warning(f"Can't watch {INPUT_DIR} for new gamepads, they won't be noticed until restart: {e}")
+            for directory, callbacks in self._file_watches.items():
+                try:
+                    file_callbacks[inotify.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO)] = callbacks
+                except OSError as e:
+                    logger.warning(f"Can't watch {directory} for changes: {e}")
+
+        self._open_first_gamepad()
+        try:
+            while self._running:
+                for key, _ in self._selector.select():
+                    if key.data == "device":
+                        self._read_device()
+                    elif key.data == "inotify":
+                        self._handle_inotify(inotify.read_events(), hotplug_wd, file_callbacks)
+        finally:
+            self._close_device()
+            if inotify is not None:
+                inotify.close()
+            self._selector.close()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+
+    def _handle_inotify(self, events: t.List[t.Tuple[int, str]], hotplug_wd: t.Optional[int],
+                        file_callbacks: t.Dict[int, t.Dict[str, t.Callable[[], None]]]):
+        # Devices appear before udev has made them readable, so also retry on attribute changes
+        if self._fd is None and any(wd == hotplug_wd and name.startswith("event") for wd, name in events):
+            self._open_first_gamepad()
+
+        # A save can be several events, e.g. a write then a rename, but one call is enough
+        changed = []
+        for wd, name in events:
+            callback = file_callbacks.get(wd, {}).get(name)
+            if callback is not None and callback not in changed:
+                changed.append(callback)
+        for callback in changed:
+            callback()
+
+    def _open_first_gamepad(self):
+        for device in find_gamepads():
+            if not self.match(device):
+                continue
+            try:
+                self._fd = os.open(device.path, os.O_RDONLY | os.O_NONBLOCK)
+            except OSError as e:
+                logger.debug(f"Couldn't open {device.path}: {e}")
+                continue
+            self.device = device
+            try:
+                fcntl.ioctl(self._fd, EVIOCSCLOCKID(), struct.pack("i", CLOCK_MONOTONIC))
+                self._clock_offset = 0.0
+            except OSError:
+                # Stuck with wall clock timestamps, which are only as comparable as the clocks are steady
+                self._clock_offset = time.monotonic() - time.time()
+            self._selector.register(self._fd, selectors.EVENT_READ, "device")
+            logger.info(f"Gamepad connected: {device.name} at {device.path}")
+            self._resync(callback=self.resync_callback)
+            self.connection_callback(True)
+            return
+
+    def _close_device(self):
+        if self._fd is None:
+            return
+        self._selector.unregister(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._buffer = b""
+        self._dropped = False
+        self._last_values.clear()
+
+    def _read_device(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            if e.errno != errno.ENODEV:
+                logger.warning(f"Error reading gamepad: {e}")
+            data = b""
+
+        if not data:
+            logger.info(f"Gamepad disconnected: {self.device.name}")
+            self._close_device()
+            self.device = None
+            self.connection_callback(False)
+            return
+        self.feed(data)
+
+    def feed(self, data: bytes):
+        """
+        Decode raw input_event structs, which may be split anywhere across calls. Also used to inject recorded or
+        synthetic events (see encode_events) into a reader that isn't running, e.g. for benchmarks
+        """
+        data = self._buffer + data
+        usable = len(data) - len(data) % EVENT_SIZE
+        self._buffer = data[usable:]
+
+        for sec, usec, ev_type, code, value in struct.iter_unpack(EVENT_FORMAT, data[:usable]):
+            if ev_type == EV_SYN:
+                if code == SYN_DROPPED:
+                    self._dropped = True
+                elif code == SYN_REPORT:
+                    if self._dropped:
+                        self._dropped = False
+                        self._resync(sec + usec / 1e6 + self._clock_offset)
+                    self.frame_callback()
+            elif ev_type in CODE_NAMES and not self._dropped:
+                self._emit(ev_type, code, value, sec + usec / 1e6 + self._clock_offset)
+
+    def _emit(self, ev_type: int, code: int, value: int, timestamp: float,
+              callback: t.Optional[t.Callable[[GamepadEvent], None]] = None):
+        self._last_values[(ev_type, code)] = value
+        if callback is None:
+            callback = self.event_callback
+        callback(GamepadEvent(code_name(ev_type, code), value, timestamp))
+
+    def _resync(self, timestamp: t.Optional[float] = None,
+                callback: t.Optional[t.Callable[[GamepadEvent], None]] = None):
+        """
+        Read every key and axis of the device and report the ones that differ from the last known values, to callback
+        if given or event_callback otherwise
+        """
+        if self._fd is None:
+            return
+        try:
+            supported_keys = bytearray(KEY_MAX // 8 + 1)
+            fcntl.ioctl(self._fd, EVIOCGBIT(EV_KEY, len(supported_keys)), supported_keys)
+            pressed = bytearray(KEY_MAX // 8 + 1)
+            fcntl.ioctl(self._fd, EVIOCGKEY(len(pressed)), pressed)
+            supported_axes = bytearray(ABS_MAX // 8 + 1)
+            fcntl.ioctl(self._fd, EVIOCGBIT(EV_ABS, len(supported_axes)), supported_axes)
+
+            values = {}
+            for code in range(KEY_MAX + 1):
+                if _has_bit(supported_keys, code):
+                    values[(EV_KEY, code)] = int(_has_bit(pressed, code))
+            for code in range(ABS_MAX + 1):
+                if _has_bit(supported_axes, code):
+                    absinfo = bytearray(struct.calcsize("6i"))
+                    fcntl.ioctl(self._fd, EVIOCGABS(code), absinfo)
+                    values[(EV_ABS, code)] = struct.unpack("6i", absinfo)[0]
+        except OSError as e:
+            logger.warning(f"Couldn't read gamepad state: {e}")
+            return
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+        for (ev_type, code), value in values.items():
+            if self._last_values.get((ev_type, code), 0) != value:
+                self._emit(ev_type, code, value, timestamp, callback)
+        self.frame_callback()
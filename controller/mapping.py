@@ -0,0 +1,114 @@
+import dataclasses
+import typing as t
+
+import numpy as np
+
+from logger import root_logger
+from vehicle.constants import InputChannel
+
+logger = root_logger.getChild(__name__)
+
+# The channels a mapping drives, in the order of the vectors it returns
+VEHICLE_CHANNELS = (
+    InputChannel.FORWARD,
+    InputChannel.LATERAL,
+    InputChannel.THROTTLE,
+    InputChannel.PITCH,
+    InputChannel.YAW,
+    InputChannel.ROLL,
+)
+CHANNEL_INDICES = {channel: i for i, channel in enumerate(VEHICLE_CHANNELS)}
+
+# Entries in each response table, spread evenly over inputs from -1 to 1. Looking up the nearest entry instead of
+# computing the curve is off by under 0.001 with the default curves, less than half a microsecond of PWM
+LUT_SIZE = 4097
+
+
+@dataclasses.dataclass(frozen=True)
+class AxisMapping:
+    """One control's contribution to a channel. Contributions to the same channel are added"""
+    channel: InputChannel
+    control: t.Any  # Name of a joystick, hat or trigger in the controller's profile
+    sensitivity: float = 1.0  # Negative to invert
+    modifier: t.Any = None  # Name of a button gating this mapping
+    modifier_held: bool = True  # Whether the mapping applies while the modifier is held or released
+
+
+def build_response_lut(exponential: float, deadzone: float = 0.0, sensitivity: float = 1.0,
+                       size: int = LUT_SIZE) -> np.ndarray:
+    """
+    The response to inputs from -1 to 1: zero inside the deadzone, then the rest of the range rescaled to [0, 1],
+    raised to exponential with the sign kept, and multiplied by sensitivity
+    """
+    x = np.linspace(-1, 1, size)
+    magnitude = np.clip((np.abs(x) - deadzone) / (1 - deadzone), 0, 1)
+    return np.copysign(magnitude ** exponential, x) * sensitivity
+
+
+class InputMapping:
+    """
+    Maps a whole InputState snapshot to the vector of VEHICLE_CHANNELS inputs in one pass. Every AxisMapping gets
+    its own response table with the curve, deadzone and sensitivity baked in, so a tick is a gather, a table lookup,
+    and a sum per channel, with no Python per axis.
+    """
+
+    def __init__(self, mappings: t.Sequence[AxisMapping], index: t.Dict[t.Any, int],
+                 curve: t.Callable[[AxisMapping], t.Tuple[float, float]]):
+        """
+        index gives each control's position in the snapshots, and curve gives the (exponential, deadzone) of the
+        control of a mapping
+        """
+        self.mappings = tuple(mappings)
+        self.channels = np.array([CHANNEL_INDICES[m.channel] for m in self.mappings], dtype=np.intp)
+
+        # The tables laid end to end with a row of zeros after them, so one take looks every mapping up
+        rows = [build_response_lut(*curve(m), sensitivity=m.sensitivity) for m in self.mappings]
+        self.luts = np.concatenate(rows + [np.zeros(LUT_SIZE)])
+        zero_row = len(rows) * LUT_SIZE
+
+        # A mapping's table position is a linear function of the snapshot: its input times half the table width,
+        # plus the start of its row (or the zero row while its modifier says it's inactive), plus half the table
+        # width and 0.5 so truncating rounds to the nearest entry. Stacked up, every position is one matrix product
+        scale = (LUT_SIZE - 1) / 2
+        self.positions = np.zeros((len(self.mappings), len(index)))
+        self.offsets = np.full(len(self.mappings), scale + 0.5)
+        for i, m in enumerate(self.mappings):
+            self.positions[i, index[m.control]] = scale
+            row = i * LUT_SIZE
+            if m.modifier is None:
+                self.offsets[i] += row
+            elif m.modifier_held:
+                self.offsets[i] += zero_row
+                self.positions[i, index[m.modifier]] = row - zero_row
+            else:
+                self.offsets[i] += row
+                self.positions[i, index[m.modifier]] = zero_row - row
+
+        # Which controls, axes and modifiers, each channel depends on
+        self.dependencies = np.zeros((len(VEHICLE_CHANNELS), len(index)), dtype=bool)
+        for m in self.mappings:
+            self.dependencies[CHANNEL_INDICES[m.channel], index[m.control]] = True
+            if m.modifier is not None:
+                self.dependencies[CHANNEL_INDICES[m.channel], index[m.modifier]] = True
+
+    def __call__(self, snapshot: np.ndarray) -> np.ndarray:
+        """
+        Channel inputs in VEHICLE_CHANNELS order, each clipped to [-1, 1]. Axes in the snapshot must be in [-1, 1]
+        and buttons 0 or 1
+        """
+        positions = self.positions @ snapshot
+        positions += self.offsets
+        responses = self.luts.take(positions.astype(np.intp), mode='clip')
+        inputs = np.bincount(self.channels, responses, minlength=len(VEHICLE_CHANNELS))
+        # Ufuncs with out instead of np.clip, which costs more than all of the above on arrays this small
+        np.minimum(inputs, 1, out=inputs)
+        np.maximum(inputs, -1, out=inputs)
+        return inputs
+
+    def event_times(self, timestamps: t.Union[np.ndarray, float]) -> np.ndarray:
+        """The newest of the event timestamps of the controls each channel depends on, in VEHICLE_CHANNELS order"""
+        return np.max(self.dependencies * timestamps, axis=1, initial=0.0)
+
+
+def to_channel_dict(inputs: np.ndarray) -> t.Dict[InputChannel, float]:
+    return dict(zip(VEHICLE_CHANNELS, inputs.tolist()))
@@ -0,0 +1,186 @@
+import dataclasses
+import json
+import typing as t
+from glob import glob
+from os import path
+
+from controller.gamepad import CODES
+from controller.mapping import AxisMapping
+from logger import root_logger
+from vehicle.constants import Camera, InputChannel, Relay
+
+logger = root_logger.getChild(__name__)
+
+PROFILES_PATH = path.join(path.dirname(path.dirname(__file__)), 'config', 'controllers')
+
+# Kinds of control. Joysticks and triggers are normalized to [-1, 1] and [0, 1] from their raw range, hats already
+# report -1, 0 or 1, and buttons are 0 or 1
+JOYSTICK = "joystick"
+HAT = "hat"
+TRIGGER = "trigger"
+BUTTON = "button"
+CONTROL_KINDS = (JOYSTICK, HAT, TRIGGER, BUTTON)
+
+# Binding "state" matching any non-zero raw state, e.g. either direction of a hat
+NONZERO = "nonzero"
+
+
+@dataclasses.dataclass(frozen=True)
+class Binding:
+    """An action run when a control reports a raw state, e.g. a button press toggling a relay"""
+    control: str
+    state: t.Optional[int]  # Raw state to match, None for any non-zero state
+    camera: t.Optional[Camera] = None
+    relay: t.Optional[Relay] = None
+    backward_relay: t.Optional[Relay] = None  # Toggled instead of relay while a backward camera is the big video
+    mode: t.Optional[str] = None
+    while_held: t.Optional[str] = None  # Button that must be held for the binding to apply
+    unless_held: t.Optional[str] = None  # Button that must not be held
+
+
+@dataclasses.dataclass(frozen=True)
+class ControllerProfile:
+    name: str
+    path: str
+    device_names: t.Tuple[str, ...]  # Lowercase substrings of the device names this profile is for
+    icons: t.Dict[str, str]  # Action name -> image of the button bound to it
+    ranges: t.Dict[str, t.Tuple[float, float]]  # JOYSTICK and TRIGGER raw ranges
+    curves: t.Dict[str, t.Tuple[float, float]]  # JOYSTICK and TRIGGER (exponential, deadzone)
+    controls: t.Dict[str, t.Tuple[str, str]]  # Control name -> (kind, event code), in InputState order
+    mapping: t.Tuple[AxisMapping, ...]
+    bindings: t.Tuple[Binding, ...]
+
+    def matches(self, device_name: str) -> bool:
+        name = device_name.lower()
+        return any(pattern in name for pattern in self.device_names)
+
+    def kind(self, control: str) -> str:
+        return self.controls[control][0]
+
+    def curve(self, control: str) -> t.Tuple[float, float]:
+        """The (exponential, deadzone) of a control. Hats use the joystick curve, which doesn't change -1, 0 or 1"""
+        return self.curves[TRIGGER if self.kind(control) == TRIGGER else JOYSTICK]
+
+
+@dataclasses.dataclass(frozen=True)
+class CodeHandler:
+    """What to do with an event of one code, see compile_dispatch"""
+    control: str
+    kind: str
+    scale: float  # Normalized value = raw * scale + offset, clamped to [low, high]
+    offset: float
+    low: float
+    high: float
+    bindings: t.Tuple[Binding, ...]
+
+
+def _lookup(enum, name: str, what: str):
+    try:
+        return enum[name]
+    except KeyError:
+        raise ValueError(f"Unknown {what} {name!r}, expected one of {', '.join(member.name for member in enum)}")
+
+
+def _parse_binding(data: dict, controls: t.Dict[str, t.Tuple[str, str]]) -> Binding:
+    for key in ("control", "while_held", "unless_held"):
+        if key in data and data[key] not in controls:
+            raise ValueError(f"Binding {data} refers to unknown control {data[key]!r}")
+    if sum(key in data for key in ("camera", "relay", "mode")) != 1:
+        raise ValueError(f"Binding {data} needs exactly one of camera, relay or mode")
+
+    state = data.get("state", NONZERO)
+    return Binding(
+        control=data["control"],
+        state=None if state == NONZERO else int(state),
+        camera=_lookup(Camera, data["camera"], "camera") if "camera" in data else None,
+        relay=_lookup(Relay, data["relay"], "relay") if "relay" in data else None,
+        backward_relay=_lookup(Relay, data["backward_relay"], "relay") if "backward_relay" in data else None,
+        mode=data.get("mode"),
+        while_held=data.get("while_held"),
+        unless_held=data.get("unless_held"),
+    )
+
+
+def load_profile(profile_path: str) -> ControllerProfile:
+    """Read and check a profile, raising ValueError (or OSError) if it can't be used"""
+    with open(profile_path, 'r') as file:
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{profile_path} is not valid JSON: {e}")
+
+    try:
+        controls = {}
+        codes = set()
+        for kind in CONTROL_KINDS:
+            for control, code in data.get(kind + "s", {}).items():
+                if control in controls or code in codes:
+                    raise ValueError(f"Control {control!r} or code {code!r} is defined twice")
+                controls[control] = (kind, code)
+                codes.add(code)
+
+        unknown = [code for _, code in controls.values() if code not in CODES]
+        if unknown:
+            logger.warning(f"{profile_path} has codes no gamepad reports, they'll be ignored: {', '.join(unknown)}")
+
+        mapping = []
+        for entry in data.get("mapping", []):
+            control, modifier = entry["control"], entry.get("modifier")
+            if controls.get(control, (None,))[0] not in (JOYSTICK, HAT, TRIGGER):
+                raise ValueError(f"Mapping {entry} needs a joystick, hat or trigger control")
+            if modifier is not None and controls.get(modifier, (None,))[0] != BUTTON:
+                raise ValueError(f"Mapping {entry} needs a button modifier")
+            mapping.append(AxisMapping(_lookup(InputChannel, entry["channel"], "channel"), control,
+                                       float(entry.get("sensitivity", 1.0)), modifier,
+                                       bool(entry.get("modifier_held", True))))
+
+        ranges = {kind: tuple(data[kind + "_range"]) for kind in (JOYSTICK, TRIGGER)}
+        curves = {kind: (float(data.get(kind + "_curve", {}).get("exponential", 2)),
+                         float(data.get(kind + "_curve", {}).get("deadzone", 0.0))) for kind in (JOYSTICK, TRIGGER)}
+        return ControllerProfile(
+            name=data["name"],
+            path=profile_path,
+            device_names=tuple(name.lower() for name in data["device_names"]),
+            icons=dict(data.get("icons", {})),
+            ranges=ranges,
+            curves=curves,
+            controls=controls,
+            mapping=tuple(mapping),
+            bindings=tuple(_parse_binding(binding, controls) for binding in data.get("bindings", [])),
+        )
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{profile_path} is missing or has a malformed field: {e!r}")
+
+
+def load_profiles(profiles_path: str = PROFILES_PATH) -> t.List[ControllerProfile]:
+    """Every usable profile in profiles_path. Broken ones are logged and skipped"""
+    profiles = []
+    for profile_path in sorted(glob(path.join(profiles_path, '*.json'))):
+        try:
+            profiles.append(load_profile(profile_path))
+        except (OSError, ValueError) as e:
+            logger.error(f"Couldn't load controller profile: {e}")
+    return profiles
+
+
+def compile_dispatch(profile: ControllerProfile) -> t.Dict[str, CodeHandler]:
+    """
+    A table from event code to how to normalize its state and which bindings it triggers, so handling an event is one
+    dict lookup however many controls and bindings the profile has
+    """
+    bindings: t.Dict[str, t.List[Binding]] = {control: [] for control in profile.controls}
+    for binding in profile.bindings:
+        bindings[binding.control].append(binding)
+
+    dispatch = {}
+    for control, (kind, code) in profile.controls.items():
+        low, high = (0.0 if kind in (TRIGGER, BUTTON) else -1.0), 1.0
+
+        if kind in profile.ranges:
+            raw_low, raw_high = profile.ranges[kind]
+            scale = (high - low) / (raw_high - raw_low)
+            offset = low - raw_low * scale
+        else:
+            scale, offset = 1.0, 0.0
+        dispatch[code] = CodeHandler(control, kind, scale, offset, low, high, tuple(bindings[control]))
+    return dispatch
@@ -1,32 +1,41 @@
 import datetime
 import json
 import logging
+import time
 from collections import defaultdict
 import cv2
 
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTabWidget
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QTimer
 
 from gui.data_classes import Frame
 from gui.video_thread import VideoThread
 from gui.widgets.map_wreck_widget import MapWreckWidget
 from gui.widgets.tabs import MainTab, DebugTab, ImageDebugTab, VideoTab
+from gui.widgets.telemetry_plot_widget import NUM_THRUSTERS, NEUTRAL_PWM
 from gui.widgets.transect_widget import TransectWidget
+from gui.widgets.vehicle_status_widget import METERS_TO_FEET
 from gui.widgets.map_wreck_widget import MapWreckWidget
 
 from logger import root_logger
+from recording.recorder import SessionRecorder
 from tasks.button_docking import ButtonDocking
 from tasks.no_button_docking import NoButtonDocking
 from vehicle.processes import LightsManager, CameraManager
+from vehicle.telemetry_store import new_telemetry_path
+from vehicle.constants import InputChannel
 from vehicle.vehicle_control import VehicleControl, Relay
 from tasks.scheduler import TaskScheduler
 from tasks.keyboard_control import KeyboardControl
 from tasks.controller_drive import ControllerDrive
-from controller.controller import get_active_controller, get_active_controller_type
+from controller.controller import Controller, get_active_profile
 
 # The name of the logger will be included in debug messages, so set it to the name of the file to make the log traceable
 logger = root_logger.getChild(__name__)
 
+# How often the gui takes the newest frames from the video thread's mailbox
+DISPLAY_FPS = 60
+
 
 class GuiLogHandler(logging.Handler):
     def __init__(self, update_signal):
@@ -61,15 +70,19 @@ class App(QWidget):
             json_data = json.load(file)
         self.video_thread = VideoThread(json_data)
 
+        # Draw the big video with OpenGL instead of a QLabel if the camera config asks for it
+        self.use_opengl_video = json_data.get("opengl_video", False)
+
         # Dictionary to keep track of which keys are pressed. If a key is not in the dict, assume it is not pressed.
         self.keysDown = defaultdict(lambda: False)
 
         # Create VehicleControl object to handle the connection to the ROV
-        self.vehicle = VehicleControl(port=14550)
+        self.vehicle = VehicleControl(port=14550, host=args.rov_host, telemetry_path=new_telemetry_path())
 
         # Create a tab widget
         self.tabs = QTabWidget()
-        self.main_tab = MainTab(self, len(self.video_thread._video_sources), get_active_controller_type())
+        controller_profile = get_active_profile()
+        self.main_tab = MainTab(self, len(self.video_thread._video_sources), controller_profile)
         self.debug_tab = DebugTab(self, len(self.video_thread._video_sources))
         self.image_tab = ImageDebugTab()
 
@@ -89,8 +102,9 @@ class App(QWidget):
         self.camera_manager = CameraManager(self.vehicle)
 
         # Create an instance of controller
-        self.controller = get_active_controller(self.main_tab.widgets.video_area.get_big_video_cam_index)
-        if self.controller is not None:
+        self.controller = None
+        if controller_profile is not None:
+            self.controller = Controller(controller_profile, self.main_tab.widgets.video_area.get_big_video_cam_index)
             self.controller.start_monitoring()
 
         # Setup the task scheduling thread
@@ -107,6 +121,9 @@ class App(QWidget):
         # Create the vision tasks
         self.map_wreck_task = MapWreckWidget()
 
+        # Records frames, vehicle state and commands for replaying tasks offline
+        self.recorder = SessionRecorder()
+
         # Setup GUI logging
         gui_formatter = logging.Formatter("[{levelname}] {message}", style="{")
 
@@ -123,6 +140,11 @@ class App(QWidget):
         # Connect the disparate parts of the gui which need to communicate
         self.connect_signals()
 
+        # Show the newest frames on a timer so a busy gui thread drops frames instead of falling behind
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.display_frames)
+        self.display_timer.start(1000 // DISPLAY_FPS)
+
         # Start the independent threads
         self.video_thread.start()
         self.task_scheduler.start()
@@ -134,9 +156,9 @@ class App(QWidget):
         self.main_log_signal.connect(self.main_tab.update_console)
         self.debug_log_signal.connect(self.debug_tab.update_console)
 
-        # Connect the video thread signal to the update_image function
-        self.video_thread.update_frames_signal.connect(self.update_image)
-        self.video_thread.update_frames_signal.connect(self.task_scheduler.on_frame)
+        # Hand frames to the task scheduler's vision workers from the reader threads. The gui takes frames from the
+        # mailbox instead
+        self.video_thread.register_frame_callback(self.task_scheduler.on_frame)
 
         for tab in (self.main_tab, self.debug_tab):
             # Connect the arm/disarm gui buttons to the arm/disarm commands
@@ -151,11 +173,33 @@ class App(QWidget):
             self.vehicle.connected_signal.connect(tab.widgets.vehicle_status.on_connect)
             self.vehicle.disconnected_signal.connect(tab.widgets.vehicle_status.on_disconnect)
             self.task_scheduler.change_task_signal.connect(tab.widgets.vehicle_status.on_task_change)
+            self.task_scheduler.stats_signal.connect(tab.widgets.vehicle_status.update_loop_stats)
+            self.vehicle.mode_transition_signal.connect(tab.widgets.vehicle_status.update_mode)
+            self.vehicle.link_health_signal.connect(tab.widgets.vehicle_status.update_link_health)
 
             # Register the change big video method with the controller
             if self.controller is not None:
                 self.controller.register_camera_callback(tab.widgets.video_area.set_as_big_video)
 
+        # Record frames from the reader threads, and vehicle state and commands from the scheduler thread
+        self.debug_tab.widgets.session_recording_button.toggled.connect(
+            lambda checked: self.recorder.start() if checked else self.recorder.stop())
+        self.video_thread.register_frame_callback(self.recorder.record_frame)
+        self.vehicle.register_rc_input_callback(lambda values: self.recorder.record_event(
+            time.monotonic(), "rc_inputs", inputs={channel.name: val for channel, val in values.items()}))
+        self.vehicle.connected_signal.connect(
+            lambda: self.recorder.record_event(time.monotonic(), "connected"), Qt.DirectConnection)
+        self.vehicle.disconnected_signal.connect(
+            lambda: self.recorder.record_event(time.monotonic(), "disconnected"), Qt.DirectConnection)
+        self.vehicle.armed_signal.connect(
+            lambda: self.recorder.record_event(time.monotonic(), "armed"), Qt.DirectConnection)
+        self.vehicle.disarmed_signal.connect(
+            lambda: self.recorder.record_event(time.monotonic(), "disarmed"), Qt.DirectConnection)
+        self.vehicle.mode_signal.connect(
+            lambda mode: self.recorder.record_event(time.monotonic(), "mode", mode=mode), Qt.DirectConnection)
+        self.vehicle.depth_update_signal.connect(
+            lambda depth: self.recorder.record_event(time.monotonic(), "depth", depth=depth), Qt.DirectConnection)
+
         # Connect DebugTab's selecting files signal to video thread's on_select_filenames
         self.debug_tab.select_files_signal.connect(self.video_thread.on_select_filenames)
 
@@ -215,6 +259,9 @@ class App(QWidget):
             lambda state: self.vehicle.set_relay(Relay.MAGNET, state))
         self.main_tab.widgets.lights_button.state_change_signal.connect(self.light_manager.toggle_global_enabled)
 
+        # Show the relay states the vehicle was actually sent on the manipulator buttons
+        self.vehicle.relays_set_signal.connect(self.on_relays_set)
+
         if self.controller is not None:
             self.controller.register_relay_callback(Relay.PVC_FRONT, self.main_tab.widgets.front_deployer_button.toggle)
             self.controller.register_relay_callback(Relay.CLAW_FRONT, self.main_tab.widgets.front_claw_button.toggle)
@@ -225,16 +272,28 @@ class App(QWidget):
 
             self.controller.register_mode_callback(self.vehicle.set_mode)
         
-        self.vehicle.mode_signal.connect(self.main_tab.widgets.manual_button.on_mode)
-        self.main_tab.widgets.manual_button.set_mode_signal(self.vehicle.set_mode_signal)
-        self.vehicle.mode_signal.connect(self.main_tab.widgets.stabilize_button.on_mode)
-        self.main_tab.widgets.stabilize_button.set_mode_signal(self.vehicle.set_mode_signal)
-        self.vehicle.mode_signal.connect(self.main_tab.widgets.depth_hold_button.on_mode)
-        self.main_tab.widgets.depth_hold_button.set_mode_signal(self.vehicle.set_mode_signal)
+        for mode_button in (
+            self.main_tab.widgets.manual_button,
+            self.main_tab.widgets.stabilize_button,
+            self.main_tab.widgets.depth_hold_button,
+        ):
+            self.vehicle.mode_signal.connect(mode_button.on_mode)
+            self.vehicle.mode_ack_signal.connect(mode_button.on_mode_ack)
+            mode_button.set_mode_signal(self.vehicle.set_mode_signal)
 
         self.key_signal.connect(self.main_tab.widgets.map_wreck.map_thread.key_slot)
         self.vehicle.depth_update_signal.connect(self.main_tab.widgets.vehicle_status.update_depth)
 
+        # Feed the telemetry plots straight from the I/O loop, they repaint on their own timer
+        plot = self.main_tab.widgets.telemetry_plot
+        self.vehicle.telemetry.subscribe("VFR_HUD", lambda hud: (
+            plot.add_sample("depth", hud.timestamp, hud.depth * -METERS_TO_FEET),
+            plot.add_sample("heading", hud.timestamp, hud.heading)))
+        self.vehicle.telemetry.subscribe("SERVO_OUTPUT_RAW", lambda outputs: plot.add_sample(
+            "thrusters", outputs.timestamp, max(abs(pwm - NEUTRAL_PWM) for pwm in outputs.pwms[:NUM_THRUSTERS])))
+        self.task_scheduler.stats_signal.connect(
+            lambda stats: plot.add_sample("jitter", time.monotonic(), stats.jitter_p99), Qt.DirectConnection)
+
         # Forward the finished stitched image to the measure wreck button
         self.main_tab.widgets.transect_stitching.stitched_image_signal.connect(self.main_tab.widgets.measure_wreck.on_stitch_complete)
 
@@ -268,9 +327,32 @@ class App(QWidget):
             self.keysDown.pop(event.key())
 
     def closeEvent(self, event):
+        self.display_timer.stop()
         self.video_thread.stop()
+        self.recorder.stop()
+        self.task_scheduler.stop()
+        if self.controller is not None:
+            self.controller.stop_monitoring()
+        self.vehicle.stop()
+        logger.debug(f"Frame mailbox stats: {self.video_thread.frame_mailbox.get_stats()}")
+        logger.debug(f"RC output stats: {self.vehicle.rc_output.get_stats()}")
+        logger.debug(f"Relay channel stats: {self.vehicle.relay_channel.get_stats()}")
+        logger.debug(f"Camera channel stats: {self.vehicle.camera_channel.get_stats()}")
+        for channel_id, stats in self.vehicle.input_latency.get_stats().items():
+            logger.debug(f"Input latency of {InputChannel(channel_id).name}: {stats}")
         event.accept()
 
+    def on_relays_set(self, states: dict):
+        for relay, button in (
+            (Relay.PVC_FRONT, self.main_tab.widgets.front_deployer_button),
+            (Relay.CLAW_FRONT, self.main_tab.widgets.front_claw_button),
+            (Relay.PVC_BACK, self.main_tab.widgets.back_deployer_button),
+            (Relay.CLAW_BACK, self.main_tab.widgets.back_claw_button),
+            (Relay.MAGNET, self.main_tab.widgets.magnet_button),
+        ):
+            if relay in states:
+                button.show_state(states[relay])
+
     def get_big_video_index(self):
         tab = self.tabs.currentWidget()
         if isinstance(tab, VideoTab):
@@ -285,6 +367,11 @@ class App(QWidget):
         filename = datetime.datetime.now().strftime("recordings/%Y-%m-%d_%H%M%S") + '.png'
         cv2.imwrite(filename, self.get_active_frame())
 
+    def display_frames(self):
+        """Show the newest frame of each camera that has posted since the last display tick"""
+        for frame in self.video_thread.frame_mailbox.take_all():
+            self.update_image(frame)
+
     @pyqtSlot(Frame)
     def update_image(self, frame: Frame):
         """Updates the appropriate tab with a new opencv image"""
@@ -1,5 +1,6 @@
 import dataclasses
 import enum
+import typing as t
 import numpy as np
 
 
@@ -7,6 +8,10 @@ import numpy as np
 class Frame:
     cv_img: np.ndarray
     cam_index: int
+    # Display-ready images keyed by target widget size, rendered off the gui thread by a DisplayPipeline
+    display_images: t.Dict[t.Tuple[int, int], t.Any] = dataclasses.field(default_factory=dict)
+    # When the frame was captured, in time.monotonic() seconds
+    timestamp: t.Optional[float] = None
 
 
 @dataclasses.dataclass
@@ -15,3 +20,12 @@ class VideoSource:
     api_preference: int
     width: int
     height: int
+
+
+@dataclasses.dataclass
+class PlotSeries:
+    name: str  # Key samples are added under
+    label: str
+    unit: str
+    invert: bool = False  # Draw larger values lower, e.g. depth
+    wrap: t.Optional[float] = None  # Period of angles, e.g. 360 for heading, so crossing it doesn't jump
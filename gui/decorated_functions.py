@@ -2,9 +2,10 @@ import cv2
 from gui.decorator import Decorator
 import numpy as np
 from PIL import Image
-from tasks.button_docking import get_button_contour
+from tasks.button_docking import ButtonDetector
 
 dropdown = Decorator()
+red_button_detector = ButtonDetector()
 
 
 @dropdown(name="None")
@@ -33,11 +34,14 @@ def mask_for_red(image):
     :param image: image to convert
     :return: converted image
     """
-    best_contour, high_score = get_button_contour(image)
-    
-    # Calculate button position info if we found a good countour
-    if high_score > 0:
-        x,y,w,h = cv2.boundingRect(best_contour)
-        cv2.rectangle(image, (x,y), (x+w,y+h), (0,255,0), 2)
-
-    return image
\ No newline at end of file
+    # Frames from gstreamer are read-only views into shared memory, so draw on a copy
+    image = image.copy()
+    detection = red_button_detector.detect(image)
+
+    # The detector searches the right half of the frame
+    if detection is not None:
+        x = int(detection.x - detection.width / 2) + image.shape[1] // 2
+        y = int(detection.y - detection.height / 2)
+        cv2.rectangle(image, (x, y), (x + detection.width, y + detection.height), (0, 255, 0), 2)
+
+    return image
@@ -0,0 +1,96 @@
+import threading
+import typing as t
+
+import cv2
+import numpy as np
+from PyQt5 import QtGui
+
+Size = t.Tuple[int, int]
+
+
+def fit_size(image_size: Size, target_size: Size) -> Size:
+    """Returns the largest size with the image's aspect ratio that fits in the target size"""
+    image_w, image_h = image_size
+    target_w, target_h = target_size
+    scale = min(target_w / image_w, target_h / image_h)
+    return max(1, int(image_w * scale)), max(1, int(image_h * scale))
+
+
+class DisplayPipeline:
+    """
+    Renders frames at the size of the widgets showing them, so the gui thread only receives small,
+    display-ready QImages. Widgets register their size per cam_index while visible, and video readers call
+    render() on their own threads. Each frame is downscaled once per distinct target size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # id(widget) -> (cam_index, width, height)
+        self._targets: t.Dict[int, t.Tuple[int, int, int]] = {}
+
+        # (image size, target size) -> fitted size
+        self._fit_cache: t.Dict[t.Tuple[Size, Size], Size] = {}
+
+    def set_target(self, owner, cam_index: int, width: int, height: int):
+        """Register or update the size a widget displays the given camera at"""
+        with self._lock:
+            if width > 0 and height > 0:
+                self._targets[id(owner)] = (cam_index, width, height)
+            else:
+                self._targets.pop(id(owner), None)
+
+    def remove_target(self, owner):
+        """Stop rendering for a widget, e.g. when it is hidden"""
+        with self._lock:
+            self._targets.pop(id(owner), None)
+
+    def target_sizes(self, cam_index: int) -> t.Set[Size]:
+        with self._lock:
+            return {(w, h) for index, w, h in self._targets.values() if index == cam_index}
+
+    def _fit(self, image_size: Size, target_size: Size) -> Size:
+        key = (image_size, target_size)
+        size = self._fit_cache.get(key)
+        if size is None:
+            size = self._fit_cache[key] = fit_size(image_size, target_size)
+        return size
+
+    def render(self, cv_img: np.ndarray, cam_index: int) -> t.Dict[Size, "RenderedImage"]:
+        """Render a frame for every target size registered for the camera"""
+        image_size = (cv_img.shape[1], cv_img.shape[0])
+        rendered = {}
+        by_fitted_size = {}
+
+        for target_size in self.target_sizes(cam_index):
+            fitted = self._fit(image_size, target_size)
+
+            # Widgets with different sizes can still share a fitted size
+            if fitted not in by_fitted_size:
+                by_fitted_size[fitted] = RenderedImage.from_cv(cv_img, fitted)
+            rendered[target_size] = by_fitted_size[fitted]
+
+        return rendered
+
+
+class RenderedImage:
+    """A display-ready QImage along with the array backing it, which must stay alive as long as the QImage"""
+
+    def __init__(self, array: np.ndarray, image: QtGui.QImage):
+        self.array = array
+        self.image = image
+
+    @staticmethod
+    def from_cv(cv_img: np.ndarray, size: Size) -> "RenderedImage":
+        """Downscale an opencv image to the given size and convert it to RGB in one pass over the small image"""
+        interpolation = cv2.INTER_AREA if size[0] < cv_img.shape[1] else cv2.INTER_LINEAR
+        small = cv2.resize(cv_img, size, interpolation=interpolation)
+
+        w, h = size
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            image = QtGui.QImage(small.data, w, h, 3 * w, QtGui.QImage.Format_RGB888)
+        else:
+            image = QtGui.QImage(small.data, w, h, w, QtGui.QImage.Format_Grayscale8)
+
+        return RenderedImage(small, image)
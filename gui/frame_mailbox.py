@@ -0,0 +1,50 @@
+import threading
+import typing as t
+from collections import defaultdict
+
+from gui.data_classes import Frame
+
+
+class FrameMailbox:
+    """
+    Holds only the newest frame for each cam_index. Video readers post frames from their own threads, and the
+    gui takes them on its display timer, so a slow gui thread drops stale frames instead of queueing them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames: t.Dict[int, Frame] = {}
+
+        # Per cam_index counters of frames posted, taken by the reader, and overwritten before being taken
+        self.posted = defaultdict(int)
+        self.taken = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    def post(self, frame: Frame):
+        """Store a frame, replacing any frame for the same camera that hasn't been taken yet"""
+        with self._lock:
+            if frame.cam_index in self._frames:
+                self.dropped[frame.cam_index] += 1
+            self._frames[frame.cam_index] = frame
+            self.posted[frame.cam_index] += 1
+
+    def take_all(self) -> t.List[Frame]:
+        """Remove and return the newest frame of every camera that has posted since the last call"""
+        with self._lock:
+            frames = list(self._frames.values())
+            self._frames.clear()
+            for frame in frames:
+                self.taken[frame.cam_index] += 1
+        return frames
+
+    def get_stats(self) -> t.Dict[int, t.Dict[str, int]]:
+        """Returns the posted/taken/dropped counts for each cam_index"""
+        with self._lock:
+            return {
+                cam_index: {
+                    "posted": self.posted[cam_index],
+                    "taken": self.taken[cam_index],
+                    "dropped": self.dropped[cam_index],
+                }
+                for cam_index in sorted(self.posted)
+            }
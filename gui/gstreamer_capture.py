@@ -10,50 +10,164 @@ from logger import root_logger
 
 logger = root_logger.getChild(__name__)
 
-def run_gstreamer_capture(pipeline: str, new_frame_event, shared_buffer: SharedMemory):
+# Number of frame slots in the shared ring. The writer has to lap the ring during a read for the read to be retried
+NUM_SLOTS = 4
+
+# Seconds to wait after a failed read, and the number of failures in a row (about a second) after which the pipeline
+# is reopened, e.g. after EOS or a stalled camera
+READ_RETRY_DELAY = 0.01
+MAX_READ_FAILURES = 100
+
+# Keep the frame data cache line aligned
+HEADER_ALIGNMENT = 64
+
+
+class SharedFrameRing:
+    """
+    A ring of frame slots in shared memory, written by one process and read by another.
+
+    Layout: [latest slot index][sequence number per slot][capture timestamp per slot][frame slots...]
+
+    The writer only ever fills the slot after the latest one, so the latest slot is always complete and the
+    writer never has to wait for the reader. A sequence number of 0 marks a slot that is empty or being written, so
+    a reader that finds a slot's sequence number unchanged after copying it knows the copy isn't torn.
+    """
+
+    def __init__(self, shared_buffer: SharedMemory, width: int, height: int, num_slots: int = NUM_SLOTS):
+        self.num_slots = num_slots
+
+        buf = shared_buffer.buf
+        self._latest = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=0)
+        self.sequences = np.ndarray((num_slots,), dtype=np.int64, buffer=buf, offset=8)
+        self.timestamps = np.ndarray((num_slots,), dtype=np.float64, buffer=buf, offset=8 + 8 * num_slots)
+        self.frames = np.ndarray((num_slots, height, width, 3), dtype=np.uint8, buffer=buf,
+                                 offset=SharedFrameRing.header_size(num_slots))
+
+    @staticmethod
+    def header_size(num_slots: int) -> int:
+        size = 8 + 16 * num_slots
+        return -(-size // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+
+    @staticmethod
+    def buffer_size(width: int, height: int, num_slots: int = NUM_SLOTS) -> int:
+        return SharedFrameRing.header_size(num_slots) + num_slots * 3 * width * height
+
+    @property
+    def latest(self) -> int:
+        return int(self._latest[0])
+
+    def begin_write(self) -> int:
+        """Claim the slot after the latest one and mark it as incomplete. Returns the slot index"""
+        slot = (self.latest + 1) % self.num_slots
+        self.sequences[slot] = 0
+        return slot
+
+    def commit(self, slot: int, sequence: int, timestamp: float):
+        """Mark a slot as complete and publish it as the latest frame"""
+        self.timestamps[slot] = timestamp
+        self.sequences[slot] = sequence
+        self._latest[0] = slot
+
+    def release(self):
+        """Drop the views into the shared buffer so it can be closed"""
+        del self._latest, self.sequences, self.timestamps, self.frames
+
+
+def run_gstreamer_capture(pipeline: str, new_frame_event, shared_buffer: SharedMemory, width: int, height: int,
+                          num_slots: int):
+    ring = SharedFrameRing(shared_buffer, width, height, num_slots)
+    sequence = 0
+
     while True:
         capture = None
         try:
             capture = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+            failures = 0
             while True:
-                new_frame_event.wait()
-                ret, cv_img = capture.read()
-                if ret:
-                    flat = cv_img.view()
-                    flat.shape = (shared_buffer.size)
-                    shared_buffer.buf[:] = flat.data[:]
-                    new_frame_event.clear()
+                slot = ring.begin_write()
+                frame = ring.frames[slot]
+
+                # Decode straight into the shared slot so the frame is only copied once, by the reader
+                ret, cv_img = capture.read(frame)
+                if not ret:
+                    failures += 1
+                    if failures >= MAX_READ_FAILURES:
+                        logger.warning('Gstreamer pipeline stopped producing frames, reopening it')
+                        break
+                    time.sleep(READ_RETRY_DELAY)
+                    continue
+                failures = 0
+
+                if cv_img is not frame:
+                    # OpenCV allocated its own buffer, which happens when the stream size doesn't match the config
+                    if cv_img.shape != frame.shape:
+                        logger.error(f'Gstreamer frame shape {cv_img.shape} does not match configured {frame.shape}')
+                        continue
+                    frame[:] = cv_img
+
+                sequence += 1
+                ring.commit(slot, sequence, time.monotonic())
+
+                # Wake up a waiting reader. Setting an event never blocks the writer
+                new_frame_event.set()
         except Exception as e:
             print(f'Exception in gstreamer process: {e}')
         finally:
             if capture is not None:
                 capture.release()
             time.sleep(1)
-                
+
 
 class GstreamerCapture:
+    """
+    Reads a gstreamer pipeline in a subprocess. Frames are exchanged through a SharedFrameRing, and read() copies
+    the newest one out of the ring, so the frames it returns belong to the caller and can be kept for as long as
+    the display, vision workers or recorder need. They're read-only, since they're shared between all of those.
+    """
 
-    def __init__(self, pipeline: str, width: int, height: int):
+    def __init__(self, pipeline: str, width: int, height: int, num_slots: int = NUM_SLOTS):
         self._width = width
         self._height = height
 
+        self._shared_buffer = SharedMemory(create=True, size=SharedFrameRing.buffer_size(width, height, num_slots))
+        self._ring = SharedFrameRing(self._shared_buffer, width, height, num_slots)
         self._new_frame_event = Event()
-        self._new_frame_event.set()
-        self._shared_buffer = SharedMemory(create=True, size=(3 * width * height))
+
+        # Sequence number and capture timestamp (time.monotonic()) of the last frame returned by read()
+        self.sequence = 0
+        self.timestamp = None
 
         logger.info('Spawning Gstreamer subprocess')
-        self._process = Process(target=run_gstreamer_capture, args=(pipeline, self._new_frame_event, self._shared_buffer))
+        self._process = Process(target=run_gstreamer_capture,
+                                args=(pipeline, self._new_frame_event, self._shared_buffer, width, height, num_slots))
         self._process.start()
 
     def read(self):
-        if not self._new_frame_event.is_set():
-            img = np.frombuffer(self._shared_buffer.buf, dtype=np.uint8)
-            img = img.reshape((self._height, self._width, 3))
-            self._new_frame_event.set()
+        while True:
+            slot = self._ring.latest
+            sequence = int(self._ring.sequences[slot])
+            if sequence <= self.sequence:
+                return False, None
+
+            img = self._ring.frames[slot].copy()
+            timestamp = float(self._ring.timestamps[slot])
+            # The writer zeroes the sequence number before reusing a slot, so if it changed the copy may be torn
+            if int(self._ring.sequences[slot]) != sequence:
+                continue
+
+            self.sequence = sequence
+            self.timestamp = timestamp
+            img.flags.writeable = False
             return True, img
 
-        return False, None
-    
+    def wait_for_frame(self, timeout: float) -> bool:
+        """Block until the subprocess publishes a frame newer than the last read, or the timeout expires"""
+        if self._new_frame_event.wait(timeout):
+            self._new_frame_event.clear()
+            return True
+        return False
+
     def release(self):
         self._process.kill()
+        self._ring.release()
         self._shared_buffer.unlink()
@@ -2,12 +2,17 @@ from gui.gstreamer_capture import GstreamerCapture
 import os
 import cv2
 import json
+import math
+import threading
+import time
 import datetime
 
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QThread
+from PyQt5.QtCore import pyqtSlot, QThread
 from cv2 import CAP_GSTREAMER
 
 from gui.data_classes import Frame, VideoSource
+from gui.display_pipeline import DisplayPipeline
+from gui.frame_mailbox import FrameMailbox
 from util import data_path, pipeline_templates_path
 
 from logger import root_logger
@@ -15,95 +20,181 @@ from logger import root_logger
 logger = root_logger.getChild(__name__)
 
 
-class VideoThread(QThread):
-    update_frames_signal = pyqtSignal(Frame)
+# Used to pace file playback when the file doesn't report its own frame rate
+DEFAULT_FPS = 30
+
+# How long a reader waits for a live stream before checking whether it should stop
+FRAME_TIMEOUT = 0.1
+
+
+class CaptureReader(threading.Thread):
+    """Reads a single video source on its own thread and emits each frame as soon as it is available"""
+
+    def __init__(self, video_thread, source: VideoSource, capture, cam_index: int):
+        super().__init__(daemon=True)
+        self.video_thread = video_thread
+        self.source = source
+        self.capture = capture
+        self.cam_index = cam_index
+        self.running = True
+        self.restart_requested = False
+
+        # Files can be restarted and rewound and are paced at their own frame rate. Gstreams are paced by arrival
+        self.is_file = source.api_preference != CAP_GSTREAMER
+
+        self.period = 1 / DEFAULT_FPS
+        if self.is_file:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            if fps > 0 and not math.isnan(fps):
+                self.period = 1 / fps
+
+        # Serializes capture access between this thread and next_frame/prev_frame calls from the gui thread
+        self._lock = threading.Lock()
+
+    def step(self, rewind: bool) -> bool:
+        """Read and emit one frame. Returns whether a frame was emitted"""
+        with self._lock:
+            if self.restart_requested:
+                if self.is_file:
+                    self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.restart_requested = False
+
+            if rewind and self.is_file:
+                prev_frame = cur_frame = self.capture.get(cv2.CAP_PROP_POS_FRAMES)
+
+                if cur_frame >= 2:
+                    # Go back 2 frames so when we read() we'll read back 1 frame
+                    prev_frame -= 2
+                else:
+                    # If at beginning, just read 1st frame over and over
+                    prev_frame = 0
+
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, prev_frame)
+
+            ret, cv_img = self.capture.read()
+            timestamp = time.monotonic() if self.is_file else self.capture.timestamp
+
+        if ret:
+            # Render for the gui here so only widget-sized images reach the gui thread
+            frame = Frame(cv_img, self.cam_index, self.video_thread.display_pipeline.render(cv_img, self.cam_index),
+                          timestamp=timestamp)
+            self.video_thread._cur_frames[self.cam_index] = cv_img
+            self.video_thread.frame_mailbox.post(frame)
+            self.video_thread.call_frame_callbacks(frame)
+
+        return ret
+
+    def run(self):
+        # Pace against absolute deadlines so the time spent reading doesn't accumulate as drift
+        next_deadline = time.monotonic()
+
+        while self.running:
+            if not self.video_thread._playing_event.wait(FRAME_TIMEOUT):
+                next_deadline = time.monotonic()
+                continue
+
+            if not self.is_file:
+                if self.capture.wait_for_frame(FRAME_TIMEOUT):
+                    self.step(False)
+                continue
+
+            rewind = self.video_thread._rewind
+            self.step(rewind)
+
+            # Don't wait if rewinding b/c rewinding is slow
+            if rewind:
+                next_deadline = time.monotonic()
+                continue
+
+            next_deadline += self.period
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.period:
+                # Fell more than a frame behind, so resync instead of bursting frames to catch up
+                next_deadline = time.monotonic()
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.capture.release()
 
+
+class VideoThread(QThread):
     def __init__(self, json_data):
         super().__init__()
-        self._thread_running_flag = True
-        self._video_playing_flag = True
-        self._restart = False
+        self._stop_event = threading.Event()
+        self._playing_event = threading.Event()
+        self._playing_event.set()
+
+        # The gui reads frames from here on its display timer instead of queueing every frame through a signal
+        self.frame_mailbox = FrameMailbox()
+        self.display_pipeline = DisplayPipeline()
+
+        # Called with every frame on the reader thread that read it, rather than through a signal, so frames are
+        # never queued to the gui thread
+        self.frame_callbacks = []
 
         self._video_sources = []
-        self._captures = []
+        self._readers = []
         self._cur_frames = []
         self._rewind = False
 
         self.load_json(json_data)
 
+    def register_frame_callback(self, callback):
+        """Must be registered before the video thread starts, and must not block the reader"""
+        self.frame_callbacks.append(callback)
+
+    def call_frame_callbacks(self, frame: Frame):
+        for callback in self.frame_callbacks:
+            callback(frame)
+
     def _prepare_captures(self):
         """Initialize video capturers from self._video_sources"""
-        for source in self._video_sources:
+        self._cur_frames = [None] * len(self._video_sources)
+
+        for index, source in enumerate(self._video_sources):
             if source.api_preference == CAP_GSTREAMER:
                 capture = GstreamerCapture(source.filename, source.width, source.height)
             else:
                 capture = cv2.VideoCapture(source.filename, source.api_preference)
-            self._captures.append(capture)
-            self._cur_frames.append(None)
-
-    def _emit_frames(self):
-        """Emit next/prev frames on the pyqtSignal to be received by video widgets"""
+            self._readers.append(CaptureReader(self, source, capture, index))
 
-        # Restart the videos if restart is true
-        if self._restart:
-            for index, capture in enumerate(self._captures):
-                if self._video_sources[index].api_preference != CAP_GSTREAMER:  # don't restart gstreams
-                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    def _start_readers(self):
+        for reader in self._readers:
+            reader.start()
 
-            self._restart = False
+    def _stop_readers(self):
+        for reader in self._readers:
+            reader.running = False
+        for reader in self._readers:
+            reader.stop()
+        self._readers = []
 
-        for index, capture in enumerate(self._captures):
-
-            if self._rewind and self._video_sources[index].api_preference != CAP_GSTREAMER:  # don't rewind gstreams
-                prev_frame = cur_frame = capture.get(cv2.CAP_PROP_POS_FRAMES)
-
-                if cur_frame >= 2:
-                    # Go back 2 frames so when we read() we'll read back 1 frame
-                    prev_frame -= 2
-                else:
-                    # If a t beginning, just read 1st frame over and over
-                    prev_frame = 0
-
-                capture.set(cv2.CAP_PROP_POS_FRAMES, prev_frame)
-
-            # Read the frame
-            ret, cv_img = capture.read()
-            if ret:
-                self.update_frames_signal.emit(Frame(cv_img, index))
-                self._cur_frames[index] = cv_img
+    def _step_all(self, rewind: bool):
+        """Read one frame from every source, for stepping through paused videos"""
+        for reader in self._readers:
+            reader.step(rewind)
 
     def run(self):
         self._prepare_captures()
+        self._start_readers()
 
-        # Run the play/pausable video
-        while self._thread_running_flag:
-            # Send frames if the video is playing
-            if self._video_playing_flag:
-                self._emit_frames()
-
-            # Wait if playing normally, don't if rewinding b/c rewinding is slow
-            if not self._rewind:
-                self.msleep(int(1000 / 30))
+        # The readers do all the work, so just wait to be shut down
+        self._stop_event.wait()
 
-        # Shut down capturers
-        for capture in self._captures:
-            capture.release()
+        self._stop_readers()
 
     def next_frame(self):
         """Goes forward a frame if the video is paused"""
-        if not self._video_playing_flag:
-            prev_rewind_state = self._rewind
-            self._rewind = False
-            self._emit_frames()
-            self._rewind = prev_rewind_state
+        if not self._playing_event.is_set():
+            self._step_all(False)
 
     def prev_frame(self):
         """Goes back a frame if the video is paused"""
-        if not self._video_playing_flag:
-            prev_rewind_state = self._rewind
-            self._rewind = True
-            self._emit_frames()
-            self._rewind = prev_rewind_state
+        if not self._playing_event.is_set():
+            self._step_all(True)
 
     def toggle_rewind(self):
         """Toggles the video rewind flag"""
@@ -111,17 +202,21 @@ class VideoThread(QThread):
 
     def toggle_play_pause(self):
         """Toggles the video playing flag"""
-        self._video_playing_flag = not self._video_playing_flag
+        if self._playing_event.is_set():
+            self._playing_event.clear()
+        else:
+            self._playing_event.set()
 
     def stop(self):
-        """Sets the video playing & thread running flags to False and waits for thread to end"""
-        self._video_playing_flag = False
-        self._thread_running_flag = False
+        """Pauses the videos, stops the readers and waits for thread to end"""
+        self._playing_event.clear()
+        self._stop_event.set()
         self.wait()
 
     def restart(self):
         """Restarts the video from the beginning"""
-        self._restart = True
+        for reader in self._readers:
+            reader.restart_requested = True
 
     @pyqtSlot(list)
     def on_select_filenames(self, filenames):
@@ -140,10 +235,11 @@ class VideoThread(QThread):
             else:  # Regular file (not JSON)
                 self._video_sources.append(VideoSource(filename, cv2.CAP_FFMPEG))
 
-        self._video_playing_flag = True
-        self._captures = []
+        self._stop_readers()
         self._rewind = False
         self._prepare_captures()
+        self._start_readers()
+        self._playing_event.set()
 
     def load_json(self, json_data):
         if json_data["sources"]:
@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtGui import QOpenGLShader, QOpenGLShaderProgram, QVector2D
+from PyQt5.QtWidgets import QOpenGLWidget, QSizePolicy
+
+from gui.data_classes import Frame
+
+# GLSL 1.20 so it also runs on software Mesa (LIBGL_ALWAYS_SOFTWARE=1)
+VERTEX_SHADER = """
+#version 120
+attribute vec2 position;
+attribute vec2 tex_coord;
+uniform vec2 scale;
+varying vec2 v_tex_coord;
+
+void main() {
+    gl_Position = vec4(position * scale, 0.0, 1.0);
+    v_tex_coord = tex_coord;
+}
+"""
+
+# Frames are uploaded as raw BGR bytes, so swizzle the channels back to RGB here instead of on the cpu
+FRAGMENT_SHADER = """
+#version 120
+uniform sampler2D frame;
+varying vec2 v_tex_coord;
+
+void main() {
+    gl_FragColor = vec4(texture2D(frame, v_tex_coord).bgr, 1.0);
+}
+"""
+
+QUAD_POSITIONS = [QVector2D(-1, -1), QVector2D(1, -1), QVector2D(-1, 1), QVector2D(1, 1)]
+# Texture rows start at the top of the image, but gl's y axis points up
+QUAD_TEX_COORDS = [QVector2D(0, 1), QVector2D(1, 1), QVector2D(0, 0), QVector2D(1, 0)]
+
+
+class GLVideoWidget(QOpenGLWidget):
+    """
+    A drop-in alternative to the big VideoWidget which uploads each BGR frame into a persistent texture and lets
+    the gpu scale it on draw, instead of building and blitting a new QPixmap every frame
+    """
+    update_big_video_signal = pyqtSignal(int)
+
+    def __init__(self, cam_index: int, is_big: bool):
+        super().__init__()
+
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        self.cam_index = cam_index
+        self.is_big = is_big
+
+        self._program = None
+        self._texture = None
+        self._texture_size = None
+        self._pending_frame = None
+
+        # Swap this video with the big video on click
+        self.mousePressEvent = lambda event: self.update_big_video_signal.emit(self.cam_index)
+
+    def set_cam_index(self, cam_index: int):
+        self.cam_index = cam_index
+
+    def show_frame(self, frame: Frame):
+        """Queue the full resolution frame for upload on the next paint"""
+        cv_img = frame.cv_img
+        if cv_img.ndim == 2:
+            cv_img = cv2.cvtColor(cv_img, cv2.COLOR_GRAY2BGR)
+
+        # Only uploaded at paint time, so keep an array of our own. A view into someone else's buffer, like a slot of
+        # a capture ring, could be overwritten before then
+        if cv_img.base is not None or not cv_img.flags.c_contiguous:
+            cv_img = np.array(cv_img, order='C')
+        self._pending_frame = cv_img
+        self.update()
+
+    def initializeGL(self):
+        self._program = QOpenGLShaderProgram(self)
+        self._program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX_SHADER)
+        self._program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT_SHADER)
+        self._program.link()
+
+        self._texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+
+        # Rows of 3 byte pixels aren't always 4 byte aligned
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+        GL.glClearColor(0, 0, 0, 1)
+
+    def _upload(self, cv_img: np.ndarray):
+        height, width = cv_img.shape[:2]
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+
+        if self._texture_size != (width, height):
+            # Only reallocate the texture when the stream size changes
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB8, width, height, 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, cv_img)
+            self._texture_size = (width, height)
+        else:
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, cv_img)
+
+    def paintGL(self):
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+        if self._pending_frame is not None:
+            self._upload(self._pending_frame)
+            self._pending_frame = None
+
+        if self._texture_size is None:
+            return
+
+        # Scale the quad to keep the frame's aspect ratio inside the widget
+        frame_w, frame_h = self._texture_size
+        widget_aspect = self.width() / max(self.height(), 1)
+        frame_aspect = frame_w / frame_h
+        if frame_aspect > widget_aspect:
+            scale = (1.0, widget_aspect / frame_aspect)
+        else:
+            scale = (frame_aspect / widget_aspect, 1.0)
+
+        self._program.bind()
+        self._program.setUniformValue("scale", QVector2D(*scale))
+        self._program.setUniformValue("frame", 0)
+
+        position = self._program.attributeLocation("position")
+        tex_coord = self._program.attributeLocation("tex_coord")
+        self._program.enableAttributeArray(position)
+        self._program.enableAttributeArray(tex_coord)
+        self._program.setAttributeArray(position, QUAD_POSITIONS)
+        self._program.setAttributeArray(tex_coord, QUAD_TEX_COORDS)
+
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+
+        self._program.disableAttributeArray(position)
+        self._program.disableAttributeArray(tex_coord)
+        self._program.release()
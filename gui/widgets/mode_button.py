@@ -22,6 +22,16 @@ class ModeButton(QPushButton):
     def set_mode_signal(self, signal: pyqtSignal):
         self.signal = signal
         
+    @pyqtSlot(object)
+    def on_mode_ack(self, request):
+        """Show that the vehicle accepted a request for this button's mode and it's waiting to take effect"""
+        if request.mode != self.mode:
+            return
+        if request.accepted:
+            self.setStyleSheet("QPushButton { background-color: orange }")
+        else:
+            logger.warning(f'Vehicle rejected mode {self.mode}')
+
     @pyqtSlot(str)
     def on_mode(self, mode: str):
         if mode == self.mode:
@@ -37,6 +37,10 @@ class RelayToggleButton(QPushButton):
         self.setChecked(True)
         self.state_change_signal.emit(True)
 
+    def show_state(self, state: bool):
+        """Show the state the relay was actually set to, without sending it again"""
+        self.setChecked(state)
+
     def enable_click(self):
         self.setEnabled(True)
         self.setStyleSheet("QPushButton:checked { background-color: blue }")
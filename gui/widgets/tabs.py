@@ -2,7 +2,7 @@ from gui.widgets.camera_toggle_widget import CameraToggleWidget
 from gui.widgets.fish_button import FishButton
 from gui.widgets.mode_button import ModeButton
 import logging
-from collections import defaultdict
+import typing as t
 from types import SimpleNamespace
 
 from PyQt5 import QtCore
@@ -11,10 +11,11 @@ from PyQt5.QtGui import QColor, QTextCursor, QFont, QPixmap
 from PyQt5.QtWidgets import QComboBox, QFileDialog, QHBoxLayout, QLabel, QPushButton, QVBoxLayout, QWidget, QTextEdit, \
     QFrame, QGridLayout
 
-from controller.controller import XboxController, PS5Controller
+from controller.profile import ControllerProfile
 from gui.widgets.gazebo_control_widget import GazeboControlWidget
 from gui.widgets.recording_button import RecordingButton
 from gui.widgets.timer_widget import TimerWidget
+from gui.widgets.telemetry_plot_widget import TelemetryPlotWidget
 from gui.widgets.vehicle_status_widget import VehicleStatusWidget
 from gui.widgets.image_debug_widget import ImagesWidget
 from gui.widgets.video_controls_widget import VideoControlsWidget
@@ -44,23 +45,6 @@ CONSOLE_TEXT_COLORS = {
 
 HEADER_FONT = QFont("Sans Serif", 12)
 
-CONTROLLER_ICONS = {
-    None: defaultdict(lambda: None),  # Every key will be none
-    XboxController: {
-        "deployer": "gui/resources/XboxSeriesX_LB.png",
-        "claw": "gui/resources/XboxSeriesX_RB.png",
-        "magnet": "gui/resources/XboxSeriesX_X.png",
-        "lights": "gui/resources/XboxSeriesX_Y.png"
-    },
-    PS5Controller: {
-        "deployer": "gui/resources/PS5_L1.png",
-        "claw": "gui/resources/PS5_R1.png",
-        "magnet": "gui/resources/PS5_Square.png",
-        "lights": "gui/resources/PS5_Triangle.png"
-    },
-}
-
-
 class RootTab(QWidget):
     """An individual tab in the RootTabContainer containing all the widgets to be displayed in the tab"""
 
@@ -132,14 +116,16 @@ class ImageDebugTab(RootTab):
 class VideoTab(RootTab):
     """A RootTab which displays video(s) from a camera stream or video file, among other functions"""
 
-    def __init__(self, num_video_streams):
+    def __init__(self, num_video_streams, display_pipeline=None, use_opengl=False):
         self.num_video_streams = num_video_streams
+        self.display_pipeline = display_pipeline
+        self.use_opengl = use_opengl
 
         super().__init__()
 
     def init_widgets(self):
         super().init_widgets()
-        self.widgets.video_area = VideoArea(self.num_video_streams)
+        self.widgets.video_area = VideoArea(self.num_video_streams, self.display_pipeline, self.use_opengl)
 
     def handle_frame(self, frame: Frame):
         self.widgets.video_area.handle_frame(frame)
@@ -164,14 +150,15 @@ def header_label(text: str) -> QLabel:
 
 class MainTab(VideoTab):
 
-    def __init__(self, app, num_video_streams, controller_type):
+    def __init__(self, app, num_video_streams, controller_profile: t.Optional[ControllerProfile]):
         self.app = app
-        icons_dict = CONTROLLER_ICONS[controller_type]
-        self.deployer_image = QPixmap(icons_dict["deployer"])
-        self.claw_image = QPixmap(icons_dict["claw"])
-        self.magnet_image = QPixmap(icons_dict["magnet"])
-        self.lights_image = QPixmap(icons_dict["lights"])
-        super().__init__(num_video_streams)
+        # Images of the buttons bound to each action, from the profile so they follow its bindings
+        icons = controller_profile.icons if controller_profile is not None else {}
+        self.deployer_image = QPixmap(icons.get("deployer"))
+        self.claw_image = QPixmap(icons.get("claw"))
+        self.magnet_image = QPixmap(icons.get("magnet"))
+        self.lights_image = QPixmap(icons.get("lights"))
+        super().__init__(num_video_streams, app.video_thread.display_pipeline, app.use_opengl_video)
 
 
     def init_widgets(self):
@@ -179,6 +166,7 @@ class MainTab(VideoTab):
         self.widgets.fish_record = FishRecordWidget(self.app)
         self.widgets.arm_control = ArmControlWidget()
         self.widgets.vehicle_status = VehicleStatusWidget(self.app.vehicle)
+        self.widgets.telemetry_plot = TelemetryPlotWidget()
         self.widgets.transect_stitching = TransectWidget(self.app)
         self.widgets.map_wreck = MapWreckWidget()
         self.widgets.measure_wreck = MeasureWreckWidget()
@@ -262,6 +250,7 @@ class MainTab(VideoTab):
         sidebar.addStretch()
         sidebar.addWidget(self.widgets.arm_control)
         sidebar.addWidget(self.widgets.vehicle_status)
+        sidebar.addWidget(self.widgets.telemetry_plot)
 
     def show_prompts_for_cam(self, index):
         facing_backward = index in BACKWARD_CAM_INDICES
@@ -279,7 +268,7 @@ class DebugTab(VideoTab):
     def __init__(self, app, num_video_streams):
         self.current_filter = "None"  # Filter applied with dropdown menu
         self.app = app
-        super().__init__(num_video_streams)
+        super().__init__(num_video_streams, app.video_thread.display_pipeline, app.use_opengl_video)
 
     def init_widgets(self):
         super().init_widgets()
@@ -305,6 +294,11 @@ class DebugTab(VideoTab):
         select_files_button.clicked.connect(self.select_files)
         self.widgets.select_files_button = select_files_button
 
+        # Record frames and telemetry for replaying tasks offline
+        session_recording_button = QPushButton("Record Session Data")
+        session_recording_button.setCheckable(True)
+        self.widgets.session_recording_button = session_recording_button
+
         self.widgets.gazebo_control = GazeboControlWidget()
 
         self.widgets.arm_control = ArmControlWidget()
@@ -322,6 +316,7 @@ class DebugTab(VideoTab):
         sidebar.addWidget(self.widgets.video_controls)
 
         sidebar.addWidget(self.widgets.select_files_button)
+        sidebar.addWidget(self.widgets.session_recording_button)
 
         sidebar.addWidget(header_label("Gazebo Controls"))
         sidebar.addWidget(self.widgets.gazebo_control)
@@ -341,8 +336,9 @@ class DebugTab(VideoTab):
 
     def handle_frame(self, frame: Frame):
         # Apply the selected filter from the dropdown
-        if frame.cam_index == self.widgets.video_area.get_big_video_cam_index():
-            frame.cv_img = self.apply_filter(frame.cv_img)
+        # The filtered frame is new, so it has no pre-rendered display images and is scaled here instead
+        if frame.cam_index == self.widgets.video_area.get_big_video_cam_index() and self.current_filter != "None":
+            frame = Frame(self.apply_filter(frame.cv_img), frame.cam_index)
 
         super().handle_frame(frame)
 
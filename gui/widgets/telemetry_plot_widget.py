@@ -0,0 +1,117 @@
+import time
+import typing as t
+
+import numpy as np
+from PyQt5.QtCore import QTimer, QLineF, Qt, QRectF
+from PyQt5.QtGui import QFont, QPainter, QPen, QColor
+from PyQt5.QtWidgets import QWidget
+
+from gui.data_classes import PlotSeries
+from vehicle.telemetry_store import MinMaxBuckets
+
+# Repaints per second, however fast samples arrive
+PLOT_FPS = 10
+
+PLOT_SPAN = 60  # Seconds of history shown
+NUM_BUCKETS = 120  # Horizontal resolution, each bucket is drawn as a min-max line
+
+STRIP_HEIGHT = 44  # Pixels per series
+
+# Servo outputs driving thrusters, drawn as the largest deviation of any of them from neutral
+NUM_THRUSTERS = 8
+NEUTRAL_PWM = 1500
+
+DEFAULT_PLOTS = (
+    PlotSeries("depth", "Depth", "ft", invert=True),
+    PlotSeries("heading", "Heading", "°", wrap=360),
+    PlotSeries("thrusters", "Max thrust", "µs from neutral"),
+    PlotSeries("jitter", "Loop jitter p99", "ms"),
+)
+
+
+class TelemetryPlotWidget(QWidget):
+    """
+    Scrolling strip charts of recent telemetry. Samples can be added from any thread and are folded into MinMaxBuckets
+    as they arrive, and the widget repaints on its own timer at PLOT_FPS, so the cost of drawing doesn't depend on how
+    fast telemetry comes in or how long the history is.
+    """
+
+    def __init__(self, plots: t.Sequence[PlotSeries] = DEFAULT_PLOTS):
+        super().__init__()
+        self.plots = list(plots)
+        self.buckets = {plot.name: MinMaxBuckets(PLOT_SPAN, NUM_BUCKETS) for plot in self.plots}
+        self.wraps = {plot.name: plot.wrap for plot in self.plots if plot.wrap is not None}
+
+        self.setMinimumHeight(STRIP_HEIGHT * len(self.plots))
+        self.setFont(QFont("Sans Serif", 9))
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000 // PLOT_FPS)
+
+    def add_sample(self, name: str, timestamp: float, value: float):
+        """Add a sample to a series, timestamp in time.monotonic() seconds. Safe to call from any thread"""
+        buckets = self.buckets[name]
+        wrap = self.wraps.get(name)
+        if wrap is not None and buckets.latest is not None:
+            # Unwrap angles to the turn closest to the last sample, so going from 359 to 1 is a step of 2, not 358
+            last = buckets.latest[1]
+            value = last + (value - last + wrap / 2) % wrap - wrap / 2
+        buckets.append(timestamp, value)
+
+    def refresh(self):
+        if self.isVisible():
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        now = time.monotonic()
+        strip_height = self.height() / len(self.plots)
+
+        for i, plot in enumerate(self.plots):
+            rect = QRectF(0, i * strip_height, self.width(), strip_height)
+            self.draw_strip(painter, rect, plot, now)
+
+        painter.end()
+
+    def draw_strip(self, painter: QPainter, rect: QRectF, plot: PlotSeries, now: float):
+        buckets = self.buckets[plot.name]
+        mins, maxs = buckets.read(now)
+
+        painter.setPen(QPen(QColor("#575757")))
+        painter.drawRect(rect.adjusted(0, 0, -1, -1))
+
+        label = plot.label
+        if buckets.latest is not None:
+            latest = buckets.latest[1] if plot.wrap is None else buckets.latest[1] % plot.wrap
+            label += f": {latest:.1f} {plot.unit}"
+        painter.setPen(QPen(self.palette().windowText().color()))
+        painter.drawText(rect.adjusted(4, 2, -4, -2), Qt.AlignTop | Qt.AlignLeft, label)
+
+        valid = ~np.isnan(mins)
+        if not valid.any():
+            return
+
+        # Leave room for the label at the top
+        plot_rect = rect.adjusted(1, 16, -1, -2)
+        low, high = float(mins[valid].min()), float(maxs[valid].max())
+        if high - low < 1e-6:
+            low, high = low - 0.5, high + 0.5
+        scale = plot_rect.height() / (high - low)
+
+        def to_y(value):
+            y = (value - low) * scale
+            return plot_rect.top() + y if plot.invert else plot_rect.bottom() - y
+
+        bucket_width = plot_rect.width() / buckets.num_buckets
+        lines = []
+        for j in np.flatnonzero(valid):
+            x = plot_rect.left() + (j + 0.5) * bucket_width
+            y1, y2 = to_y(mins[j]), to_y(maxs[j])
+            # Keep single valued buckets visible
+            if abs(y2 - y1) < 1:
+                y2 = y1 + 1
+            lines.append(QLineF(x, y1, x, y2))
+
+        painter.setPen(QPen(QColor("#5f5fff"), max(bucket_width, 1)))
+        painter.drawLines(lines)
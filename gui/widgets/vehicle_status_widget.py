@@ -14,17 +14,54 @@ class VehicleStatusWidget(QLabel):
         self.setFont(QFont("Sans Serif", 12))
         self.setStyleSheet("padding-left: 10 px")
         self.depth = 0
+        self.loop_stats = None
+        self.mode_transition = None
+        self.link_health = None
         self.update_text()
 
     def update_depth(self, depth: int):
         self.depth = depth
         self.update_text()
 
+    def update_loop_stats(self, stats):
+        self.loop_stats = stats
+        self.update_text()
+
+    def update_link_health(self, health):
+        self.link_health = health
+        self.update_text()
+
+    def update_mode(self, transition):
+        self.mode_transition = transition
+        self.update_text()
+
     def update_text(self):
-        self.setText(f"Mavlink: {'Connected' if self.connected else 'Disconnected'}\n"
-                     f"Task: {'None' if self.task == '' else self.task}\n"
-                     f"Depth: {round(self.depth * -METERS_TO_FEET, 3)} ft"
-                     )
+        text = (f"Mavlink: {'Connected' if self.connected else 'Disconnected'}\n"
+                f"Task: {'None' if self.task == '' else self.task}\n"
+                f"Depth: {round(self.depth * -METERS_TO_FEET, 3)} ft")
+
+        if self.mode_transition is not None:
+            text += f"\nMode: {self.mode_transition.mode}"
+            if self.mode_transition.request is not None:
+                text += f" (in {self.mode_transition.confirm_latency * 1000:.0f} ms"
+                if self.mode_transition.ack_latency is not None:
+                    text += f", ack {self.mode_transition.ack_latency * 1000:.0f} ms"
+                text += ")"
+
+        if self.link_health is not None and self.link_health.connected:
+            text += f"\nLink: {self.link_health.packet_loss * 100:.1f}% loss"
+            if self.link_health.rtt is not None:
+                text += f", RTT {self.link_health.rtt * 1000:.0f} ms"
+            if self.link_health.stale:
+                text += f", stale {', '.join(self.link_health.stale)}"
+
+        if self.loop_stats is not None:
+            text += (f"\nLoop: {1000 / self.loop_stats.period_mean:.1f} Hz, "
+                     f"jitter p99 {self.loop_stats.jitter_p99:.1f} ms, "
+                     f"{self.loop_stats.overruns_total} overruns")
+
+        if text != self.text():
+            self.setText(text)
 
     def on_task_change(self, new_task):
         self.task = new_task
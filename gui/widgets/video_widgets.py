@@ -6,12 +6,13 @@ from PyQt5.QtWidgets import QHBoxLayout, QLabel, QVBoxLayout, QWidget
 from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
 
 from gui.data_classes import Frame
+from gui.display_pipeline import DisplayPipeline
 
 
 class VideoArea(QWidget):
     big_video_changed_signal = pyqtSignal(int)
 
-    def __init__(self, num_video_widgets):
+    def __init__(self, num_video_widgets, display_pipeline: DisplayPipeline = None, use_opengl: bool = False):
         super().__init__()
 
         self.root_layout = QHBoxLayout(self)
@@ -20,13 +21,18 @@ class VideoArea(QWidget):
         self.small_videos_layout = QVBoxLayout()
         self.small_videos_layout.setContentsMargins(0, 0, 0, 0)
 
-        big_video = VideoWidget(0, True)
+        if use_opengl:
+            # Imported here so PyOpenGL is only needed when the OpenGL big video is selected
+            from gui.widgets.gl_video_widget import GLVideoWidget
+            big_video = GLVideoWidget(0, True)
+        else:
+            big_video = VideoWidget(0, True, display_pipeline)
         self.root_layout.addWidget(big_video, 5)
 
         # Create the small VideoWidgets with click events and add them to horizontal_layout
         self.video_widgets = [big_video]
         for i in range(0, num_video_widgets):
-            video = VideoWidget(i, False)
+            video = VideoWidget(i, False, display_pipeline)
             self.video_widgets.append(video)
             video.update_big_video_signal.connect(self.set_as_big_video)
             self.small_videos_layout.addWidget(video, 1)
@@ -39,33 +45,64 @@ class VideoArea(QWidget):
 
     def handle_frame(self, frame: Frame):
         """Recieve a frame and assign it to the correct VideoWidget"""
-        qt_img = convert_cv_qt(frame.cv_img)
-
         for video_widget in self.video_widgets:
             if video_widget.cam_index == frame.cam_index:
-                video_widget.setPixmap(qt_img.scaled(
-                    video_widget.frameGeometry().width(),
-                    video_widget.frameGeometry().height(),
-                    Qt.KeepAspectRatio))
+                video_widget.show_frame(frame)
 
     @pyqtSlot(int)
     def set_as_big_video(self, cam_index: int):
         """Swap the video with the given cam_index and the big video"""
-        self.video_widgets[0].cam_index = cam_index
+        self.video_widgets[0].set_cam_index(cam_index)
         self.big_video_changed_signal.emit(cam_index)
 
 
 class VideoWidget(QLabel):
     update_big_video_signal = pyqtSignal(int)
 
-    def __init__(self, cam_index: int, is_big: bool):
+    def __init__(self, cam_index: int, is_big: bool, display_pipeline: DisplayPipeline = None):
         super().__init__()
 
         self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
 
         self.cam_index = cam_index
         self.is_big = is_big
+        self.display_pipeline = display_pipeline
 
         # Swap this video with the big video on click
         self.mousePressEvent = lambda event: self.update_big_video_signal.emit(self.cam_index)
+
+    def set_cam_index(self, cam_index: int):
+        self.cam_index = cam_index
+        if self.isVisible():
+            self.register_display_target()
+
+    def show_frame(self, frame: Frame):
+        width, height = self.width(), self.height()
+
+        # Use the image rendered at this widget's size off the gui thread if there is one
+        rendered = frame.display_images.get((width, height))
+        if rendered is not None:
+            self.setPixmap(QtGui.QPixmap.fromImage(rendered.image))
+        else:
+            self.setPixmap(convert_cv_qt(frame.cv_img, width, height))
+
+    def register_display_target(self):
+        """Tell the display pipeline which camera this widget shows and at what size"""
+        if self.display_pipeline is not None:
+            self.display_pipeline.set_target(self, self.cam_index, self.width(), self.height())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.isVisible():
+            self.register_display_target()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.register_display_target()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        # Hidden widgets (e.g. on another tab) don't need frames rendered for them
+        if self.display_pipeline is not None:
+            self.display_pipeline.remove_target(self)
         
\ No newline at end of file
@@ -0,0 +1,165 @@
+import datetime
+import json
+import queue
+import threading
+import typing as t
+from os import path, listdir, makedirs
+
+import cv2
+import numpy as np
+
+from gui.data_classes import Frame
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# Frames per chunk file
+CHUNK_SIZE = 100
+
+JPEG_QUALITY = 90
+
+# Frames and events waiting to be written. When full, new frames and events are dropped rather than blocking the
+# video readers or the control loop
+QUEUE_SIZE = 256
+
+EVENTS_FILENAME = 'events.jsonl'
+CHUNK_FORMAT = 'frames_{:05d}.npz'
+
+
+def new_recording_path() -> str:
+    return path.abspath(datetime.datetime.now().strftime("recordings/%Y-%m-%d_%H%M%S_session"))
+
+
+class SessionRecorder:
+    """
+    Records timestamped camera frames, vehicle state and the RC inputs sent to the vehicle, for replaying tasks
+    offline with recording.replay.
+
+    A recording is a directory of chunk files, each an .npz of CHUNK_SIZE JPEG-encoded frames stored back to back
+    (data, offsets, timestamps, cam_indices), plus events.jsonl with one state change or command per line.
+    All timestamps are time.monotonic() seconds. Encoding and writing happen on a background thread.
+    """
+
+    def __init__(self):
+        self.recording_path = None
+        self.dropped_frames = 0
+        self.dropped_events = 0
+
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+
+    def is_recording(self) -> bool:
+        return self._thread is not None
+
+    def start(self, recording_path: t.Optional[str] = None):
+        if self.is_recording():
+            return
+
+        self.recording_path = recording_path or new_recording_path()
+        makedirs(self.recording_path, exist_ok=True)
+        self.dropped_frames = 0
+        self.dropped_events = 0
+
+        # A fresh queue, so nothing left from the last session, like its stop sentinel, ends up in this one
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._write_loop, args=(self.recording_path, self._queue),
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f'Recording session to {self.recording_path}')
+
+    def stop(self):
+        if not self.is_recording():
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        logger.info(f'Session recording stopped, {self.dropped_frames} frames and {self.dropped_events} events dropped')
+
+    def record_frame(self, frame: Frame):
+        """Queue a frame. Safe to call from any thread"""
+        if not self.is_recording():
+            return
+        # Only the captured image is recorded, don't keep the rendered one queued
+        frame = Frame(frame.cv_img, frame.cam_index, timestamp=frame.timestamp)
+        try:
+            self._queue.put_nowait(('frame', frame))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def record_event(self, timestamp: float, event_type: str, **fields):
+        """Queue a state change or command. Safe to call from any thread"""
+        if not self.is_recording():
+            return
+        try:
+            self._queue.put_nowait(('event', {'t': timestamp, 'type': event_type, **fields}))
+        except queue.Full:
+            self.dropped_events += 1
+
+    def _write_loop(self, recording_path: str, items: queue.Queue):
+        chunk_index = 0
+        encoded, timestamps, cam_indices = [], [], []
+
+        def flush():
+            nonlocal chunk_index
+            if not encoded:
+                return
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(data) for data in encoded])
+            np.savez(path.join(recording_path, CHUNK_FORMAT.format(chunk_index)),
+                     data=np.concatenate(encoded),
+                     offsets=offsets,
+                     timestamps=np.array(timestamps, dtype=np.float64),
+                     cam_indices=np.array(cam_indices, dtype=np.int16))
+            chunk_index += 1
+            encoded.clear()
+            timestamps.clear()
+            cam_indices.clear()
+
+        with open(path.join(recording_path, EVENTS_FILENAME), 'w') as events_file:
+            while True:
+                item = items.get()
+                if item is None:
+                    break
+
+                kind, value = item
+                if kind == 'event':
+                    events_file.write(json.dumps(value) + '\n')
+                    continue
+
+                ret, data = cv2.imencode('.jpg', value.cv_img, (cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY))
+                if not ret:
+                    continue
+                encoded.append(data.reshape(-1))
+                timestamps.append(value.timestamp)
+                cam_indices.append(value.cam_index)
+
+                if len(encoded) >= CHUNK_SIZE:
+                    flush()
+
+            flush()
+
+
+class Recording:
+    """Reads a recording made by SessionRecorder"""
+
+    def __init__(self, recording_path: str):
+        self.recording_path = recording_path
+        self.chunk_files = sorted(f for f in listdir(recording_path) if f.startswith('frames_') and f.endswith('.npz'))
+
+    def frames(self, cam_index: t.Optional[int] = None) -> t.Iterator[Frame]:
+        """Decode frames in timestamp order, optionally from one camera only. Only one chunk is held in memory"""
+        for chunk_file in self.chunk_files:
+            with np.load(path.join(self.recording_path, chunk_file)) as chunk:
+                data, offsets = chunk['data'], chunk['offsets']
+                timestamps, cam_indices = chunk['timestamps'], chunk['cam_indices']
+
+            for i in np.argsort(timestamps, kind='stable'):
+                if cam_index is not None and cam_indices[i] != cam_index:
+                    continue
+                cv_img = cv2.imdecode(data[offsets[i]:offsets[i + 1]], cv2.IMREAD_COLOR)
+                yield Frame(cv_img, int(cam_indices[i]), timestamp=float(timestamps[i]))
+
+    def events(self) -> t.List[dict]:
+        with open(path.join(self.recording_path, EVENTS_FILENAME), 'r') as events_file:
+            return [json.loads(line) for line in events_file if line.strip()]
@@ -0,0 +1,166 @@
+import dataclasses
+import time
+import typing as t
+
+from recording.recorder import Recording
+from tasks.base_task import BaseTask
+from vehicle.constants import InputChannel, Relay, Camera
+
+PERIODIC_FREQUENCY = 30
+
+
+class ReplayClock:
+    """Recorded time for tasks being replayed. Advanced by the replay engine instead of by the wall clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StubVehicle:
+    """
+    Stands in for VehicleControl when replaying a task. It is always connected and armed, and keeps every
+    command it receives along with the replay time it was sent at
+    """
+
+    def __init__(self, clock: ReplayClock):
+        self.clock = clock
+        self.mode = "MANUAL"
+        self.rc_inputs: t.List[t.Tuple[float, t.Dict[InputChannel, float]]] = []
+        self.modes: t.List[t.Tuple[float, str]] = []
+        self.relays: t.List[t.Tuple[float, Relay, bool]] = []
+        self.rc_input_callbacks = []
+        self.link_health = None
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_armed(self) -> bool:
+        return True
+
+    def register_rc_input_callback(self, callback):
+        self.rc_input_callbacks.append(callback)
+
+    def set_rc_inputs(self, values: t.Dict[InputChannel, float],
+                      event_times: t.Optional[t.Dict[InputChannel, float]] = None) -> None:
+        for callback in self.rc_input_callbacks:
+            callback(values)
+
+        for channel, val in values.items():
+            if not -1 <= val <= 1:
+                raise ValueError(f"Inputs must be between -1 and 1, not {val}")
+        self.rc_inputs.append((self.clock(), dict(values)))
+
+    def stop_thrusters(self) -> None:
+        self.set_rc_inputs({channel: 0 for channel in (InputChannel.FORWARD, InputChannel.LATERAL,
+                                                       InputChannel.THROTTLE, InputChannel.YAW,
+                                                       InputChannel.PITCH, InputChannel.ROLL)})
+
+    def set_mode(self, mode: str) -> None:
+        self.mode = mode
+        self.modes.append((self.clock(), mode))
+
+    def set_relay(self, relay: Relay, state: bool) -> None:
+        self.relays.append((self.clock(), relay, state))
+
+    def set_relays(self, states: t.Dict[Relay, bool]) -> None:
+        for relay, state in states.items():
+            self.set_relay(relay, state)
+
+    def turn_off_relays(self) -> None:
+        self.set_relays({relay: False for relay in Relay})
+
+    def set_camera_enabled(self, cam: Camera, enabled: bool) -> None:
+        pass
+
+    def send_camera_state(self) -> None:
+        pass
+
+
+@dataclasses.dataclass
+class ReplayResult:
+    frames: int
+    ticks: int
+    start_time: t.Optional[float]  # Recorded time of the first frame
+    duration: float  # Recorded seconds replayed
+    wall_time: float  # Seconds the replay took
+    vision_time: float  # Seconds spent in handle_frame
+    finished_at: t.Optional[float]  # Recorded time the task reported it was finished, if it did
+    rc_inputs: t.List[t.Tuple[float, t.Dict[InputChannel, float]]]
+    modes: t.List[t.Tuple[float, str]]
+
+    @property
+    def speedup(self) -> float:
+        return self.duration / self.wall_time if self.wall_time > 0 else float('inf')
+
+    @property
+    def vision_fps(self) -> float:
+        return self.frames / self.vision_time if self.vision_time > 0 else float('inf')
+
+
+class ReplayEngine:
+    """
+    Runs a task headlessly against a recording, as fast as the cpu allows. Scheduler ticks are interleaved with
+    recorded frames at PERIODIC_FREQUENCY on the recorded clock, and handle_frame runs synchronously, so a replay
+    of the same recording always makes the same decisions.
+
+    task_factory is called with the stub vehicle and must return the task, e.g. ButtonDocking.
+    """
+
+    def __init__(self, recording: Recording, task_factory: t.Callable[[StubVehicle], BaseTask],
+                 cam_index: t.Optional[int] = None, frequency: int = PERIODIC_FREQUENCY):
+        self.recording = recording
+        self.task_factory = task_factory
+        self.cam_index = cam_index
+        self.period = 1 / frequency
+
+    def run(self, stop_when_finished: bool = True) -> ReplayResult:
+        clock = ReplayClock()
+        vehicle = StubVehicle(clock)
+        task = self.task_factory(vehicle)
+        task.clock = clock
+
+        frames = ticks = 0
+        vision_time = 0.0
+        start_time = next_tick = finished_at = None
+        wall_start = time.perf_counter()
+
+        for frame in self.recording.frames(self.cam_index):
+            if start_time is None:
+                start_time = next_tick = clock.now = frame.timestamp
+                task.initialize()
+
+            # Run every scheduler tick due before this frame
+            while next_tick <= frame.timestamp and finished_at is None:
+                clock.now = next_tick
+                task.periodic()
+                ticks += 1
+                if task.is_finished():
+                    finished_at = clock.now
+                next_tick += self.period
+
+            if finished_at is not None and stop_when_finished:
+                break
+
+            clock.now = frame.timestamp
+            vision_start = time.perf_counter()
+            task.handle_frame(frame)
+            vision_time += time.perf_counter() - vision_start
+            frames += 1
+
+        if start_time is not None:
+            task.end()
+
+        return ReplayResult(
+            frames=frames,
+            ticks=ticks,
+            start_time=start_time,
+            duration=clock.now - start_time if start_time is not None else 0.0,
+            wall_time=time.perf_counter() - wall_start,
+            vision_time=vision_time,
+            finished_at=finished_at,
+            rc_inputs=vehicle.rc_inputs,
+            modes=vehicle.modes,
+        )
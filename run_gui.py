@@ -9,6 +9,7 @@ from gui.app import App
 from gui.theme import *
 from gui.data_classes import VideoSource
 from util import config_parser, data_path
+from vehicle.vehicle_control import HOST
 
 
 def parse_args(arg_list):
@@ -17,6 +18,7 @@ def parse_args(arg_list):
     parser.add_argument('-c', '--cameras', type=config_parser('camera'), help='The camera configuration file to use located in camera/config')
     parser.add_argument('-f', '--fullscreen', action='store_true', help='Runs the app in fullscreen mode')
     parser.add_argument('-m', '--maximize', action='store_true', help='Runs the app in maximized mode')
+    parser.add_argument('--rov-host', type=str, default=HOST, help='Address of the ROV\'s relay and camera servers, e.g. 127.0.0.1 for scripts/command_server.py')
     return parser.parse_args(arg_list)
 
 def run_gui(args):
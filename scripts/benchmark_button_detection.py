@@ -0,0 +1,78 @@
+'''Runs get_button_contour and ButtonDetector over recorded dual cam frames, and prints how far ButtonDetector's
+centroid is from the center of get_button_contour's box, how often it falls outside that box (a different blob)
+and the time each takes per frame. Frames are read from a video file or a directory of images.
+
+Run from the repository root:
+    python -m scripts.benchmark_button_detection path/to/recording.mkv'''
+
+import argparse
+import statistics
+import time
+from os import path, listdir
+
+import cv2
+
+from tasks.button_docking import ButtonDetector, get_button_contour
+
+
+def read_frames(source):
+    if path.isdir(source):
+        for filename in sorted(listdir(source)):
+            image = cv2.imread(path.join(source, filename))
+            if image is not None:
+                yield image
+    else:
+        capture = cv2.VideoCapture(source)
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield frame
+        capture.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the old and new button detectors on recorded frames')
+    parser.add_argument('source', help='Video file or directory of images')
+    args = parser.parse_args()
+
+    detector = ButtonDetector()
+    old_times, new_times, errors = [], [], []
+    missed_by_new = missed_by_old = other_blob = 0
+
+    for frame in read_frames(args.source):
+        start = time.perf_counter()
+        best_contour, high_score = get_button_contour(frame)
+        old_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        detection = detector.detect(frame)
+        new_times.append(time.perf_counter() - start)
+
+        if high_score > 0 and detection is not None:
+            x, y, w, h = cv2.boundingRect(best_contour)
+            errors.append(((x + w / 2 - detection.x) ** 2 + (y + h / 2 - detection.y) ** 2) ** 0.5)
+            if not (x <= detection.x < x + w and y <= detection.y < y + h):
+                other_blob += 1
+        elif high_score > 0:
+            missed_by_new += 1
+        elif detection is not None:
+            missed_by_old += 1
+
+    if not old_times:
+        print('No frames read')
+        return
+
+    old_ms = statistics.mean(old_times) * 1000
+    new_ms = statistics.mean(new_times) * 1000
+    print(f'Frames: {len(old_times)}')
+    print(f'get_button_contour: {old_ms:.2f} ms/frame')
+    print(f'ButtonDetector: {new_ms:.2f} ms/frame ({old_ms / new_ms:.1f}x faster)')
+    if errors:
+        print(f'Center distance: median {statistics.median(errors):.1f} px, max {max(errors):.1f} px')
+        print(f'Centroid outside get_button_contour\'s box: {other_blob} / {len(errors)}')
+    print(f'Found only by get_button_contour: {missed_by_new}, only by ButtonDetector: {missed_by_old}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''Times the controller half of the scheduler's hot path, from the gamepad state to the dict ControllerDrive passes
+to set_rc_inputs, for each controller profile. The vectorized InputMapping is compared to the previous per-axis path, which
+called Controller.get (apply_curve) for every channel, and the largest difference between them is printed.
+
+No gamepad is needed, random states are written straight into each controller's InputState.
+
+Run from the repository root:
+    python -m scripts.benchmark_controller_mapping --iterations 100000'''
+
+import argparse
+import time
+
+import numpy as np
+
+from controller.controller import Controller
+from controller.mapping import to_channel_dict
+from controller.profile import BUTTON, TRIGGER, load_profiles
+
+NUM_STATES = 64
+
+
+def per_axis_inputs(controller):
+    '''The inputs as get_vehicle_inputs computed them before InputMapping, one Controller.get per use of a control'''
+    inputs = {}
+    for mapping in controller.profile.mapping:
+        active = mapping.modifier is None or controller.get(mapping.modifier) == mapping.modifier_held
+        value = controller.get(mapping.control) * mapping.sensitivity if active else 0
+        inputs[mapping.channel] = inputs.get(mapping.channel, 0) + value
+    return inputs
+
+
+def vectorized_inputs(controller):
+    return to_channel_dict(controller.get_input_vector())
+
+
+def random_states(controller, rng):
+    '''Snapshots with sticks in [-1, 1], triggers in [0, 1] and buttons pressed at random'''
+    states = []
+    for _ in range(NUM_STATES):
+        state = np.zeros(len(controller.state.index))
+        for control, i in controller.state.index.items():
+            kind = controller.profile.kind(control)
+            if kind == BUTTON:
+                state[i] = rng.integers(0, 2)
+            elif kind == TRIGGER:
+                state[i] = rng.uniform(0, 1)
+            else:
+                state[i] = rng.uniform(-1, 1)
+        states.append(state)
+    return states
+
+
+def load_state(controller, state):
+    for control, i in controller.state.index.items():
+        controller.state.set(control, state[i])
+    controller.state.commit()
+
+
+def time_path(controller, path, states, iterations):
+    '''Microseconds per call, with the state changing every call like it would while driving'''
+    # What commit publishes, set directly rather than staging every control
+    frames = [(state, np.zeros_like(state)) for state in states]
+    start = time.perf_counter()
+    for i in range(iterations):
+        controller.state._frame = frames[i % len(frames)]
+        path(controller)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the controller to vehicle input mapping')
+    parser.add_argument('--iterations', type=int, default=100_000, help='Calls timed per path and controller')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"controller":<16}{"per-axis us":>14}{"vectorized us":>16}{"speedup":>10}{"max diff":>12}')
+    for profile in load_profiles():
+        controller = Controller(profile, lambda: 0)
+        states = random_states(controller, rng)
+
+        max_diff = 0.0
+        for state in states:
+            load_state(controller, state)
+            expected = per_axis_inputs(controller)
+            actual = vectorized_inputs(controller)
+            max_diff = max(max_diff, max(abs(np.clip(expected[channel], -1, 1) - actual[channel])
+                                         for channel in expected))
+
+        per_axis = time_path(controller, per_axis_inputs, states, args.iterations)
+        vectorized = time_path(controller, vectorized_inputs, states, args.iterations)
+        print(f'{profile.name:<16}{per_axis:>14.2f}{vectorized:>16.2f}{per_axis / vectorized:>9.1f}x'
+              f'{max_diff:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+'''Measures pilot input latency, from an input event to the RC override carrying it being written to the link, per
+RC channel. Synthetic gamepad events are injected into a controller with the Xbox profile at a steady rate, the way a
+real gamepad reports, while ControllerDrive runs on the task scheduler against a simulated vehicle, so no gamepad, SITL
+or gui is needed. Injected events are handled as soon as they're made, so the kernel to reader thread wakeup isn't
+included.
+
+A continuous sweep shows how old the newest input is when it's sent. With --steps the forward stick is moved in
+isolated steps at random times instead, so each one waits for the next scheduler tick like a quick stick flick would.
+
+Run from the repository root:
+    python -m scripts.benchmark_input_latency --duration 5'''
+
+import argparse
+import math
+import random
+import threading
+import time
+from os import path
+
+from PyQt5.QtCore import QCoreApplication
+
+from controller.controller import Controller
+from controller.gamepad import encode_events
+from controller.profile import PROFILES_PATH, load_profile
+from tasks.controller_drive import ControllerDrive
+from tasks.scheduler import TaskScheduler
+from vehicle.constants import InputChannel
+from vehicle.simulator import SimulatedVehicle
+from vehicle.vehicle_control import VehicleControl
+
+# Raw codes swept by the injected events, with their raw (center, amplitude) and sweep frequency in Hz
+SWEEPS = {
+    'ABS_Y': ((0, 32767), 0.5),  # Forward
+    'ABS_RX': ((0, 32767), 0.3),  # Yaw
+    'ABS_RZ': ((512, 511), 0.2),  # Throttle
+}
+
+
+def wait_for(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Timed out waiting for {what}')
+        time.sleep(0.001)
+
+
+def inject(controller: Controller, rate: float, stop: threading.Event):
+    '''Feed one frame of swept stick and trigger positions every 1 / rate seconds until stop is set'''
+    start = time.monotonic()
+    deadline = start
+    while not stop.is_set():
+        now = time.monotonic()
+        states = {code: int(center + amplitude * math.sin((now - start) * frequency * 2 * math.pi))
+                  for code, ((center, amplitude), frequency) in SWEEPS.items()}
+        controller.inject_events(encode_events(states, now))
+
+        deadline += 1 / rate
+        time.sleep(max(0.0, deadline - time.monotonic()))
+
+
+def inject_steps(controller: Controller, stop: threading.Event):
+    '''Move the forward stick between two positions at random intervals until stop is set'''
+    position = 0
+    while not stop.is_set():
+        position = 16384 if position == 0 else 0
+        controller.inject_events(encode_events({'ABS_Y': position}))
+        time.sleep(random.uniform(0.1, 0.2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark input event to RC override latency')
+    parser.add_argument('-p', '--port', type=int, default=14552, help='Local UDP port for MAVLink')
+    parser.add_argument('-d', '--duration', type=float, default=5, help='Seconds to inject events for')
+    parser.add_argument('-r', '--rate', type=float, default=250, help='Injected input frames per second')
+    parser.add_argument('--steps', action='store_true', help='Inject isolated steps instead of a continuous sweep')
+    args = parser.parse_args()
+
+    app = QCoreApplication([])
+
+    simulator = SimulatedVehicle(args.port)
+    simulator.start()
+    vehicle = VehicleControl(args.port, host='127.0.0.1')
+    wait_for(lambda: vehicle.connected, 5, 'the first heartbeat')
+    vehicle.arm()
+    wait_for(lambda: vehicle.armed, 5, 'arming')
+
+    # Never started, events only come from inject
+    controller = Controller(load_profile(path.join(PROFILES_PATH, 'xbox.json')), lambda: 0)
+
+    scheduler = TaskScheduler(vehicle)
+    scheduler.default_task = ControllerDrive(vehicle, controller, lambda: 0)
+    scheduler.start()
+
+    stop = threading.Event()
+    if args.steps:
+        injector = threading.Thread(target=inject_steps, args=(controller, stop), daemon=True)
+    else:
+        injector = threading.Thread(target=inject, args=(controller, args.rate, stop), daemon=True)
+    injector.start()
+    time.sleep(args.duration)
+    stop.set()
+    injector.join()
+    scheduler.stop()
+
+    print(f'{"Steps" if args.steps else f"{args.rate:.0f} Hz input frames"} for {args.duration:.0f} s')
+    print(f'{"channel":<10}{"changes":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}{"to task ms":>12}')
+    for channel_id, stats in sorted(vehicle.input_latency.get_stats().items()):
+        print(f'{InputChannel(channel_id).name:<10}{stats.count:>9}{stats.p50:>9.2f}{stats.p95:>9.2f}'
+              f'{stats.p99:>9.2f}{stats.max:>9.2f}{stats.sampled_p50:>12.2f}')
+
+    vehicle.stop_thrusters()
+    vehicle.stop()
+    simulator.stop()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''Runs VehicleControl and the task scheduler against a simulated vehicle on local UDP, with no SITL, Gazebo or
+gui, and prints how long commands take to show up in telemetry and how fast the scheduler loop runs. Takes a few
+seconds on any Linux machine.
+
+Run from the repository root:
+    python -m scripts.benchmark_vehicle --trials 50'''
+
+import argparse
+import math
+import random
+import statistics
+import threading
+import time
+
+from PyQt5.QtCore import QCoreApplication, Qt
+
+from tasks.base_task import BaseTask
+from tasks.scheduler import TaskScheduler, SPIN_BUDGET_NS
+from vehicle.command_server import CommandServer, parse_relays
+from vehicle.constants import InputChannel, Relay
+from vehicle.simulator import SimulatedVehicle, STREAM_RATES
+from vehicle.vehicle_control import VehicleControl, RELAY_SOCKET_PORT
+
+
+class SweepTask(BaseTask):
+    """Sweeps every thruster input each tick, so every RC override is a change"""
+
+    def periodic(self):
+        value = 0.5 * math.sin(self.clock() * 2 * math.pi)
+        self.vehicle.set_rc_inputs({channel: value for channel in (InputChannel.FORWARD, InputChannel.LATERAL,
+                                                                   InputChannel.YAW)})
+
+
+def wait_for(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Timed out waiting for {what}')
+        time.sleep(0.001)
+
+
+def summarize(name: str, latencies):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f'{name}: mean {statistics.mean(latencies):.1f} ms, median {statistics.median(latencies):.1f} ms, '
+          f'p95 {p95:.1f} ms, max {latencies[-1]:.1f} ms ({len(latencies)} samples)')
+
+
+def measure_command_latency(vehicle: VehicleControl, trials: int, telemetry_rate: float):
+    """Seconds from set_rc_inputs to the first VFR_HUD reporting the new throttle"""
+    expected = [None]
+    arrived = threading.Event()
+
+    def on_vfr_hud(depth):
+        if expected[0] is not None and depth.throttle == expected[0]:
+            arrived.set()
+
+    vehicle.telemetry.subscribe('VFR_HUD', on_vfr_hud)
+    latencies = []
+    for i in range(trials):
+        throttle = 0.5 if i % 2 == 0 else 0.25
+        # Start at a random point in the telemetry period, otherwise every trial starts just after a VFR_HUD
+        time.sleep(random.uniform(0, 1 / telemetry_rate))
+        arrived.clear()
+        expected[0] = int(throttle * 100)
+        start = time.monotonic()
+        vehicle.set_rc_inputs({InputChannel.THROTTLE: throttle})
+        if not arrived.wait(2):
+            raise TimeoutError('Throttle never showed up in VFR_HUD')
+        latencies.append(time.monotonic() - start)
+    vehicle.telemetry.unsubscribe('VFR_HUD', on_vfr_hud)
+    vehicle.set_rc_inputs({InputChannel.THROTTLE: 0})
+    return latencies
+
+
+def check_turn_off_relays(vehicle: VehicleControl, relay_server: CommandServer):
+    """Turning off every relay, as on disarm, has to be a single write to the relay server"""
+    vehicle.set_relays({relay: True for relay in Relay})
+    wait_for(lambda: len(relay_server.received) == len(Relay), 5, 'the relays to turn on')
+
+    writes = vehicle.relay_channel.get_stats().writes
+    start = time.monotonic()
+    vehicle.turn_off_relays()
+    wait_for(lambda: len(relay_server.received) == 2 * len(Relay), 5, 'the relays to turn off')
+    elapsed = time.monotonic() - start
+    writes = vehicle.relay_channel.get_stats().writes - writes
+    if writes != 1:
+        raise AssertionError(f'turn_off_relays took {writes} writes, expected 1')
+    print(f'Turned off {len(Relay)} relays in {writes} write, {elapsed * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vehicle I/O and the scheduler against a simulated vehicle')
+    parser.add_argument('-p', '--port', type=int, default=14551, help='Local UDP port for MAVLink')
+    parser.add_argument('-n', '--trials', type=int, default=50, help='Command to telemetry round trips')
+    parser.add_argument('-d', '--duration', type=float, default=3, help='Seconds to run the scheduler for')
+    parser.add_argument('--spin-us', type=int, default=SPIN_BUDGET_NS // 1000,
+                        help='Microseconds the scheduler spins before each deadline instead of sleeping')
+    parser.add_argument('--telemetry-rate', type=float, default=STREAM_RATES['VFR_HUD'],
+                        help='VFR_HUD rate in Hz, which bounds the command to telemetry latency')
+    args = parser.parse_args()
+
+    app = QCoreApplication([])
+
+    simulator = SimulatedVehicle(args.port, stream_rates={**STREAM_RATES, 'VFR_HUD': args.telemetry_rate})
+    simulator.start()
+    relay_server = CommandServer(RELAY_SOCKET_PORT, parse_relays)
+    relay_server.start()
+    vehicle = VehicleControl(args.port, host='127.0.0.1')
+
+    start = time.monotonic()
+    wait_for(lambda: vehicle.connected, 5, 'the first heartbeat')
+    print(f'Connected in {(time.monotonic() - start) * 1000:.0f} ms')
+
+    start = time.monotonic()
+    vehicle.arm()
+    wait_for(lambda: vehicle.armed, 5, 'arming')
+    print(f'Armed in {(time.monotonic() - start) * 1000:.0f} ms (heartbeat at {STREAM_RATES["HEARTBEAT"]} Hz)')
+
+    transitions = []
+    vehicle.mode_transition_signal.connect(transitions.append, Qt.DirectConnection)
+    vehicle.set_mode('ALT_HOLD')
+    wait_for(lambda: transitions and transitions[-1].mode == 'ALT_HOLD', 5, 'ALT_HOLD')
+    transition = transitions[-1]
+    if transition.request is not None:
+        print(f'Mode change acked in {transition.ack_latency * 1000:.1f} ms, '
+              f'in effect in {transition.confirm_latency * 1000:.0f} ms')
+
+    summarize('Command to telemetry', measure_command_latency(vehicle, args.trials, args.telemetry_rate))
+    check_turn_off_relays(vehicle, relay_server)
+
+    # Scheduler loop at its normal rate, sending a changing override every tick
+    stats = []
+    scheduler = TaskScheduler(vehicle, spin_ns=args.spin_us * 1000)
+    scheduler.stats_signal.connect(stats.append, Qt.DirectConnection)
+    scheduler.default_task = SweepTask(vehicle)
+    overrides_before = simulator.overrides_received
+    scheduler.start()
+    time.sleep(args.duration)
+    scheduler.stop()
+    overrides = simulator.overrides_received - overrides_before
+
+    if stats:
+        last = stats[-1]
+        print(f'Scheduler: {1000 / last.period_mean:.1f} Hz, jitter p99 {last.jitter_p99:.2f} ms, '
+              f'task {last.task_periodic_mean:.3f} ms, '
+              f'{last.overruns_total} overruns')
+    print(f'Vehicle received {overrides / args.duration:.1f} overrides/s, RC output {vehicle.rc_output.get_stats()}')
+
+    # Scheduler work without the rate limit, to show the headroom
+    task = SweepTask(vehicle)
+    iterations = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < 1:
+        task.periodic()
+        iterations += 1
+    print(f'Unthrottled scheduler work: {iterations / (time.perf_counter() - start):.0f} iterations/s')
+
+    health = vehicle.link_monitor.get_health()
+    print(f'Link: {health.packet_loss * 100:.1f}% loss, RTT '
+          f'{health.rtt * 1000:.2f} ms' if health.rtt is not None else 'Link: no RTT yet')
+
+    vehicle.stop_thrusters()
+    vehicle.stop()
+    relay_server.stop()
+    simulator.stop()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''Compares the QLabel and OpenGL big video widgets. Synthetic frames are shown and repainted as fast as possible,
+and the displayed FPS and main thread cpu time per frame are printed for each widget.
+
+Frames for the QLabel widget are rendered at widget size ahead of time, the same way the capture readers do it off
+the gui thread, so only main thread work is compared. The off-thread render cost is printed separately.
+
+Run from the repository root:
+    python -m scripts.benchmark_video_widget --seconds 5
+Set LIBGL_ALWAYS_SOFTWARE=1 to run the OpenGL widget on software Mesa.'''
+
+import argparse
+import sys
+import time
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from gui.data_classes import Frame
+from gui.display_pipeline import DisplayPipeline
+from gui.widgets.gl_video_widget import GLVideoWidget
+from gui.widgets.video_widgets import VideoWidget
+
+NUM_FRAMES = 8
+
+
+def make_frames(width, height):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(NUM_FRAMES)]
+
+
+def run_widget(app, widget, frames, seconds):
+    '''Show frames on the widget for the given number of seconds. Returns (fps, main thread cpu ms per frame)'''
+    shown = 0
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+
+    while time.perf_counter() - start_wall < seconds:
+        widget.show_frame(frames[shown % len(frames)])
+        widget.repaint()  # Paint synchronously so the cost lands in this loop
+        app.processEvents()
+        shown += 1
+
+    wall = time.perf_counter() - start_wall
+    cpu = time.thread_time() - start_cpu
+    return shown / wall, cpu / shown * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the QLabel and OpenGL video widgets')
+    parser.add_argument('--seconds', type=float, default=5, help='How long to run each widget')
+    parser.add_argument('--width', type=int, default=2560, help='Frame width')
+    parser.add_argument('--height', type=int, default=960, help='Frame height')
+    parser.add_argument('--widget-width', type=int, default=1280, help='Widget width')
+    parser.add_argument('--widget-height', type=int, default=720, help='Widget height')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    cv_imgs = make_frames(args.width, args.height)
+
+    # QLabel path
+    pipeline = DisplayPipeline()
+    label = VideoWidget(0, True, pipeline)
+    label.resize(args.widget_width, args.widget_height)
+    label.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    label_frames = [Frame(cv_img, 0, pipeline.render(cv_img, 0)) for cv_img in cv_imgs]
+    render_ms = (time.perf_counter() - start) / len(cv_imgs) * 1000
+
+    label_fps, label_cpu = run_widget(app, label, label_frames, args.seconds)
+    label.close()
+
+    # OpenGL path
+    gl_widget = GLVideoWidget(0, True)
+    gl_widget.resize(args.widget_width, args.widget_height)
+    gl_widget.show()
+    app.processEvents()
+
+    gl_frames = [Frame(cv_img, 0) for cv_img in cv_imgs]
+    gl_fps, gl_cpu = run_widget(app, gl_widget, gl_frames, args.seconds)
+    gl_widget.close()
+
+    print(f'Frames: {args.width}x{args.height}, widget: {args.widget_width}x{args.widget_height}')
+    print(f'QLabel: {label_fps:.1f} fps, {label_cpu:.2f} ms main thread cpu/frame '
+          f'(+{render_ms:.2f} ms/frame rendering off the gui thread)')
+    print(f'OpenGL: {gl_fps:.1f} fps, {gl_cpu:.2f} ms main thread cpu/frame')
+
+
+if __name__ == '__main__':
+    main()
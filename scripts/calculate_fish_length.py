@@ -1,11 +1,10 @@
-import math
 from os import path
-import statistics
 import re
 from collections import defaultdict
 from vision.stereo.stereo_util import Side
 from vision.stereo.fish_features import refine_coords
 import cv2
+import numpy as np
 from vision.stereo.params import StereoParameters
 
 STEREO_BASELINE = 2.375  # cm
@@ -20,6 +19,9 @@ CY = 480
 
 ACTUAL = 31
 
+# Triangulate with the rectified disparity formula rather than cv2.triangulatePoints' SVD
+CLOSED_FORM = False
+
 
 def pixel_to_film_coords(point, fx, fy, cx, cy):
     return (
@@ -58,53 +60,22 @@ if __name__ == "__main__":
             if len(test_dict[k].keys()) != 2:
                 test_dict.pop(k)
 
-        x_diffs = []
-        fish_lengths = []
-        for k, v in test_dict.items():
-            left_points = v["left"]
-            right_points = v["right"]
-            # print(f'../data/stereo/dualcam1filtered/left/{k}.png')
-            # img_l = cv2.imread(f'../data/stereo/dualcam1filtered/left/{k}.png')
-            # img_r = cv2.imread(f'../data/stereo/dualcam1filtered/right/{k}.png')
-
-            # img_l = params.rectify_single(img_l, Side.LEFT)
-            # img_r = params.rectify_single(img_r, Side.RIGHT)
-
-            # img_l = cv2.GaussianBlur(img_l, (15, 15), 0)
-            # img_r = cv2.GaussianBlur(img_r, (15, 15), 0)
-            
-
-            # point1 = get_point_camera_space(left_points[0], right_points[0])
-            # point2 = get_point_camera_space(left_points[1], right_points[1])
-
-            point1 = params.triangulate(left_points[0], right_points[0])
-            point2 = params.triangulate(left_points[1], right_points[1])
-            
-            # xl1, xr1, y1 = refine_coords(img_l, img_r, left_points[0][0], right_points[0][0], left_points[0][1])
-            # point1 = params.triangulate((xl1, y1), (xr1, y1))
-
-            # xl2, xr2, y2 = refine_coords(img_l, img_r, left_points[1][0], right_points[1][0], left_points[1][1])
-            # point2 = params.triangulate((xl2, y2), (xr2, y2))
-            #print(point1, point2)
-
-            x_diffs.append(point2[0] - point1[0])
-            #dist = math.dist(point1, point2) * 1.6909861571441303
-            dist = math.dist(point1, point2) * 2.126447913752668
-            fish_lengths.append(dist)
-            #print(point2[0] - point1[0])
-            #print(f'{point1[0] - point2[0]} ,  {math.dist(point1, point2)}')
-            print()
-
-        mean = statistics.mean(fish_lengths)
-        std_dev = statistics.pstdev(fish_lengths)
+        # Every fish's (head, tail) pixels in each image, triangulated together
+        names = list(test_dict.keys())
+        points_l = np.array([test_dict[k]["left"] for k in names], dtype=np.float64)
+        points_r = np.array([test_dict[k]["right"] for k in names], dtype=np.float64)
+        ends, lengths = params.triangulate_segments(points_l, points_r, closed_form=CLOSED_FORM)
+
+        x_diffs = ends[:, 1, 0] - ends[:, 0, 0]
+        #fish_lengths = lengths * 1.6909861571441303
+        fish_lengths = lengths * 2.126447913752668
+
+        mean = fish_lengths.mean()
+        std_dev = fish_lengths.std()
         print(f"Mean: {mean}")
         print(FOCAL_LENGTH, f"Std Dev: {std_dev} ({round(std_dev/mean*100)}%)")
 
-        num_close = 0
-        for length in fish_lengths:
-            if abs(length - ACTUAL) <= 2:
-                num_close += 1
-        
+        num_close = np.count_nonzero(np.abs(fish_lengths - ACTUAL) <= 2)
         print(f"Num within 2cm: {num_close/len(fish_lengths)}")
         print(len(fish_lengths))
 
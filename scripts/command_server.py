@@ -0,0 +1,45 @@
+'''Stands in for the ROV's relay and camera servers on this machine, printing every command received, so manipulator,
+light and camera controls can be tested without the vehicle. Start the gui with --rov-host 127.0.0.1 to use it.
+
+Run from the repository root:
+    python -m scripts.command_server'''
+
+import argparse
+import time
+
+from vehicle.command_server import CommandServer, parse_relays, parse_json_lines
+from vehicle.constants import Relay
+from vehicle.vehicle_control import RELAY_SOCKET_PORT, CAMERA_SOCKET_PORT
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for the ROV relay and camera servers')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--relay-port', type=int, default=RELAY_SOCKET_PORT)
+    parser.add_argument('--camera-port', type=int, default=CAMERA_SOCKET_PORT)
+    args = parser.parse_args()
+
+    relay_names = {relay.value: relay.name for relay in Relay}
+
+    relay_server = CommandServer(args.relay_port, parse_relays, args.host)
+    relay_server.register_callback(
+        lambda command: print(f'Relay {relay_names.get(command[0], command[0])}: {"on" if command[1] else "off"}'))
+    camera_server = CommandServer(args.camera_port, parse_json_lines, args.host)
+    camera_server.register_callback(lambda command: print(f'Cameras: {command}'))
+
+    relay_server.start()
+    camera_server.start()
+    print(f'Listening for relays on {args.host}:{relay_server.port} and cameras on {args.host}:{camera_server.port}')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay_server.stop()
+        camera_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''Replays a task against a session recorded from the debug tab's "Record Session Data" button, without a vehicle or
+a gui, and prints the vision throughput and the commands the task sent. Use it to benchmark vision code or check
+control decisions on recorded footage.
+
+Run from the repository root:
+    python -m scripts.replay_task recordings/2022-06-20_101500_session --task ButtonDocking --cam 2'''
+
+import argparse
+import json
+
+from recording.recorder import Recording
+from recording.replay import ReplayEngine
+from tasks.button_docking import ButtonDocking
+from tasks.no_button_docking import NoButtonDocking
+
+TASKS = {
+    'ButtonDocking': ButtonDocking,
+    'NoButtonDocking': NoButtonDocking,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a task against a recorded session')
+    parser.add_argument('recording', help='Recording directory')
+    parser.add_argument('-t', '--task', choices=TASKS.keys(), default='ButtonDocking', help='Task to replay')
+    parser.add_argument('-c', '--cam', type=int, default=None, help='Only feed frames from this cam_index')
+    parser.add_argument('--keep-going', action='store_true', help="Don't stop when the task says it's finished")
+    parser.add_argument('-o', '--output', help='Write the commands the task sent to this JSON file')
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    engine = ReplayEngine(recording, TASKS[args.task], cam_index=args.cam)
+    result = engine.run(stop_when_finished=not args.keep_going)
+
+    print(f'Replayed {result.duration:.1f} s of recording in {result.wall_time:.2f} s ({result.speedup:.1f}x)')
+    print(f'{result.frames} frames, {result.ticks} ticks, vision at {result.vision_fps:.1f} fps')
+    if result.finished_at is not None:
+        print(f'Task finished {result.finished_at - result.start_time:.1f} s in')
+    for timestamp, mode in result.modes:
+        print(f'Mode {mode} at {timestamp:.2f}')
+
+    recorded_commands = [event for event in recording.events() if event['type'] == 'rc_inputs']
+    print(f'{len(result.rc_inputs)} commands sent in replay, {len(recorded_commands)} in the recording')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump([{'t': timestamp, 'inputs': {channel.name: val for channel, val in inputs.items()}}
+                       for timestamp, inputs in result.rc_inputs], file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
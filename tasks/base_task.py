@@ -1,3 +1,5 @@
+import time
+
 from vehicle.vehicle_control import VehicleControl
 from gui.data_classes import Frame
 
@@ -7,6 +9,9 @@ class BaseTask:
     def __init__(self, vehicle: VehicleControl):
         self.vehicle = vehicle
 
+        # Tasks should read the time from here (in seconds) so replays can run them on recorded time
+        self.clock = time.monotonic
+
     def initialize(self):
         """Called once whenever the task is (re)started"""
         pass
@@ -24,9 +29,16 @@ class BaseTask:
         return False
 
     def handle_frame(self, frame: Frame):
-        """Called whenever a new frame is received from a camera"""
+        """
+        Called with the newest frame from each camera, on a vision worker thread rather than the scheduler thread.
+        Pass results to periodic() through a LatestValue
+        """
         pass
 
+    def uses_frames(self) -> bool:
+        """Whether the task needs a vision worker, i.e. it overrides handle_frame"""
+        return type(self).handle_frame is not BaseTask.handle_frame
+
     def __str__(self) -> str:
         """Get a readable name of the task"""
         return type(self).__name__
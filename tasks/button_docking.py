@@ -1,11 +1,16 @@
+import dataclasses
 import math
+import typing as t
 
 import numpy as np
 import time
 import cv2
 from gui.data_classes import Frame
 from tasks.base_task import BaseTask
+from tasks.vision_worker import LatestValue
+from vision.tracking import BoxTracker
 from vehicle.vehicle_control import VehicleControl, InputChannel
+from vehicle.constants import Camera, CAM_INDICES
 from logger import root_logger
 
 logger = root_logger.getChild(__name__)
@@ -37,6 +42,35 @@ STOP_HEIGHT_FRACTION = 0.15
 END_WIDTH_FRACTION = 0.3
 END_HEIGHT_FRACTION = 0.3
 
+# Red range of the button in HSV
+BUTTON_LOWER_HSV = np.array([155, 25, 0])
+BUTTON_UPPER_HSV = np.array([179, 255, 255])
+
+# ButtonDetector works on images shrunk by this factor in each dimension
+DECIMATION = 4
+
+# The ROI extends this many button sizes past the last known button on each side
+ROI_MARGIN = 1.5
+MIN_ROI_SIZE = 32  # In decimated pixels
+
+# Blobs with a smaller bounding box than this (in decimated pixels) are noise
+MIN_BLOB_AREA = 4
+
+# Inputs are scaled by this while the MAVLink link is degraded (lossy, slow or attitude/depth stopped arriving), since our
+# commands and the vehicle's state reach us late or not at all
+DEGRADED_SPEED_SCALE = 0.5
+
+# Seconds since the last heartbeat after which we stop and wait, before the connection is declared lost. Heartbeats
+# come at 1 Hz, so this is one missed heartbeat
+HOLD_HEARTBEAT_AGE = 1.5
+
+# Detections per second. The tracker fills in between them so periodic() still steers at the scheduler rate
+DETECTION_RATE = 15
+
+# Don't steer until the track is confirmed (MIN_HITS detections), nor once it has coasted without detections long
+# enough for its confidence to fall below this. With a confirmed track this is about 0.6 s of coasting
+MIN_TRACK_CONFIDENCE = 0.3
+
 
 def get_button_contour(cv_img):
     h, w, _ = cv_img.shape
@@ -65,10 +99,121 @@ def get_button_contour(cv_img):
         if w < width and h < height and w * h > high_score:
             high_score = w * h
             best_contour = contour
-    print(high_score)
     return best_contour, high_score
 
 
+@dataclasses.dataclass
+class ButtonDetection:
+    """A red blob found by ButtonDetector, in full resolution pixels of the right half of the frame"""
+    x: float  # Sub-pixel centroid
+    y: float
+    width: int  # Bounding box of its outline
+    height: int
+    area: float  # Bounding box area, the score get_button_contour ranks blobs by
+
+
+class ButtonDetector:
+    """
+    A faster version of get_button_contour. It works on a decimated image, searches a region of interest around
+    the last detection before falling back to the whole frame, and picks the blob from connectedComponentsWithStats
+    instead of looping over contours in Python. The threshold and bounding box scoring are get_button_contour's, so
+    the same blob wins.
+    """
+
+    def __init__(self, decimation: int = DECIMATION):
+        self.decimation = decimation
+        self.last_detection: t.Optional[ButtonDetection] = None
+
+    def reset(self):
+        self.last_detection = None
+
+    def _roi(self, width: int, height: int) -> t.Optional[t.Tuple[int, int, int, int]]:
+        """Returns (x0, y0, x1, y1) around the last detection in decimated pixels, or None to search everything"""
+        if self.last_detection is None:
+            return None
+
+        d = self.last_detection
+        half_w = max(d.width * (0.5 + ROI_MARGIN) / self.decimation, MIN_ROI_SIZE / 2)
+        half_h = max(d.height * (0.5 + ROI_MARGIN) / self.decimation, MIN_ROI_SIZE / 2)
+        cx, cy = d.x / self.decimation, d.y / self.decimation
+
+        x0, x1 = max(int(cx - half_w), 0), min(int(cx + half_w) + 1, width)
+        y0, y1 = max(int(cy - half_h), 0), min(int(cy + half_h) + 1, height)
+        if x1 - x0 >= width and y1 - y0 >= height:
+            return None
+        return x0, y0, x1, y1
+
+    def _find_blob(self, small: np.ndarray) -> t.Optional[t.Tuple[float, float, int, int, int]]:
+        """Returns (cx, cy, w, h, score) of the best scoring blob in a decimated BGR image, (cx, cy) its centroid"""
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, BUTTON_LOWER_HSV, BUTTON_UPPER_HSV)
+
+        # Threshold the red channel of the red pixels for the redest stuff. No need for a HSV -> BGR round trip
+        red = cv2.bitwise_and(small[:, :, 2], small[:, :, 2], mask=mask)
+        _, thresh = cv2.threshold(red, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+        height, width = thresh.shape
+
+        # get_button_contour's RETR_TREE contours are the outlines of the components of thresh and of the holes in
+        # them, and the red button is usually a hole. Holes are the 4-connected components of the inverse that don't
+        # touch the edge, outlined one pixel outside all round. Label 0 is the background of each
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+        _, _, hole_stats, hole_centroids = cv2.connectedComponentsWithStats(cv2.bitwise_not(thresh), connectivity=4)
+        x, y, w, h = (hole_stats[1:, i] for i in range(4))
+        enclosed = np.flatnonzero((x > 0) & (y > 0) & (x + w < width) & (y + h < height)) + 1
+        stats = np.concatenate((stats[1:], hole_stats[enclosed] + np.array([-1, -1, 2, 2, 0], dtype=stats.dtype)))
+        centroids = np.concatenate((centroids[1:], hole_centroids[enclosed]))
+        if len(stats) == 0:
+            return None
+
+        # Score by bounding box area, ignoring boxes spanning the whole image, like get_button_contour
+        w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+        scores = np.where((w < width) & (h < height), w * h, 0)
+
+        best = int(np.argmax(scores))
+        if scores[best] < MIN_BLOB_AREA:
+            return None
+
+        cx, cy = centroids[best]
+        return cx, cy, w[best], h[best], scores[best]
+
+    def detect(self, cv_img: np.ndarray) -> t.Optional[ButtonDetection]:
+        """Find the button in the right half of a dual cam frame"""
+        h, w, _ = cv_img.shape
+        half = cv_img[:, int(w / 2):w]
+
+        d = self.decimation
+        small = cv2.resize(half, (half.shape[1] // d, half.shape[0] // d), interpolation=cv2.INTER_AREA)
+        small_h, small_w = small.shape[:2]
+
+        blob = None
+        x0 = y0 = 0
+        roi = self._roi(small_w, small_h)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            blob = self._find_blob(small[y0:y1, x0:x1])
+
+        if blob is None:
+            # Lost it, so search the whole frame
+            x0 = y0 = 0
+            blob = self._find_blob(small)
+
+        if blob is None:
+            self.last_detection = None
+            return None
+
+        # Scale back up to full resolution. Pixel centers sit at (i + 0.5) * d - 0.5
+        cx, cy, bw, bh, area = blob
+        self.last_detection = ButtonDetection(
+            x=float((cx + x0 + 0.5) * d - 0.5),
+            y=float((cy + y0 + 0.5) * d - 0.5),
+            width=int(bw * d),
+            height=int(bh * d),
+            area=float(area * d * d),
+        )
+        return self.last_detection
+
+
 class ButtonDocking(BaseTask):
     """
     Fly forward, strafing/rotating to aim at large splotches of red, until:
@@ -83,24 +228,62 @@ class ButtonDocking(BaseTask):
         self.image_dims = [-1, -1]
         self.start_time = 0
 
+        # (timestamp, ButtonDetection, image_dims) from the latest detection, published by the vision worker
+        self.detection = LatestValue()
+        self.detector = ButtonDetector()
+        self.last_detection_time = None
+
+        # Only used from periodic(), on the scheduler thread
+        self.tracker = BoxTracker()
+        self.last_tracked = None
+
         # 0 = crawl, 1 = steer, 2 = ram
         self.state = 0
 
     def initialize(self):
         self.vehicle.stop_thrusters()
-        self.start_time = time.time()
+        self.start_time = self.clock()
 
         self.vehicle.set_mode("ALT_HOLD")
         self.state = 0
 
+        self.detection.set(None)
+        self.detector.reset()
+        self.last_detection_time = None
+        self.tracker.reset()
+        self.last_tracked = None
+        self.button_pos = [-1, -1]
+        self.button_dims = [-1, -1]
+        self.image_dims = [-1, -1]
+
         if DO_LOGGING: logger.debug('Button Docking: CRAWL')
         if DO_PRINTING: print('Button Docking: CRAWL')
 
     def periodic(self):
         """Drive forward in the directions indicated by the vertical_move and horizontal_move methods, or crawl/ram if the time is right"""
-        if self.button_pos == [-1, -1]:
+        # Feed a new detection to the tracker, then steer on its prediction for now
+        latest = self.detection.get()
+        if latest is not None and latest is not self.last_tracked:
+            self.last_tracked = latest
+            timestamp, detection, self.image_dims = latest
+            self.tracker.update(detection.x, detection.y, detection.width, detection.height, timestamp)
+
+        estimate = self.tracker.predict(self.clock())
+        if estimate is None or not self.tracker.confirmed or estimate.confidence < MIN_TRACK_CONFIDENCE:
             return
 
+        # Hold still while heartbeats are late rather than driving blind until the connection times out
+        health = self.vehicle.link_health
+        if health is not None:
+            heartbeat_age = health.ages.get("HEARTBEAT")
+            if heartbeat_age is None or heartbeat_age + self.clock() - health.timestamp > HOLD_HEARTBEAT_AGE:
+                self.vehicle.stop_thrusters()
+                return
+        speed_scale = DEGRADED_SPEED_SCALE if health is not None and health.degraded else 1
+
+        self.button_pos = [estimate.x, estimate.y]
+        self.button_dims = [estimate.width, estimate.height]
+
         scale = max(-math.log(self.button_dims[0] / self.image_dims[0]) / 10, 0.1)
 
         if self.state == 0:
@@ -121,7 +304,7 @@ class ButtonDocking(BaseTask):
                 InputChannel.ROLL: 0,
             }
 
-            self.vehicle.set_rc_inputs(inputs)
+            self.vehicle.set_rc_inputs({channel: value * speed_scale for channel, value in inputs.items()})
 
         elif self.state == 1:
             # Move to ramming
@@ -143,7 +326,7 @@ class ButtonDocking(BaseTask):
 
             # print(('>' if self.horizontal_move() > 0 else '<') + ('^' if self.vertical_move() > 0 else 'v'))
 
-            self.vehicle.set_rc_inputs(inputs)
+            self.vehicle.set_rc_inputs({channel: value * speed_scale for channel, value in inputs.items()})
 
         elif self.state == 2:
             # Apply ramming
@@ -156,7 +339,7 @@ class ButtonDocking(BaseTask):
                 InputChannel.ROLL: 0,
             }
 
-            self.vehicle.set_rc_inputs(inputs)
+            self.vehicle.set_rc_inputs({channel: value * speed_scale for channel, value in inputs.items()})
 
 
 
@@ -172,28 +355,31 @@ class ButtonDocking(BaseTask):
 
     def handle_frame(self, frame: Frame):
         """Recalculate button position info if possible whenever a new frame is recieved"""
-        best_contour, high_score = get_button_contour(frame.cv_img)
+        # The detector, its ROI and the tracker all follow the button in the dual cam only
+        if frame.cam_index != CAM_INDICES[Camera.DUAL]:
+            return
+
+        timestamp = frame.timestamp if frame.timestamp is not None else self.clock()
 
-        # TODO: Guard admit dual cam only
-        # TODO: Chop dual cam frame in half
+        # Skip frames beyond DETECTION_RATE, since the tracker predicts the button between detections
+        if self.last_detection_time is not None and timestamp - self.last_detection_time < 1 / DETECTION_RATE:
+            return
+        self.last_detection_time = timestamp
 
-        # Calculate button position info if we found a good countour
-        if high_score > 0:
-            x, y, w, h = cv2.boundingRect(best_contour)
-            self.button_pos = [x + w / 2, y + h / 2]
-            self.button_dims = [w, h]
+        detection = self.detector.detect(frame.cv_img)
+        if detection is not None:
             height, width, colors = frame.cv_img.shape
-            self.image_dims = [int(width/2), height]
+            self.detection.set((timestamp, detection, [int(width/2), height]))
 
     def is_finished(self) -> bool:
         """
         Stops the task if we've spent at least some time looking around
         and (we've hit the button or exceeded max task time)
         """
-        return time.time() >= self.start_time + MIN_TASK_DURATION and \
+        return self.clock() >= self.start_time + MIN_TASK_DURATION and \
                (self.button_dims[0] > END_WIDTH_FRACTION * self.image_dims[0] or \
                 self.button_dims[1] > END_HEIGHT_FRACTION * self.image_dims[1] or \
-                time.time() >= self.start_time + MAX_TASK_DURATION)
+                self.clock() >= self.start_time + MAX_TASK_DURATION)
 
     def end(self):
         self.vehicle.set_mode("MANUAL")
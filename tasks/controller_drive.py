@@ -1,8 +1,14 @@
+import numpy as np
 from PyQt5.QtCore import Qt
 from tasks.base_task import BaseTask
 from vehicle.constants import InputChannel, BACKWARD_CAM_INDICES
 from vehicle.vehicle_control import VehicleControl
-from controller.controller import XboxController
+from controller.controller import Controller
+from controller.mapping import VEHICLE_CHANNELS, to_channel_dict
+
+# Inputs are multiplied by this when driving from a backward camera
+BACKWARD_SIGNS = np.array([-1.0 if channel in (InputChannel.FORWARD, InputChannel.LATERAL, InputChannel.PITCH,
+                                               InputChannel.ROLL) else 1.0 for channel in VEHICLE_CHANNELS])
 
 
 class ControllerDrive(BaseTask):
@@ -16,7 +22,7 @@ class ControllerDrive(BaseTask):
     IJKL: Pitch and Yaw
     U/O: Roll
     """
-    def __init__(self, vehicle: VehicleControl, controller: XboxController, get_video_index):
+    def __init__(self, vehicle: VehicleControl, controller: Controller, get_video_index):
         self.controller = controller
         self.get_video_index = get_video_index
         super().__init__(vehicle)
@@ -26,13 +32,13 @@ class ControllerDrive(BaseTask):
 
     def periodic(self):
         """Set vehicle inputs based on controller inputs"""
-        inputs = self.controller.get_vehicle_inputs()
+        inputs, event_times = self.controller.get_input_frame()
 
         if self.get_video_index() in BACKWARD_CAM_INDICES:
-            for channel in (InputChannel.FORWARD, InputChannel.LATERAL, InputChannel.PITCH, InputChannel.ROLL):
-                inputs[channel] *= -1
+            inputs *= BACKWARD_SIGNS
 
-        self.vehicle.set_rc_inputs(inputs)
+        # The input event times go along so the vehicle can trace stick to RC override latency
+        self.vehicle.set_rc_inputs(to_channel_dict(inputs), to_channel_dict(event_times))
 
     def end(self):
         self.vehicle.stop_thrusters()
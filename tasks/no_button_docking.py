@@ -17,7 +17,7 @@ class NoButtonDocking(BaseTask):
         self.start_time = None
 
     def initialize(self):
-        self.start_time = time.time()
+        self.start_time = self.clock()
 
     def periodic(self):
         inputs = {
@@ -26,7 +26,7 @@ class NoButtonDocking(BaseTask):
         self.vehicle.set_rc_inputs(inputs)
 
     def is_finished(self) -> bool:
-        return time.time() >= self.start_time + TASK_DURATION
+        return self.clock() >= self.start_time + TASK_DURATION
 
     def end(self):
         self.vehicle.stop_thrusters()
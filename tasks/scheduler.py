@@ -1,37 +1,116 @@
+import dataclasses
 import time
 import typing as t
+from collections import deque
 
+import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
 
 from vehicle.vehicle_control import VehicleControl
 from logger import root_logger
 from tasks.base_task import BaseTask
+from tasks.vision_worker import VisionWorkerPool
 
 
 PERIODIC_FREQUENCY = 30
 
+# How long before each deadline to stop sleeping and spin instead, since sleep() overshoots by up to a few ms.
+# Spinning holds the GIL from the capture, vision and I/O threads, so keep it short: 1 ms is 3% of a 30 Hz period
+SPIN_BUDGET_NS = 1_000_000
+
+# Number of loop iterations the statistics are computed over, and how often they are published
+STATS_WINDOW = 5 * PERIODIC_FREQUENCY
+STATS_INTERVAL = PERIODIC_FREQUENCY
+
 logger = root_logger.getChild(__name__)
 
 
+@dataclasses.dataclass
+class SchedulerStats:
+    """Timing of the scheduler loop over the last STATS_WINDOW iterations. Times are in milliseconds"""
+    period_mean: float
+    jitter_p50: float
+    jitter_p95: float
+    jitter_p99: float
+    jitter_max: float
+    task_periodic_mean: float
+    overruns_window: int
+    overruns_total: int
+
+
+class LoopTimer:
+    """Records loop period, work durations and overruns, and summarizes them as SchedulerStats"""
+
+    def __init__(self, period_ns: int, window: int = STATS_WINDOW):
+        self.period_ns = period_ns
+        self.periods = deque(maxlen=window)
+        self.task_periodic_times = deque(maxlen=window)
+        self.overruns = deque(maxlen=window)
+        self.overruns_total = 0
+        self.iterations = 0
+
+    def record(self, period_ns: int, task_periodic_ns: int, overrun: bool):
+        self.periods.append(period_ns)
+        self.task_periodic_times.append(task_periodic_ns)
+        self.overruns.append(overrun)
+        self.overruns_total += overrun
+        self.iterations += 1
+
+    def get_stats(self) -> SchedulerStats:
+        periods = np.array(self.periods, dtype=np.float64) / 1e6
+        jitter = np.abs(periods - self.period_ns / 1e6)
+        p50, p95, p99 = np.percentile(jitter, (50, 95, 99))
+
+        return SchedulerStats(
+            period_mean=float(periods.mean()),
+            jitter_p50=float(p50),
+            jitter_p95=float(p95),
+            jitter_p99=float(p99),
+            jitter_max=float(jitter.max()),
+            task_periodic_mean=float(np.mean(self.task_periodic_times)) / 1e6,
+            overruns_window=int(sum(self.overruns)),
+            overruns_total=self.overruns_total,
+        )
+
+
+def wait_until(deadline_ns: int, spin_ns: int = SPIN_BUDGET_NS):
+    """Sleep until the deadline on the monotonic clock, or until spin_ns before it and spin for the rest"""
+    remaining = deadline_ns - time.perf_counter_ns()
+    if remaining > spin_ns:
+        time.sleep((remaining - spin_ns) / 1e9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+
 class TaskScheduler(QThread):
     change_task_signal = pyqtSignal(str)
+    stats_signal = pyqtSignal(SchedulerStats)
 
-    def __init__(self, vehicle: VehicleControl):
+    def __init__(self, vehicle: VehicleControl, spin_ns: int = SPIN_BUDGET_NS):
         super().__init__()
         self.vehicle = vehicle
+        self.spin_ns = spin_ns
         self.current_task: t.Optional[BaseTask] = None
         self.default_task: t.Optional[BaseTask] = None
 
+        # Runs the current task's handle_frame off the gui and scheduler threads
+        self.vision_pool = VisionWorkerPool()
+
+        self._running = True
+
     def start_task(self, task: BaseTask):
         if self.vehicle.is_connected() and self.vehicle.is_armed():
             self.end_current_task()
             self.current_task = task
             task.initialize()
+            if task.uses_frames():
+                self.vision_pool.register(task)
             logger.info(f"Started task \"{str(task)}\"")
             self.change_task_signal.emit(str(task))
 
     def end_current_task(self):
         if self.current_task is not None:
+            self.vision_pool.unregister(self.current_task)
             self.current_task.end()
             self.current_task = None
             self.change_task_signal.emit(None)
@@ -43,12 +122,15 @@ class TaskScheduler(QThread):
             self.start_task(task)
 
     def run(self):
-        last_timestamp = time.time_ns()
         period_ns = int(1e9) // PERIODIC_FREQUENCY
+        timer = LoopTimer(period_ns)
 
-        while True:
-            self.vehicle.update()
+        # perf_counter_ns is monotonic, so wall clock adjustments can't stall or rush the loop
+        deadline = time.perf_counter_ns() + period_ns
+        last_start = None
 
+        while self._running:
+            start = time.perf_counter_ns()
             if not self.vehicle.is_connected() or not self.vehicle.is_armed():
                 self.end_current_task()
             else:
@@ -62,21 +144,32 @@ class TaskScheduler(QThread):
                         self.end_current_task()
                 else:
                     self.vehicle.stop_thrusters()
-
-            wait_until = last_timestamp + period_ns
-            current_time = time.time_ns()
+            task_periodic_end = time.perf_counter_ns()
 
             # Don't run more than PERIODIC_FREQUENCY times a second
-            if current_time < wait_until:
-                last_timestamp += period_ns
-                self.msleep((wait_until - current_time) // 1000000)
+            overrun = task_periodic_end > deadline
+            if overrun:
+                logger.debug(f"Scheduler loop overrun of {(task_periodic_end - deadline) / 1e6:.1f}ms")
+                deadline = task_periodic_end + period_ns
             else:
-                logger.debug(f"Scheduler loop overrun of {(current_time - wait_until) // 1000000}ms")
-                last_timestamp = current_time
+                wait_until(deadline, self.spin_ns)
+                deadline += period_ns
+
+            if last_start is not None:
+                timer.record(start - last_start, task_periodic_end - start, overrun)
+                if timer.iterations % STATS_INTERVAL == 0:
+                    self.stats_signal.emit(timer.get_stats())
+            last_start = start
+
+    def stop(self):
+        """End the current task and stop the loop"""
+        self._running = False
+        self.wait()
+        self.end_current_task()
 
     def get_current_task_name(self) -> str:
         return "None" if self.current_task is None else str(self.current_task)
 
     def on_frame(self, frame):
-        if self.current_task is not None:
-            self.current_task.handle_frame(frame)
+        """Pass a frame to the vision workers. Register as a frame callback so this runs on the video reader"""
+        self.vision_pool.submit(frame)
@@ -0,0 +1,104 @@
+import threading
+import typing as t
+
+from gui.data_classes import Frame
+from gui.frame_mailbox import FrameMailbox
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# How long an idle worker waits for a frame before checking whether it should stop
+FRAME_TIMEOUT = 0.1
+
+# How long unregister waits for a worker's current handle_frame to finish
+STOP_TIMEOUT = 1.0
+
+
+class LatestValue:
+    """
+    A single slot holding the newest value published by one thread for another to read. Publishing replaces a
+    single reference, which is atomic in CPython, so neither side ever blocks the other.
+    """
+
+    def __init__(self, value=None):
+        self._value = value
+
+    def set(self, value):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+
+class VisionWorker(threading.Thread):
+    """Runs one task's handle_frame on the newest frame of each camera, on its own thread"""
+
+    def __init__(self, task):
+        super().__init__(daemon=True, name=f"vision-{task}")
+        self.task = task
+        self.running = True
+        self.mailbox = FrameMailbox()
+        self._new_frame_event = threading.Event()
+
+    def submit(self, frame: Frame):
+        self.mailbox.post(frame)
+        self._new_frame_event.set()
+
+    def stop(self):
+        self.running = False
+        self._new_frame_event.set()
+
+    def run(self):
+        while self.running:
+            if not self._new_frame_event.wait(FRAME_TIMEOUT):
+                continue
+            self._new_frame_event.clear()
+
+            for frame in self.mailbox.take_all():
+                if not self.running:
+                    break
+                try:
+                    self.task.handle_frame(frame)
+                except Exception as e:
+                    logger.error(f'Exception in {self.task} handle_frame: {e}')
+
+
+class VisionWorkerPool:
+    """
+    Delivers frames to the tasks registered with it. Each task gets its own worker, so vision runs in parallel
+    with rendering and the scheduler loop, and a task that falls behind skips straight to the newest frame.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers: t.Dict[int, VisionWorker] = {}
+
+    def register(self, task):
+        with self._lock:
+            if id(task) not in self._workers:
+                worker = VisionWorker(task)
+                self._workers[id(task)] = worker
+                worker.start()
+
+    def unregister(self, task):
+        """
+        Stop the task's worker and wait for its current handle_frame to return, so a task that is registered again
+        never has two workers publishing detections at once
+        """
+        with self._lock:
+            worker = self._workers.pop(id(task), None)
+        if worker is not None:
+            worker.stop()
+            worker.join(STOP_TIMEOUT)
+            if worker.is_alive():
+                logger.warning(f'Vision worker for {task} is still running after {STOP_TIMEOUT}s')
+
+    def submit(self, frame: Frame):
+        """
+        Hand a frame to every registered task. Safe to call from any thread, and never blocks on vision work. The
+        workers share the frame, so it must not be written to
+        """
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.submit(frame)
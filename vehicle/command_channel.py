@@ -0,0 +1,208 @@
+import asyncio
+import dataclasses
+import socket
+import threading
+import time
+import typing as t
+from collections import deque
+
+import numpy as np
+
+from logger import root_logger
+from vehicle.io_loop import VehicleIoLoop
+
+logger = root_logger.getChild(__name__)
+
+CONNECT_TIMEOUT = 1  # Seconds
+WRITE_TIMEOUT = 1  # Seconds a write can wait for the socket buffer to drain before the connection is considered dead
+RECONNECT_DELAY = 0.2  # Seconds, doubled after each failed attempt up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 5
+
+# Number of commands the latency percentiles are computed over
+LATENCY_WINDOW = 200
+
+
+@dataclasses.dataclass
+class ChannelStats:
+    connected: bool
+    commands: int  # Commands written to the socket
+    coalesced: int  # Commands replaced by a newer command with the same key before they were sent
+    writes: int  # sendall calls, each carrying one batch
+    connects: int  # Successful connections, including the first
+    latency_mean: float  # Milliseconds from send() to the command being written to the socket
+    latency_p99: float
+    latency_max: float
+
+
+@dataclasses.dataclass
+class Command:
+    payload: bytes
+    key: t.Any
+    queued_at: float  # time.monotonic()
+
+
+class CommandChannel:
+    """
+    A persistent TCP connection to one of the ROV's command servers, with an ordered send queue, run on the vehicle
+    I/O loop. The connection is opened lazily and re-opened whenever it drops, and commands that couldn't be written
+    are kept and sent once it's back. Commands are written back to back on the one connection, so the server has to
+    read them as a stream, e.g. [relay, state] pairs or newline terminated JSON, the way CommandServer does.
+
+    Commands sent within batch_window seconds of each other are written together in one packet. Commands with the
+    same key replace each other, so only the newest state of e.g. a relay is sent, in the position of its newest
+    change. Commands with key None are never replaced.
+    """
+
+    def __init__(self, io: VehicleIoLoop, host: str, port: int, batch_window: float = 0.0,
+                 name: t.Optional[str] = None):
+        self.io = io
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.name = name or f"command-channel-{port}"
+
+        self._queue: t.Optional[asyncio.Queue] = None
+        self._writer: t.Optional[asyncio.StreamWriter] = None
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.commands = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.connects = 0
+
+        # Called on the loop with each batch of commands once it has been written
+        self.sent_callbacks: t.List[t.Callable[[t.List[Command]], None]] = []
+
+    def start(self):
+        self.io.submit(self._run())
+
+    def send(self, payload: bytes, key: t.Any = None) -> None:
+        """Queue a command. Safe to call from any thread, never blocks"""
+        self.io.call_soon(self._enqueue, Command(payload, key, time.monotonic()))
+
+    def _enqueue(self, command: Command):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._queue.put_nowait(command)
+
+    def register_sent_callback(self, callback: t.Callable[[t.List[Command]], None]):
+        self.sent_callbacks.append(callback)
+
+    def is_connected(self) -> bool:
+        return self._writer is not None
+
+    async def _run(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        pending: t.Dict[t.Any, Command] = {}  # Insertion ordered, keyed commands and unique keys for unkeyed ones
+        reconnect_delay = RECONNECT_DELAY
+
+        try:
+            while True:
+                if not pending:
+                    command = await self._queue.get()
+                    self._add(pending, command)
+                    # Gather everything else sent within the batch window
+                    await self._gather(pending, command.queued_at + self.batch_window)
+
+                if self._writer is None and not await self._connect():
+                    # Keep coalescing new commands while waiting to reconnect
+                    await self._gather(pending, time.monotonic() + reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
+                    continue
+                reconnect_delay = RECONNECT_DELAY
+
+                batch = list(pending.values())
+                writer = self._writer
+                try:
+                    writer.write(b''.join(command.payload for command in batch))
+                    await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+                except (OSError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Command channel {self.host}:{self.port} dropped, reconnecting: {e!r}")
+                    self._close()
+                    continue
+
+                pending.clear()
+                self._record(batch)
+        finally:
+            self._close()
+
+    def _add(self, pending: t.Dict[t.Any, Command], command: Command):
+        key = command.key if command.key is not None else object()
+        if key in pending:
+            del pending[key]
+            with self._stats_lock:
+                self.coalesced += 1
+        pending[key] = command
+
+    async def _gather(self, pending: t.Dict[t.Any, Command], deadline: float):
+        """Add commands to pending until deadline"""
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    command = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    command = self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                return
+            self._add(pending, command)
+
+    async def _connect(self) -> bool:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.debug(f"Couldn't connect to {self.host}:{self.port}: {e!r}")
+            return False
+
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._writer = writer
+        asyncio.get_running_loop().create_task(self._watch(reader, writer))
+        with self._stats_lock:
+            self.connects += 1
+        logger.info(f"Command channel connected to {self.host}:{self.port}")
+        return True
+
+    async def _watch(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Notice as soon as the server closes the connection, instead of on the next write"""
+        try:
+            while await reader.read(1024):
+                pass
+        except OSError:
+            pass
+        if self._writer is writer:
+            logger.warning(f"Command channel {self.host}:{self.port} closed by server")
+            self._close()
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _record(self, batch: t.List[Command]):
+        sent_at = time.monotonic()
+        with self._stats_lock:
+            self.commands += len(batch)
+            self.writes += 1
+            self._latencies.extend((sent_at - command.queued_at) * 1000 for command in batch)
+
+        for callback in self.sent_callbacks:
+            try:
+                callback(batch)
+            except Exception as e:
+                logger.error(f"Exception in command channel sent callback: {e}")
+
+    def get_stats(self) -> ChannelStats:
+        with self._stats_lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            return ChannelStats(
+                connected=self.is_connected(),
+                commands=self.commands,
+                coalesced=self.coalesced,
+                writes=self.writes,
+                connects=self.connects,
+                latency_mean=float(latencies.mean()),
+                latency_p99=float(np.percentile(latencies, 99)),
+                latency_max=float(latencies.max()),
+            )
@@ -0,0 +1,83 @@
+import json
+import socket
+import threading
+import time
+import typing as t
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+
+def parse_relays(buffer: bytes) -> t.Tuple[t.List[t.Tuple[int, bool]], bytes]:
+    """Split a relay stream into [relay, state] pairs, returning the pairs and any incomplete trailing byte"""
+    end = len(buffer) - len(buffer) % 2
+    return [(buffer[i], bool(buffer[i + 1])) for i in range(0, end, 2)], buffer[end:]
+
+
+def parse_json_lines(buffer: bytes) -> t.Tuple[t.List[dict], bytes]:
+    """Split a camera stream into newline terminated JSON objects, returning them and any incomplete trailing line"""
+    *lines, rest = buffer.split(b'\n')
+    return [json.loads(line) for line in lines if line.strip()], rest
+
+
+class CommandServer(threading.Thread):
+    """
+    Stands in for one of the ROV's command servers, so relay and camera commands can be tested without the vehicle.
+    Accepts any number of connections, reads each until it closes and keeps every command it parses along with
+    the time.monotonic() it arrived.
+    """
+
+    def __init__(self, port: int, parser: t.Callable[[bytes], t.Tuple[list, bytes]], host: str = "127.0.0.1"):
+        super().__init__(daemon=True, name=f"command-server-{port}")
+        self.parser = parser
+        self.received: t.List[t.Tuple[float, t.Any]] = []
+        self.connections = 0
+        self.callbacks: t.List[t.Callable[[t.Any], None]] = []
+
+        self._server = socket.create_server((host, port))
+        self.port = self._server.getsockname()[1]  # In case port was 0
+        self._running = True
+        self._connections: t.List[socket.socket] = []
+
+    def register_callback(self, callback: t.Callable[[t.Any], None]):
+        """Call callback on the connection's thread with each command received"""
+        self.callbacks.append(callback)
+
+    def run(self):
+        while self._running:
+            try:
+                conn, address = self._server.accept()
+            except OSError:
+                break
+            self.connections += 1
+            self._connections.append(conn)
+            logger.debug(f"Command server on port {self.port} accepted {address}")
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket):
+        buffer = b''
+        with conn:
+            while self._running:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                now = time.monotonic()
+                commands, buffer = self.parser(buffer + data)
+                for command in commands:
+                    self.received.append((now, command))
+                    for callback in self.callbacks:
+                        callback(command)
+
+    def stop(self):
+        self._running = False
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)  # Wakes up accept
+        except OSError:
+            pass
+        self._server.close()
+        for conn in self._connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
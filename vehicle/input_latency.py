@@ -0,0 +1,101 @@
+import dataclasses
+import threading
+import typing as t
+from collections import deque
+
+import numpy as np
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# Number of input changes per channel the percentiles are computed over
+LATENCY_WINDOW = 500
+
+
+@dataclasses.dataclass
+class InputLatencyStats:
+    """Latency of one RC channel over the last LATENCY_WINDOW input changes. Times are in milliseconds"""
+    count: int  # Input changes traced in total
+    p50: float  # From the input event to the RC override carrying its change being written to the link
+    p95: float
+    p99: float
+    max: float
+    sampled_p50: float  # From the input event to the task reading it, the part of p50 spent before the scheduler
+
+
+@dataclasses.dataclass
+class _PendingChange:
+    pwm: int
+    event_time: float
+    sampled_at: float
+
+
+class InputLatencyTracer:
+    """
+    Traces pilot inputs from the kernel's input event timestamp to the RC override that carries the change. set is
+    called with each batch of pwms and the time.monotonic() of the newest event behind each channel, and sent with
+    every override written to the link. A channel's latency is recorded at the first override after its pwm changed
+    because of a new event, so held inputs, keepalives and changes too small to move the pwm aren't counted.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._requested: t.Dict[int, int] = {}  # Channel -> last pwm set
+        self._traced_events: t.Dict[int, float] = {}  # Channel -> newest event time already traced
+        self._pending: t.Dict[int, _PendingChange] = {}
+        self._latencies: t.Dict[int, deque] = {}
+        self._sampled: t.Dict[int, deque] = {}
+        self._counts: t.Dict[int, int] = {}
+        self.window = window
+
+    def set(self, pwms: t.Dict[int, int], event_times: t.Dict[int, float], sampled_at: float):
+        """Called with the pwms about to be set, the input event time behind each, and when they were sampled"""
+        with self._lock:
+            for channel, pwm in pwms.items():
+                event_time = event_times.get(channel)
+                changed = self._requested.get(channel) != pwm
+                self._requested[channel] = pwm
+                if not changed or event_time is None or event_time <= self._traced_events.get(channel, 0.0):
+                    continue
+                self._traced_events[channel] = event_time
+                self._pending[channel] = _PendingChange(pwm, event_time, sampled_at)
+
+    def sent(self, pwms: t.List[int], sent_at: float):
+        """Called with the pwms of channels 1-18 of each RC override and the time.monotonic() it was written"""
+        with self._lock:
+            for channel, change in list(self._pending.items()):
+                # An override already queued before the change, e.g. a keepalive, doesn't carry it
+                if pwms[channel - 1] != change.pwm:
+                    continue
+                del self._pending[channel]
+                if channel not in self._latencies:
+                    self._latencies[channel] = deque(maxlen=self.window)
+                    self._sampled[channel] = deque(maxlen=self.window)
+                    self._counts[channel] = 0
+                self._latencies[channel].append(sent_at - change.event_time)
+                self._sampled[channel].append(change.sampled_at - change.event_time)
+                self._counts[channel] += 1
+
+    def reset(self):
+        """Forget the requested pwms, e.g. when the RC output is reset, but keep the recorded latencies"""
+        with self._lock:
+            self._requested.clear()
+            self._pending.clear()
+
+    def get_stats(self) -> t.Dict[int, InputLatencyStats]:
+        """Stats of each channel (1-18) with at least one traced change"""
+        with self._lock:
+            stats = {}
+            for channel, latencies in self._latencies.items():
+                latencies = np.array(latencies) * 1000
+                p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+                stats[channel] = InputLatencyStats(
+                    count=self._counts[channel],
+                    p50=float(p50),
+                    p95=float(p95),
+                    p99=float(p99),
+                    max=float(latencies.max()),
+                    sampled_p50=float(np.median(self._sampled[channel])) * 1000,
+                )
+            return stats
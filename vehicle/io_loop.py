@@ -0,0 +1,102 @@
+import asyncio
+import concurrent.futures
+import threading
+import typing as t
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+
+class Timer:
+    """A repeating callback on a VehicleIoLoop, see VehicleIoLoop.call_every"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, period: float, callback: t.Callable[[], None]):
+        self.loop = loop
+        self.period = period
+        self.callback = callback
+        self._handle: t.Optional[asyncio.TimerHandle] = None
+        self._deadline = None
+
+    def start(self):
+        self._deadline = self.loop.time() + self.period
+        self._handle = self.loop.call_at(self._deadline, self._fire)
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _fire(self):
+        try:
+            self.callback()
+        except Exception as e:
+            logger.error(f"Exception in vehicle I/O timer {self.callback}: {e}")
+
+        # Schedule against the previous deadline so the period doesn't drift, but skip ticks missed while stalled
+        self._deadline += self.period
+        now = self.loop.time()
+        if self._deadline < now:
+            self._deadline = now + self.period
+        self._handle = self.loop.call_at(self._deadline, self._fire)
+
+
+class VehicleIoLoop(threading.Thread):
+    """
+    One asyncio event loop on one thread that owns every link to the vehicle: the MAVLink socket, the relay and
+    camera command channels, and the timers that watch them. Other threads hand it work with call_soon and submit,
+    and it reports back through Qt signals, which Qt queues onto the receiving object's thread.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name="vehicle-io")
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    def start(self):
+        super().start()
+        self._started.wait()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            # Let cancelled tasks run their cleanup before closing
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    def in_loop(self) -> bool:
+        return threading.current_thread() is self
+
+    def call_soon(self, callback: t.Callable, *args) -> None:
+        """Run callback(*args) on the loop. Safe to call from any thread"""
+        if self.in_loop():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def submit(self, coro: t.Coroutine) -> concurrent.futures.Future:
+        """Run a coroutine on the loop. Safe to call from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_every(self, period: float, callback: t.Callable[[], None]) -> Timer:
+        """Run callback on the loop every period seconds, starting one period from now"""
+        timer = Timer(self.loop, period, callback)
+        self.call_soon(timer.start)
+        return timer
+
+    def add_reader(self, fd: int, callback: t.Callable[[], None]) -> None:
+        """Run callback on the loop whenever fd is readable"""
+        self.call_soon(self.loop.add_reader, fd, callback)
+
+    def stop(self, timeout: float = 1.0):
+        if not self.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
+
@@ -0,0 +1,162 @@
+import dataclasses
+import statistics
+import threading
+import time
+import typing as t
+from collections import defaultdict, deque
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# Seconds of messages the rates and packet loss are computed over
+RATE_WINDOW = 2.0
+LOSS_WINDOW = 5.0
+
+# Seconds between TIMESYNC requests, and the number of round trips the RTT is the median of
+TIMESYNC_PERIOD = 1.0
+RTT_HISTORY = 5
+
+# Seconds each stream can go without a message before it's stale. A stream is only held to its budget once it has
+# been seen, since the autopilot may not send it at all. The link is down once HEARTBEAT is stale
+STALENESS_BUDGETS = {
+    "HEARTBEAT": 2.0,
+    "ATTITUDE": 0.5,
+    "VFR_HUD": 1.0,
+}
+
+# The link is degraded past these, even though it's still connected
+DEGRADED_PACKET_LOSS = 0.05  # Fraction of packets
+DEGRADED_RTT = 0.25  # Seconds
+
+# A sequence jump this big is a reordered or duplicated packet, or a rebooted sender, not loss
+MAX_SEQUENCE_GAP = 128
+
+
+@dataclasses.dataclass
+class LinkHealth:
+    connected: bool
+    rates: t.Dict[str, float]  # Messages/second of each type over RATE_WINDOW
+    packet_loss: float  # Fraction of packets lost over LOSS_WINDOW, from gaps in the MAVLink sequence numbers
+    rtt: t.Optional[float]  # Seconds, median TIMESYNC round trip, None until the vehicle has answered one
+    ages: t.Dict[str, t.Optional[float]]  # Seconds since the newest message of each budgeted stream, None if never
+    stale: t.List[str]  # Budgeted streams that have been seen, but not within their budget
+    timestamp: float  # time.monotonic()
+
+    @property
+    def degraded(self) -> bool:
+        """Connected, but losing packets, slow, or missing some data"""
+        return self.connected and (self.packet_loss > DEGRADED_PACKET_LOSS or
+                                   (self.rtt is not None and self.rtt > DEGRADED_RTT) or
+                                   bool(self.stale))
+
+    def is_fresh(self, stream: str) -> bool:
+        return stream not in self.stale
+
+
+class LinkMonitor:
+    """
+    Measures the quality of the MAVLink connection from every message received: per type rates, packet loss from
+    sequence number gaps, round trip time with TIMESYNC, and how old each stream in STALENESS_BUDGETS is.
+    Messages are fed in on the I/O loop, and get_health can be called from any thread.
+    """
+
+    def __init__(self, budgets: t.Optional[t.Dict[str, float]] = None):
+        self.budgets = dict(STALENESS_BUDGETS if budgets is None else budgets)
+
+        self._lock = threading.Lock()
+        self._arrivals: t.Dict[str, deque] = defaultdict(deque)  # Message type -> receive times in RATE_WINDOW
+        self._last_seen: t.Dict[str, float] = {}
+        self._sequences: t.Dict[t.Tuple[int, int], int] = {}  # (system, component) -> last sequence number
+        self._packets = deque()  # (receive time, packets lost just before it) over LOSS_WINDOW
+        self._timesync_requests = deque(maxlen=RTT_HISTORY * 2)  # ts1 of requests not answered yet
+        self._rtts = deque(maxlen=RTT_HISTORY)
+
+        self.received = 0
+        self.lost = 0
+
+    def handle_message(self, msg, timestamp: float):
+        """Called with each pymavlink message and the time.monotonic() it was received"""
+        msg_type = msg.get_type()
+        source = (msg.get_srcSystem(), msg.get_srcComponent())
+        sequence = msg.get_seq()
+
+        with self._lock:
+            self.received += 1
+            lost = 0
+            last = self._sequences.get(source)
+            if last is not None:
+                gap = (sequence - last - 1) % 256
+                if gap < MAX_SEQUENCE_GAP:
+                    lost = gap
+            self._sequences[source] = sequence
+            self.lost += lost
+
+            self._packets.append((timestamp, lost))
+            self._arrivals[msg_type].append(timestamp)
+            self._last_seen[msg_type] = timestamp
+
+            if msg_type == "TIMESYNC" and msg.tc1 != 0 and msg.ts1 in self._timesync_requests:
+                self._timesync_requests.remove(msg.ts1)
+                self._rtts.append((time.monotonic_ns() - msg.ts1) / 1e9)
+
+    def new_timesync_request(self) -> int:
+        """Returns the ts1 to send in a TIMESYNC request, in nanoseconds"""
+        ts1 = time.monotonic_ns()
+        with self._lock:
+            self._timesync_requests.append(ts1)
+        return ts1
+
+    def heartbeat_age(self, now: t.Optional[float] = None) -> t.Optional[float]:
+        last = self._last_seen.get("HEARTBEAT")
+        if last is None:
+            return None
+        return (time.monotonic() if now is None else now) - last
+
+    def is_connected(self, now: t.Optional[float] = None) -> bool:
+        age = self.heartbeat_age(now)
+        return age is not None and age <= self.budgets.get("HEARTBEAT", STALENESS_BUDGETS["HEARTBEAT"])
+
+    def reset(self):
+        """Forget everything measured, e.g. after losing the connection"""
+        with self._lock:
+            self._arrivals.clear()
+            self._last_seen.clear()
+            self._sequences.clear()
+            self._packets.clear()
+            self._timesync_requests.clear()
+            self._rtts.clear()
+
+    def get_health(self, now: t.Optional[float] = None) -> LinkHealth:
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            rates = {}
+            for msg_type, arrivals in self._arrivals.items():
+                while arrivals and arrivals[0] < now - RATE_WINDOW:
+                    arrivals.popleft()
+                rates[msg_type] = len(arrivals) / RATE_WINDOW
+
+            while self._packets and self._packets[0][0] < now - LOSS_WINDOW:
+                self._packets.popleft()
+            lost = sum(lost for _, lost in self._packets)
+            packet_loss = lost / (lost + len(self._packets)) if self._packets else 0.0
+
+            rtt = statistics.median(self._rtts) if self._rtts else None
+
+            ages = {}
+            for stream in self.budgets:
+                last = self._last_seen.get(stream)
+                ages[stream] = now - last if last is not None else None
+
+        stale = [stream for stream, age in ages.items() if age is not None and age > self.budgets[stream]]
+        return LinkHealth(
+            connected=self.is_connected(now),
+            rates=rates,
+            packet_loss=packet_loss,
+            rtt=rtt,
+            ages=ages,
+            stale=stale,
+            timestamp=now,
+        )
@@ -0,0 +1,64 @@
+import time
+import typing as t
+
+from logger import root_logger
+from vehicle.io_loop import VehicleIoLoop
+from vehicle.telemetry import TelemetryCache
+
+logger = root_logger.getChild(__name__)
+
+# Most messages handled per readable callback, so a flood of telemetry can't starve the loop's other links
+MAX_MESSAGES_PER_READ = 100
+
+
+class MavlinkEndpoint:
+    """
+    Runs a pymavlink UDP connection on the vehicle I/O loop. Messages are read as soon as the socket is readable and
+    fed into a TelemetryCache, and sends are made on the loop so only one thread ever touches the link
+    """
+
+    def __init__(self, io: VehicleIoLoop, link, cache: TelemetryCache):
+        self.io = io
+        self.link = link
+        self.cache = cache
+
+        # Called on the loop with every raw pymavlink message and its receive time, before the cache sees it
+        self.message_callbacks: t.List[t.Callable] = []
+
+    def register_message_callback(self, callback: t.Callable):
+        self.message_callbacks.append(callback)
+
+    def start(self):
+        self.io.add_reader(self.link.port.fileno(), self._on_readable)
+
+    def send(self, send_function: t.Callable, *args) -> None:
+        """Call a pymavlink send function, e.g. link.mav.command_long_send, on the loop. Safe to call from any thread"""
+        self.io.call_soon(self._send, send_function, *args)
+
+    @staticmethod
+    def _send(send_function: t.Callable, *args):
+        try:
+            send_function(*args)
+        except OSError as e:
+            logger.error(f"Exception sending MAVLink: {e}")
+
+    def _on_readable(self):
+        for _ in range(MAX_MESSAGES_PER_READ):
+            try:
+                msg = self.link.recv_msg()
+            except Exception as e:
+                logger.error(f"Exception receiving MAVLink: {e}")
+                return
+
+            if msg is None:
+                return
+            if msg.get_type() == "BAD_DATA":
+                continue
+
+            timestamp = time.monotonic()
+            for callback in self.message_callbacks:
+                try:
+                    callback(msg, timestamp)
+                except Exception as e:
+                    logger.error(f"Exception in MAVLink message callback: {e}")
+            self.cache.handle_message(msg, timestamp)
@@ -0,0 +1,93 @@
+import dataclasses
+import typing as t
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from vehicle.telemetry import Heartbeat
+
+# COMMAND_ACK commands that acknowledge a mode change. ArduPilot acks a SET_MODE message with the message id in place of
+# a command id
+SET_MODE_ACK_COMMANDS = (mavlink.MAV_CMD_DO_SET_MODE, mavlink.MAVLINK_MSG_ID_SET_MODE)
+
+# Heartbeats from these autopilots come from GCSs, companion computers or cameras rather than the flight controller
+NON_AUTOPILOTS = (mavlink.MAV_AUTOPILOT_INVALID,)
+
+
+class ModeTable:
+    """
+    Bidirectional mode name <-> custom_mode id table for one autopilot and vehicle type. Only ArduPilot numbers its
+    modes this way, so the table is empty for anything else
+    """
+
+    def __init__(self, autopilot: int, vehicle_type: int):
+        self.autopilot = autopilot
+        self.vehicle_type = vehicle_type
+
+        if autopilot == mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA:
+            by_name = mavutil.mode_mapping_byname(vehicle_type) or {}
+        else:
+            by_name = {}
+
+        self.ids: t.Dict[str, int] = by_name
+        self.names: t.Dict[int, str] = {mode_id: name for name, mode_id in by_name.items()}
+
+    @classmethod
+    def from_heartbeat(cls, heartbeat: Heartbeat) -> "ModeTable":
+        return cls(heartbeat.autopilot, heartbeat.vehicle_type)
+
+    def matches(self, heartbeat: Heartbeat) -> bool:
+        """Whether this table is still valid for the vehicle that sent heartbeat"""
+        return heartbeat.autopilot == self.autopilot and heartbeat.vehicle_type == self.vehicle_type
+
+    def name(self, mode_id: int) -> t.Optional[str]:
+        return self.names.get(mode_id)
+
+    def id(self, name: str) -> t.Optional[int]:
+        return self.ids.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+# All timestamps are time.monotonic() seconds
+
+@dataclasses.dataclass
+class ModeRequest:
+    """A set_mode request and its COMMAND_ACK"""
+    mode: str
+    mode_id: int
+    sent_at: float
+    acked_at: t.Optional[float] = None
+    result: t.Optional[int] = None  # MAV_RESULT, None until acked
+
+    @property
+    def accepted(self) -> bool:
+        return self.result == mavlink.MAV_RESULT_ACCEPTED
+
+    @property
+    def ack_latency(self) -> t.Optional[float]:
+        """Seconds from sending the request to its COMMAND_ACK"""
+        return self.acked_at - self.sent_at if self.acked_at is not None else None
+
+
+@dataclasses.dataclass
+class ModeTransition:
+    """The vehicle's heartbeat reported a new mode"""
+    previous: t.Optional[str]
+    mode: t.Optional[str]  # None if the mode id isn't in the mode table
+    mode_id: int
+    timestamp: float
+    request: t.Optional[ModeRequest] = None  # The request that caused it, None if it was changed some other way
+
+    @property
+    def ack_latency(self) -> t.Optional[float]:
+        return self.request.ack_latency if self.request is not None else None
+
+    @property
+    def confirm_latency(self) -> t.Optional[float]:
+        """Seconds from sending the request to the first heartbeat in the new mode"""
+        return self.timestamp - self.request.sent_at if self.request is not None else None
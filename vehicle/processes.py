@@ -20,8 +20,7 @@ class LightsManager:
         if self.global_enabled:
             self.update_relays()
         else:
-            for light in self.LIGHTS:
-                self.vehicle.set_relay(light, False)
+            self.vehicle.set_relays({light: False for light in self.LIGHTS})
 
     def handle_active_cam_change(self, index: int):
         self.current_light = self.CAM_INDEX_TO_LIGHT[index]
@@ -29,8 +28,7 @@ class LightsManager:
 
     def update_relays(self):
         if self.global_enabled:
-            for light in self.LIGHTS:
-                self.vehicle.set_relay(light, light == self.current_light)
+            self.vehicle.set_relays({light: light == self.current_light for light in self.LIGHTS})
 
 
 class CameraManager:
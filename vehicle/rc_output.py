@@ -0,0 +1,77 @@
+import threading
+import time
+import typing as t
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+NUM_CHANNELS = 18
+IGNORE = 65535  # RC_CHANNELS_OVERRIDE value meaning "ignore this field"
+
+# How often unchanged overrides are resent. ArduPilot drops an override that hasn't been refreshed for RC_OVERRIDE_TIME
+# (3 s by default) and ArduSub's pilot input failsafe trips after FS_PILOT_TIMEOUT, so stay well inside both
+KEEPALIVE_FREQUENCY = 5
+
+
+class RcOutput:
+    """
+    Holds the RC override state sent to the vehicle. Changes are sent straight away and unchanged state is only resent
+    at keepalive_frequency, so a task setting the same inputs every tick doesn't flood the tether with identical
+    packets. send is called with the full list of NUM_CHANNELS pwms.
+    """
+
+    def __init__(self, send: t.Callable[[t.List[int]], None], keepalive_frequency: float = KEEPALIVE_FREQUENCY):
+        self._send = send
+        self.keepalive_period = 1 / keepalive_frequency
+
+        self._lock = threading.Lock()
+        self._channels = [IGNORE] * NUM_CHANNELS
+        self._last_send_time = None
+
+        # Packets sent because the state changed, resent as keepalives, and not sent because nothing changed
+        self.sent = 0
+        self.keepalives = 0
+        self.suppressed = 0
+
+    def set(self, pwms: t.Dict[int, int]) -> None:
+        """Update channels (1-18) and send if anything changed. Channels not in pwms keep their held value"""
+        with self._lock:
+            channels = list(self._channels)
+            for channel_id, pwm in pwms.items():
+                channels[channel_id - 1] = pwm
+
+            if channels == self._channels and self._last_send_time is not None:
+                self.suppressed += 1
+                return
+
+            self._channels = channels
+            self._transmit(time.monotonic())
+            self.sent += 1
+
+    def update(self, now: t.Optional[float] = None) -> None:
+        """Resend the held state if it hasn't been sent for a keepalive period. Called periodically"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self._last_send_time is None or now - self._last_send_time < self.keepalive_period:
+                return
+            self._transmit(now)
+            self.keepalives += 1
+
+    def reset(self) -> None:
+        """Forget the held state, e.g. on disarm, so nothing is resent and the next set is sent in full"""
+        with self._lock:
+            self._channels = [IGNORE] * NUM_CHANNELS
+            self._last_send_time = None
+
+    def _transmit(self, now: float):
+        self._last_send_time = now
+        try:
+            self._send(list(self._channels))
+        except Exception as e:
+            logger.error(f"Exception sending RC overrides: {e}")
+
+    def get_stats(self) -> t.Dict[str, int]:
+        with self._lock:
+            return {"sent": self.sent, "keepalives": self.keepalives, "suppressed": self.suppressed}
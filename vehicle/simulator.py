@@ -0,0 +1,188 @@
+import importlib
+import math
+import threading
+import time
+import typing as t
+
+from pymavlink import mavutil
+
+from logger import root_logger
+from vehicle.constants import InputChannel
+
+logger = root_logger.getChild(__name__)
+
+# ArduSub modes and custom_mode ids
+MODES = mavutil.mode_mapping_byname(mavutil.mavlink.MAV_TYPE_SUBMARINE)
+
+PHYSICS_FREQUENCY = 100  # Hz
+
+# Rates the vehicle streams telemetry at, in Hz. Roughly ArduSub's defaults with a companion computer
+STREAM_RATES = {
+    "HEARTBEAT": 1,
+    "ATTITUDE": 10,
+    "VFR_HUD": 10,
+    "SYS_STATUS": 2,
+}
+
+# First-order dynamics: velocities approach input * MAX_* with this time constant
+TIME_CONSTANT = 0.4  # Seconds
+MAX_SPEED = 1.0  # Meters/second, forward, lateral and vertical
+MAX_YAW_RATE = math.radians(90)  # Radians/second
+
+# Overrides not refreshed for this long are released, like ArduPilot's RC_OVERRIDE_TIME
+RC_OVERRIDE_TIMEOUT = 3.0  # Seconds
+
+IGNORE = 65535
+NEUTRAL_PWM = 1500
+
+
+class SimulatedVehicle(threading.Thread):
+    """
+    A stand-in ArduSub vehicle for tests and benchmarks, so VehicleControl, the scheduler and tasks can run without
+    SITL or Gazebo. It speaks enough MAVLink 2 over local UDP: heartbeats, arm/disarm and set mode commands with
+    COMMAND_ACKs, RC overrides, TIMESYNC, and ATTITUDE/VFR_HUD/SYS_STATUS telemetry. Motion is first-order, each
+    velocity approaching its RC input with TIME_CONSTANT, and ALT_HOLD holds depth while the throttle is centered.
+    """
+
+    def __init__(self, port: int = 14550, host: str = "127.0.0.1", stream_rates: t.Optional[t.Dict[str, float]] = None):
+        super().__init__(daemon=True, name="simulated-vehicle")
+        self.stream_rates = dict(STREAM_RATES if stream_rates is None else stream_rates)
+
+        self.link = mavutil.mavlink_connection(f"udpout:{host}:{port}", source_system=1, source_component=1)
+        # ArduSub talks MAVLink 2. Give this connection a MAVLink 2 encoder of its own, instead of setting MAVLINK20,
+        # which would switch every connection in the process. It still parses MAVLink 1, and first_byte is cleared
+        # so pymavlink doesn't try to auto-detect the version
+        mavlink2 = importlib.import_module(f"pymavlink.dialects.v20.{mavutil.current_dialect}")
+        self.link.mav = mavlink2.MAVLink(self.link, srcSystem=1, srcComponent=1)
+        self.link.mav.robust_parsing = True
+        self.link.WIRE_PROTOCOL_VERSION = mavlink2.WIRE_PROTOCOL_VERSION
+        self.link.first_byte = False
+
+        self.armed = False
+        self.mode_id = MODES["MANUAL"]
+        self.depth = 0.0  # Meters, positive down
+        self.yaw = 0.0  # Radians
+        self.velocity = {InputChannel.FORWARD: 0.0, InputChannel.LATERAL: 0.0, InputChannel.THROTTLE: 0.0}
+        self.yaw_rate = 0.0
+        self.target_depth = None
+
+        self.rc_pwms: t.Dict[int, int] = {}
+        self.rc_override_time = None
+
+        self.commands_received = 0
+        self.overrides_received = 0
+        self._running = True
+
+    def stop(self):
+        self._running = False
+        self.join()
+
+    def run(self):
+        period = 1 / PHYSICS_FREQUENCY
+        next_sends = {name: 0.0 for name in self.stream_rates}
+        deadline = time.monotonic()
+
+        while self._running:
+            now = time.monotonic()
+            self._receive(now)
+            self._step(period, now)
+
+            for name, rate in self.stream_rates.items():
+                if now >= next_sends[name]:
+                    self._send_stream(name)
+                    next_sends[name] = now + 1 / rate
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+    def input(self, channel: InputChannel) -> float:
+        """Current RC input of a channel in [-1, 1]"""
+        pwm = self.rc_pwms.get(channel.value, NEUTRAL_PWM)
+        return max(-1.0, min(1.0, (pwm - NEUTRAL_PWM) / 400))
+
+    def _step(self, dt: float, now: float):
+        if self.rc_override_time is not None and now - self.rc_override_time > RC_OVERRIDE_TIMEOUT:
+            self.rc_pwms.clear()
+            self.rc_override_time = None
+
+        alpha = 1 - math.exp(-dt / TIME_CONSTANT)
+        for channel in self.velocity:
+            target = self.input(channel) * MAX_SPEED if self.armed else 0.0
+            if channel == InputChannel.THROTTLE and self.armed and self.mode_id == MODES["ALT_HOLD"]:
+                # Hold depth with the throttle centered, like ArduSub
+                if abs(self.input(channel)) < 0.05:
+                    if self.target_depth is None:
+                        self.target_depth = self.depth
+                    target = max(-MAX_SPEED, min(MAX_SPEED, (self.depth - self.target_depth) * 2))
+                else:
+                    self.target_depth = None
+            self.velocity[channel] += (target - self.velocity[channel]) * alpha
+
+        target_yaw_rate = self.input(InputChannel.YAW) * MAX_YAW_RATE if self.armed else 0.0
+        self.yaw_rate += (target_yaw_rate - self.yaw_rate) * alpha
+
+        # Positive throttle is up, depth is positive down, and the vehicle can't fly out of the water
+        self.depth = max(0.0, self.depth - self.velocity[InputChannel.THROTTLE] * dt)
+        self.yaw = (self.yaw + self.yaw_rate * dt + math.pi) % (2 * math.pi) - math.pi
+
+    def _receive(self, now: float):
+        while True:
+            msg = self.link.recv_msg()
+            if msg is None:
+                return
+            msg_type = msg.get_type()
+
+            if msg_type == "RC_CHANNELS_OVERRIDE":
+                self.overrides_received += 1
+                for i in range(1, 19):
+                    pwm = getattr(msg, f"chan{i}_raw", IGNORE)
+                    if pwm == 0:
+                        self.rc_pwms.pop(i, None)
+                    elif pwm != IGNORE:
+                        self.rc_pwms[i] = pwm
+                self.rc_override_time = now
+
+            elif msg_type == "COMMAND_LONG":
+                self.commands_received += 1
+                self._handle_command(msg)
+
+            elif msg_type == "TIMESYNC" and msg.tc1 == 0:
+                self.link.mav.timesync_send(time.monotonic_ns(), msg.ts1)
+
+    def _handle_command(self, msg):
+        result = mavutil.mavlink.MAV_RESULT_ACCEPTED
+        if msg.command == mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM:
+            self.armed = msg.param1 == 1
+            if not self.armed:
+                self.rc_pwms.clear()
+        elif msg.command == mavutil.mavlink.MAV_CMD_DO_SET_MODE:
+            if int(msg.param2) in MODES.values():
+                self.mode_id = int(msg.param2)
+                self.target_depth = None
+            else:
+                result = mavutil.mavlink.MAV_RESULT_DENIED
+        else:
+            result = mavutil.mavlink.MAV_RESULT_UNSUPPORTED
+        self.link.mav.command_ack_send(msg.command, result)
+
+    def _send_stream(self, name: str):
+        mav = self.link.mav
+        if name == "HEARTBEAT":
+            base_mode = mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+            if self.armed:
+                base_mode |= mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+            mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_SUBMARINE, mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                               base_mode, self.mode_id, mavutil.mavlink.MAV_STATE_ACTIVE)
+        elif name == "ATTITUDE":
+            mav.attitude_send(int(time.monotonic() * 1000) & 0xFFFFFFFF, 0, 0, self.yaw, 0, 0, self.yaw_rate)
+        elif name == "VFR_HUD":
+            heading = int(math.degrees(self.yaw)) % 360
+            throttle = int(abs(self.input(InputChannel.THROTTLE)) * 100)
+            mav.vfr_hud_send(0, self.velocity[InputChannel.FORWARD], heading, throttle, -self.depth,
+                             self.velocity[InputChannel.THROTTLE])
+        elif name == "SYS_STATUS":
+            mav.sys_status_send(0, 0, 0, 500, 16000, 1000, 80, 0, 0, 0, 0, 0, 0)
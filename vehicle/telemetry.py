@@ -0,0 +1,192 @@
+import dataclasses
+import threading
+import time
+import typing as t
+from collections import defaultdict, deque
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# Subscribe to this to receive every message
+ALL_MESSAGES = "*"
+
+# Number of STATUSTEXT messages kept
+STATUS_TEXT_HISTORY = 50
+
+
+# All timestamps are time.monotonic() seconds at which the message was received
+
+@dataclasses.dataclass
+class Heartbeat:
+    armed: bool
+    base_mode: int
+    custom_mode: int
+    autopilot: int
+    vehicle_type: int
+    system_status: int
+    timestamp: float
+
+
+@dataclasses.dataclass
+class Attitude:
+    roll: float  # Radians
+    pitch: float
+    yaw: float
+    rollspeed: float  # Radians/second
+    pitchspeed: float
+    yawspeed: float
+    timestamp: float
+
+
+@dataclasses.dataclass
+class Depth:
+    depth: float  # Meters, ArduSub reports depth as the VFR_HUD altitude, so it is negative underwater
+    heading: int  # Degrees
+    climb: float  # Meters/second
+    throttle: int  # Percent
+    timestamp: float
+
+
+@dataclasses.dataclass
+class Battery:
+    voltage: float  # Volts
+    current: float  # Amps, -1 if unknown
+    remaining: int  # Percent, -1 if unknown
+    timestamp: float
+
+
+@dataclasses.dataclass
+class ServoOutputs:
+    pwms: t.Tuple[int, ...]  # Servo/motor outputs 1-16 in microseconds
+    timestamp: float
+
+
+@dataclasses.dataclass
+class StatusText:
+    severity: int
+    text: str
+    timestamp: float
+
+
+@dataclasses.dataclass
+class CommandAck:
+    command: int  # MAV_CMD
+    result: int  # MAV_RESULT
+    timestamp: float
+
+
+@dataclasses.dataclass
+class MavlinkMessage:
+    """Any message type without a dedicated class"""
+    type: str
+    fields: dict
+    timestamp: float
+
+
+def decode_heartbeat(msg, timestamp) -> Heartbeat:
+    return Heartbeat(
+        armed=msg.base_mode & 0x80 == 0x80,
+        base_mode=msg.base_mode,
+        custom_mode=msg.custom_mode,
+        autopilot=msg.autopilot,
+        vehicle_type=msg.type,
+        system_status=msg.system_status,
+        timestamp=timestamp,
+    )
+
+
+def decode_attitude(msg, timestamp) -> Attitude:
+    return Attitude(msg.roll, msg.pitch, msg.yaw, msg.rollspeed, msg.pitchspeed, msg.yawspeed, timestamp)
+
+
+def decode_vfr_hud(msg, timestamp) -> Depth:
+    return Depth(msg.alt, msg.heading, msg.climb, msg.throttle, timestamp)
+
+
+def decode_sys_status(msg, timestamp) -> Battery:
+    return Battery(
+        voltage=msg.voltage_battery / 1000,
+        current=msg.current_battery / 100 if msg.current_battery != -1 else -1,
+        remaining=msg.battery_remaining,
+        timestamp=timestamp,
+    )
+
+
+def decode_servo_output_raw(msg, timestamp) -> ServoOutputs:
+    pwms = tuple(getattr(msg, f"servo{i}_raw", 0) for i in range(1, 17))
+    return ServoOutputs(pwms, timestamp)
+
+
+def decode_statustext(msg, timestamp) -> StatusText:
+    return StatusText(msg.severity, msg.text, timestamp)
+
+
+def decode_command_ack(msg, timestamp) -> CommandAck:
+    return CommandAck(msg.command, msg.result, timestamp)
+
+
+DECODERS = {
+    "HEARTBEAT": decode_heartbeat,
+    "ATTITUDE": decode_attitude,
+    "VFR_HUD": decode_vfr_hud,
+    "SYS_STATUS": decode_sys_status,
+    "SERVO_OUTPUT_RAW": decode_servo_output_raw,
+    "STATUSTEXT": decode_statustext,
+    "COMMAND_ACK": decode_command_ack,
+}
+
+
+class TelemetryCache:
+    """
+    The newest decoded state of every MAVLink message type received from the vehicle. Consumers either read the
+    cache whenever they like, or subscribe to message types and get called on the receiving thread as they arrive
+    """
+
+    def __init__(self):
+        self._latest: t.Dict[str, t.Any] = {}
+        self._subscribers: t.Dict[str, t.List[t.Callable]] = defaultdict(list)
+        self._subscribers_lock = threading.Lock()
+
+        self.status_texts = deque(maxlen=STATUS_TEXT_HISTORY)
+        self.message_counts: t.Dict[str, int] = defaultdict(int)
+
+    def handle_message(self, msg, timestamp: t.Optional[float] = None):
+        """Decode a pymavlink message, store it and notify subscribers"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        msg_type = msg.get_type()
+        decoder = DECODERS.get(msg_type)
+        if decoder is not None:
+            value = decoder(msg, timestamp)
+        else:
+            value = MavlinkMessage(msg_type, msg.to_dict(), timestamp)
+
+        self._latest[msg_type] = value
+        self.message_counts[msg_type] += 1
+        if msg_type == "STATUSTEXT":
+            self.status_texts.append(value)
+
+        with self._subscribers_lock:
+            callbacks = self._subscribers.get(msg_type, []) + self._subscribers.get(ALL_MESSAGES, [])
+
+        for callback in callbacks:
+            try:
+                callback(value)
+            except Exception as e:
+                logger.error(f"Exception in {msg_type} telemetry subscriber: {e}")
+
+    def get(self, msg_type: str):
+        """Returns the newest decoded message of the given type, or None if none has been received"""
+        return self._latest.get(msg_type)
+
+    def subscribe(self, msg_type: str, callback: t.Callable):
+        """Call callback with each decoded message of the given type (or ALL_MESSAGES)"""
+        with self._subscribers_lock:
+            self._subscribers[msg_type].append(callback)
+
+    def unsubscribe(self, msg_type: str, callback: t.Callable):
+        with self._subscribers_lock:
+            if callback in self._subscribers[msg_type]:
+                self._subscribers[msg_type].remove(callback)
@@ -0,0 +1,278 @@
+import dataclasses
+import datetime
+import pathlib
+import threading
+import typing as t
+from os import listdir, makedirs, path, remove, replace
+
+import numpy as np
+
+from logger import root_logger
+
+logger = root_logger.getChild(__name__)
+
+# Samples kept in memory per channel. Telemetry streams at 10 Hz or less, so this is over half an hour
+CAPACITY = 20_000
+
+CHUNK_FORMAT = 'telemetry_{:05d}.npz'
+
+# Telemetry message types and the fields of their decoded dataclasses stored as channels, named after the field
+TELEMETRY_CHANNELS = {
+    "ATTITUDE": ("roll", "pitch", "yaw"),
+    "VFR_HUD": ("depth", "heading", "climb", "throttle"),
+    "SYS_STATUS": ("voltage", "current"),
+}
+
+
+def new_telemetry_path() -> str:
+    logs_path = (pathlib.Path(__file__).parent.parent / "logs").resolve()
+    return datetime.datetime.now().strftime(str(logs_path) + "/%Y-%m-%d_%H%M%S_telemetry")
+
+
+@dataclasses.dataclass
+class WindowStats:
+    count: int
+    min: float
+    max: float
+    mean: float
+
+
+class TelemetryRing:
+    """
+    The newest capacity samples of one channel, as NumPy columns of timestamps and values. Appends are O(1) and
+    overwrite the oldest sample once full. Timestamps must not go backwards
+    """
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.count = 0  # Samples held
+        self.total = 0  # Samples ever appended
+        self._next = 0  # Index the next sample goes in
+
+    def append(self, timestamp: float, value: float):
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def ordered(self, last: t.Optional[int] = None) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Copies of the last samples (default all) in time order"""
+        n = self.count if last is None else min(last, self.count)
+        indices = (np.arange(self._next - n, self._next)) % self.capacity
+        return self.timestamps[indices], self.values[indices]
+
+    def window(self, start: float, end: float = np.inf) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Samples with start <= timestamp <= end, in time order. Only the samples in the window are copied"""
+        if self.count < self.capacity:
+            segments = ((0, self._next),)
+        else:
+            segments = ((self._next, self.capacity), (0, self._next))  # Oldest first
+
+        timestamps, values = [], []
+        for begin, stop in segments:
+            segment = self.timestamps[begin:stop]
+            lo = begin + np.searchsorted(segment, start, side='left')
+            hi = begin + np.searchsorted(segment, end, side='right')
+            timestamps.append(self.timestamps[lo:hi])
+            values.append(self.values[lo:hi])
+        return np.concatenate(timestamps), np.concatenate(values)
+
+    def stats(self, start: float, end: float = np.inf) -> t.Optional[WindowStats]:
+        """min/max/mean of the samples in a time window, or None if it's empty"""
+        _, values = self.window(start, end)
+        if len(values) == 0:
+            return None
+        return WindowStats(len(values), float(values.min()), float(values.max()), float(values.mean()))
+
+    def decimated(self, max_points: int, start: float = -np.inf,
+                  end: float = np.inf) -> t.Tuple[np.ndarray, np.ndarray]:
+        """
+        At most max_points samples from a time window for plotting. Samples are split into buckets
+        and the min and max of each are kept, so spikes survive decimation
+        """
+        timestamps, values = self.window(start, end)
+        n = len(values)
+        if n <= max_points:
+            return timestamps, values
+
+        buckets = max((max_points - 1) // 2, 1)
+        size = -(-n // buckets)  # Ceiling division
+        usable = (n // size) * size
+        shaped = values[:usable].reshape(-1, size)
+        offsets = np.arange(0, usable, size)
+        argmin = offsets + shaped.argmin(axis=1)
+        argmax = offsets + shaped.argmax(axis=1)
+
+        # Keep each bucket's min and max in time order, plus the last sample so the plot reaches the present
+        indices = np.sort(np.concatenate((argmin, argmax)))
+        indices = np.append(indices, n - 1)
+        return timestamps[indices], values[indices]
+
+
+class MinMaxBuckets:
+    """
+    A rolling, pre-decimated history for plotting: num_buckets buckets of span / num_buckets seconds, each holding the
+    min and max of the samples that fell in it. Appends are O(1) and reads cost num_buckets however long it has run.
+    Safe to append from one thread and read from another
+    """
+
+    def __init__(self, span: float, num_buckets: int):
+        self.span = span
+        self.num_buckets = num_buckets
+        self.bucket_width = span / num_buckets
+        self.mins = np.full(num_buckets, np.nan)
+        self.maxs = np.full(num_buckets, np.nan)
+        self.latest = None  # (timestamp, value) of the newest sample
+        self._bucket = None  # Absolute index of the newest bucket, timestamp // bucket_width
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, value: float):
+        bucket = int(timestamp // self.bucket_width)
+        with self._lock:
+            if self._bucket is None or bucket > self._bucket + self.num_buckets:
+                self.mins[:] = np.nan
+                self.maxs[:] = np.nan
+            elif bucket > self._bucket:
+                # Clear the buckets skipped over and the one being started
+                skipped = np.arange(self._bucket + 1, bucket + 1) % self.num_buckets
+                self.mins[skipped] = np.nan
+                self.maxs[skipped] = np.nan
+            elif bucket < self._bucket:
+                bucket = self._bucket  # Late sample, fold it into the newest bucket
+
+            self._bucket = bucket
+            i = bucket % self.num_buckets
+            if np.isnan(self.mins[i]):
+                self.mins[i] = self.maxs[i] = value
+            else:
+                self.mins[i] = min(self.mins[i], value)
+                self.maxs[i] = max(self.maxs[i], value)
+            self.latest = (timestamp, value)
+
+    def read(self, now: t.Optional[float] = None) -> t.Tuple[np.ndarray, np.ndarray]:
+        """
+        The mins and maxes of the last num_buckets buckets before now (default the newest sample), oldest first.
+        Buckets without samples are NaN
+        """
+        with self._lock:
+            if self._bucket is None:
+                return np.full(self.num_buckets, np.nan), np.full(self.num_buckets, np.nan)
+            end = self._bucket if now is None else max(int(now // self.bucket_width), self._bucket)
+            indices = np.arange(end - self.num_buckets + 1, end + 1)
+            valid = indices <= self._bucket
+            mins = np.where(valid, self.mins[indices % self.num_buckets], np.nan)
+            maxs = np.where(valid, self.maxs[indices % self.num_buckets], np.nan)
+            # Buckets more than num_buckets behind the newest have been reused
+            stale = indices <= self._bucket - self.num_buckets
+            mins[stale] = np.nan
+            maxs[stale] = np.nan
+            return mins, maxs
+
+
+class TelemetryStore:
+    """
+    A TelemetryRing per channel, with periodic flushes of new samples to disk so nothing is lost once a ring wraps.
+    Each flush writes one .npz chunk to flush_path holding a timestamp and a value column per channel
+    ('<channel>.t' and '<channel>.v'). append is called on the vehicle I/O loop, and everything else can be called
+    from any thread.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, flush_path: t.Optional[str] = None):
+        self.capacity = capacity
+        self.flush_path = flush_path
+        self.rings: t.Dict[str, TelemetryRing] = {}
+        self.dropped = 0  # Samples overwritten before they were flushed, or lost to a failed write
+
+        self._lock = threading.Lock()
+        self._flushed: t.Dict[str, int] = {}  # Channel -> ring.total at the last flush
+        self._chunk_index = 0
+
+    def append(self, channel: str, timestamp: float, value: float):
+        with self._lock:
+            ring = self.rings.get(channel)
+            if ring is None:
+                ring = self.rings[channel] = TelemetryRing(self.capacity)
+                self._flushed[channel] = 0
+            ring.append(timestamp, value)
+
+    def append_message(self, msg_type: str, value):
+        """Store the channels of a decoded telemetry message from vehicle.telemetry"""
+        for field in TELEMETRY_CHANNELS.get(msg_type, ()):
+            self.append(field, value.timestamp, getattr(value, field))
+
+    def channels(self) -> t.List[str]:
+        with self._lock:
+            return list(self.rings)
+
+    def window(self, channel: str, start: float, end: float = np.inf) -> t.Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            ring = self.rings.get(channel)
+            return ring.window(start, end) if ring is not None else (np.zeros(0), np.zeros(0))
+
+    def stats(self, channel: str, start: float, end: float = np.inf) -> t.Optional[WindowStats]:
+        with self._lock:
+            ring = self.rings.get(channel)
+            return ring.stats(start, end) if ring is not None else None
+
+    def decimated(self, channel: str, max_points: int, start: float = -np.inf,
+                  end: float = np.inf) -> t.Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            ring = self.rings.get(channel)
+            return ring.decimated(max_points, start, end) if ring is not None else (np.zeros(0), np.zeros(0))
+
+    def flush(self):
+        """Write every sample appended since the last flush to a new chunk, if there's a flush_path"""
+        if self.flush_path is None:
+            return
+
+        columns = {}
+        with self._lock:
+            for channel, ring in self.rings.items():
+                new = ring.total - self._flushed[channel]
+                if new == 0:
+                    continue
+                if new > ring.count:
+                    self.dropped += new - ring.count
+                timestamps, values = ring.ordered(new)
+                columns[f'{channel}.t'] = timestamps
+                columns[f'{channel}.v'] = values
+                self._flushed[channel] = ring.total
+
+            if not columns:
+                return
+            chunk_index = self._chunk_index
+            self._chunk_index += 1
+
+        # Written outside the lock so appends on the I/O loop never wait for the disk. Flushes usually run on a thread
+        # pool where an exception would go unseen, so failures are logged here. Chunks are written under a temporary
+        # name and renamed, so a failed write never leaves a partial chunk for load_telemetry to trip over
+        chunk_path = path.join(self.flush_path, CHUNK_FORMAT.format(chunk_index))
+        try:
+            makedirs(self.flush_path, exist_ok=True)
+            with open(chunk_path + '.tmp', 'wb') as chunk_file:
+                np.savez_compressed(chunk_file, **columns)
+            replace(chunk_path + '.tmp', chunk_path)
+        except Exception as e:
+            lost = sum(len(column) for key, column in columns.items() if key.endswith('.t'))
+            with self._lock:
+                self.dropped += lost
+            logger.error(f"Couldn't write telemetry chunk {chunk_path}, {lost} samples lost: {e}")
+            try:
+                remove(chunk_path + '.tmp')
+            except OSError:
+                pass
+
+
+def load_telemetry(telemetry_path: str) -> t.Dict[str, t.Tuple[np.ndarray, np.ndarray]]:
+    """Read every chunk flushed by a TelemetryStore, returning (timestamps, values) per channel"""
+    timestamps: t.Dict[str, t.List[np.ndarray]] = {}
+    values: t.Dict[str, t.List[np.ndarray]] = {}
+    for chunk_file in sorted(f for f in listdir(telemetry_path) if f.startswith('telemetry_') and f.endswith('.npz')):
+        with np.load(path.join(telemetry_path, chunk_file)) as chunk:
+            for key in chunk.files:
+                channel, column = key.rsplit('.', 1)
+                (timestamps if column == 't' else values).setdefault(channel, []).append(chunk[key])
+    return {channel: (np.concatenate(timestamps[channel]), np.concatenate(values[channel])) for channel in timestamps}
@@ -1,17 +1,29 @@
+import functools
 import json
+import threading
 import typing as t
 import time
-import socket
 
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QThreadPool
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject
 from pymavlink import mavutil
 
 from logger import root_logger
+from vehicle.command_channel import CommandChannel
 from vehicle.constants import InputChannel, Relay, Camera
+from vehicle.input_latency import InputLatencyTracer
+from vehicle.io_loop import VehicleIoLoop
+from vehicle.link_monitor import LinkMonitor, LinkHealth, TIMESYNC_PERIOD
+from vehicle.mavlink_endpoint import MavlinkEndpoint
+from vehicle.modes import ModeTable, ModeRequest, ModeTransition, SET_MODE_ACK_COMMANDS, NON_AUTOPILOTS
+from vehicle.rc_output import RcOutput, NUM_CHANNELS, KEEPALIVE_FREQUENCY
+from vehicle.telemetry import TelemetryCache, Heartbeat, Depth, CommandAck
+from vehicle.telemetry_store import TelemetryStore, TELEMETRY_CHANNELS
 
 logger = root_logger.getChild(__name__)
 
-TIMEOUT = 2  # Seconds without a message before we assume the connection's lost
+LINK_CHECK_PERIOD = 0.05  # Seconds between checks for a lost connection and RC keepalives being due
+LINK_HEALTH_PERIOD = 0.5  # Seconds between link_health_signal updates
+TELEMETRY_FLUSH_PERIOD = 30  # Seconds between writes of the telemetry history to disk
 
 BACKWARD_CAM_INDICES = (2,)
 
@@ -19,6 +31,9 @@ HOST = "192.168.2.2"  # The server's hostname or IP address
 RELAY_SOCKET_PORT = 60000
 CAMERA_SOCKET_PORT = 5000
 
+# Relay changes this close together are sent in one packet
+RELAY_BATCH_WINDOW = 0.01  # Seconds
+
 
 class VehicleControl(QObject):
     connected_signal = pyqtSignal()
@@ -27,76 +42,184 @@ class VehicleControl(QObject):
     disarmed_signal = pyqtSignal()
     mode_signal = pyqtSignal(str)
     set_mode_signal = pyqtSignal(str)
+    mode_transition_signal = pyqtSignal(object)  # ModeTransition
+    mode_ack_signal = pyqtSignal(object)  # ModeRequest, once its COMMAND_ACK arrives
     cameras_set_signal = pyqtSignal(dict)
+    relays_set_signal = pyqtSignal(dict)  # {Relay: bool} of every relay state the server has been sent
     depth_update_signal = pyqtSignal(float)
+    link_health_signal = pyqtSignal(object)  # LinkHealth
 
-    def __init__(self, port):
+    def __init__(self, port, rc_keepalive_frequency: float = KEEPALIVE_FREQUENCY, host: str = HOST,
+                 telemetry_path: t.Optional[str] = None):
         super().__init__()
-        self.last_msg_time = None
         self.connected = False
         self.armed = False
         self.mode_id = None
         self.mode = None
 
+        # Built from the first heartbeat of each connection, and rebuilt if the autopilot or vehicle type changes
+        self.mode_table: t.Optional[ModeTable] = None
+        self.mode_request: t.Optional[ModeRequest] = None  # The newest set_mode request not yet seen in a heartbeat
+
+        # Every link to the vehicle runs on one event loop thread
+        self.io = VehicleIoLoop()
+        self.io.start()
+
         self.link = mavutil.mavlink_connection(f'udpin:0.0.0.0:{port}')
 
+        # Read the link as messages arrive into a cache of the newest state of every message type
+        self.telemetry = TelemetryCache()
+        self.telemetry.subscribe("HEARTBEAT", self._on_heartbeat)
+        self.telemetry.subscribe("VFR_HUD", self._on_depth)
+        self.telemetry.subscribe("COMMAND_ACK", self._on_command_ack)
+
+        # History of every telemetry channel for plots and review, written to telemetry_path if there is one
+        self.telemetry_store = TelemetryStore(flush_path=telemetry_path)
+        for msg_type in TELEMETRY_CHANNELS:
+            self.telemetry.subscribe(msg_type, functools.partial(self.telemetry_store.append_message, msg_type))
+        self.mavlink = MavlinkEndpoint(self.io, self.link, self.telemetry)
+
+        # Rates, packet loss, round trip time and staleness of the link. Tasks can read link_health to slow down or
+        # stop on a bad link before it's lost completely
+        self.link_monitor = LinkMonitor()
+        self.link_health: t.Optional[LinkHealth] = None
+        self.mavlink.register_message_callback(self.link_monitor.handle_message)
+        self.mavlink.start()
+
         self.camera_states = {cam: False for cam in Camera}
         self.camera_states[Camera.FRONT] = True
         self.camera_states[Camera.BOTTOM] = True
 
         self.set_mode_signal.connect(self.set_mode)
 
-        self._thread_manager = QThreadPool()
-
-    def update(self):
-        msg = self.link.wait_heartbeat(blocking=False)
-        if msg is not None:
-            if not self.connected:
-                self.connected_signal.emit()
-                self.connected = True
-
-            self.last_msg_time = time.time()
-            msg_dict = msg.to_dict()
-
-            armed = msg_dict.get("base_mode", None) & 0x80 == 0x80
-
-            if armed != self.armed:
-                if armed:
-                    self.armed_signal.emit()
-                    print('Try:', list(self.link.mode_mapping().keys()))
-                else:
-                    self.disarmed_signal.emit()
-                self.armed = armed
-            
-            mode_id = msg_dict.get("custom_mode")
-            if mode_id != self.mode_id:
-                mode = None
-                for m, m_id in self.link.mode_mapping().items():
-                    if m_id == mode_id:
-                        mode = m
-                        break
-                
-                self.mode_id = mode_id
-                self.mode = mode
-                logger.info(f'New Mode: {mode}')
-                self.mode_signal.emit(mode)
+        # Persistent connections to the ROV's relay and camera servers, keeping commands in order
+        self.relay_channel = CommandChannel(self.io, host, RELAY_SOCKET_PORT, RELAY_BATCH_WINDOW, name="relay-channel")
+        self.relay_channel.register_sent_callback(self._on_relays_sent)
+        self.relay_channel.start()
+        self.camera_channel = CommandChannel(self.io, host, CAMERA_SOCKET_PORT, name="camera-channel")
+        self.camera_channel.start()
+
+        # Relay states written to the server, and how many commands for each relay are queued but not written yet
+        self._relay_lock = threading.Lock()
+        self.relay_states: t.Dict[Relay, bool] = {}
+        self._relays_in_flight: t.Dict[Relay, int] = {}
+
+        # Called with the inputs of every set_rc_inputs call, e.g. to record them
+        self.rc_input_callbacks = []
+
+        # Only sends RC overrides when they change, plus keepalives
+        self.rc_output = RcOutput(self._send_rc_overrides, rc_keepalive_frequency)
+        # Time from pilot input events to the overrides carrying them, for inputs set with their event times
+        self.input_latency = InputLatencyTracer()
+
+        self._link_check_timer = self.io.call_every(LINK_CHECK_PERIOD, self._check_link)
+        self._link_health_timer = self.io.call_every(LINK_HEALTH_PERIOD, self._publish_link_health)
+        self._timesync_timer = self.io.call_every(TIMESYNC_PERIOD, self._send_timesync)
+        # Flushed on the loop's thread pool so the disk never holds up the links
+        self._telemetry_flush_timer = self.io.call_every(
+            TELEMETRY_FLUSH_PERIOD, lambda: self.io.loop.run_in_executor(None, self.telemetry_store.flush))
+
+    def _on_heartbeat(self, heartbeat: Heartbeat):
+        """Called on the I/O loop for each heartbeat"""
+        if not self.connected:
+            self.connected_signal.emit()
+            self.connected = True
+
+        # GCSs and companion computers send heartbeats too, only the autopilot's carry the vehicle's arm state and mode
+        if heartbeat.autopilot in NON_AUTOPILOTS:
+            return
 
-        else:
-            if self.connected and time.time() - self.last_msg_time > TIMEOUT:
-                self.disconnected_signal.emit()
-                self.connected = False
+        if self.mode_table is None or not self.mode_table.matches(heartbeat):
+            self.mode_table = ModeTable.from_heartbeat(heartbeat)
+            self.mode_id = None
+            logger.info(f'Modes: {", ".join(self.mode_table.ids)}')
+
+        if heartbeat.armed != self.armed:
+            if heartbeat.armed:
+                self.armed_signal.emit()
+            else:
+                self.disarmed_signal.emit()
+                self.rc_output.reset()
+            self.input_latency.reset()
+            self.armed = heartbeat.armed
+
+        mode_id = heartbeat.custom_mode
+        if mode_id != self.mode_id:
+            request = self.mode_request
+            if request is not None and request.mode_id == mode_id:
+                self.mode_request = None
+            else:
+                request = None
+
+            transition = ModeTransition(self.mode, self.mode_table.name(mode_id), mode_id, heartbeat.timestamp, request)
+            self.mode_id = mode_id
+            self.mode = transition.mode
+
+            if request is not None:
+                logger.info(f'New Mode: {self.mode}, {transition.confirm_latency * 1000:.0f} ms after request')
+            else:
+                logger.info(f'New Mode: {self.mode}')
+            self.mode_transition_signal.emit(transition)
+            self.mode_signal.emit(self.mode)
+
+    def _on_command_ack(self, ack: CommandAck):
+        """Called on the I/O loop for each COMMAND_ACK"""
+        request = self.mode_request
+        if ack.command not in SET_MODE_ACK_COMMANDS or request is None or request.acked_at is not None:
+            return
 
-        msg = self.link.recv_match(type="VFR_HUD", blocking=False)
-        if msg is not None:
-            self.depth_update_signal.emit(msg.alt)
+        request.acked_at = ack.timestamp
+        request.result = ack.result
+        if request.accepted:
+            logger.debug(f'Mode {request.mode} acknowledged in {request.ack_latency * 1000:.0f} ms')
+        else:
+            logger.warning(f'Mode {request.mode} rejected with result {ack.result}')
+            self.mode_request = None
+        self.mode_ack_signal.emit(request)
+
+    def _on_depth(self, depth: Depth):
+        """Called on the I/O loop for each VFR_HUD"""
+        self.depth_update_signal.emit(depth.depth)
+
+    def _check_link(self):
+        """Called on the I/O loop every LINK_CHECK_PERIOD"""
+        if self.connected and not self.link_monitor.is_connected():
+            self.disconnected_signal.emit()
+            self.connected = False
+            self.link_monitor.reset()
+            self.mode_table = None
+            self.mode_request = None
+            self.rc_output.reset()
+            self.input_latency.reset()
+            # The server may have restarted, so send every relay again next time
+            with self._relay_lock:
+                self.relay_states.clear()
+
+        if self.is_connected() and self.is_armed():
+            self.rc_output.update()
+
+    def _publish_link_health(self):
+        """Called on the I/O loop every LINK_HEALTH_PERIOD"""
+        self.link_health = self.link_monitor.get_health()
+        self.link_health_signal.emit(self.link_health)
+
+    def _send_timesync(self):
+        """Called on the I/O loop every TIMESYNC_PERIOD. The vehicle's reply gives the link's round trip time"""
+        if self.connected:
+            self.mavlink.send(self.link.mav.timesync_send, 0, self.link_monitor.new_timesync_request())
+
+    def stop(self) -> None:
+        """Close every link to the vehicle"""
+        self.io.stop()
+        self.telemetry_store.flush()
 
     def arm(self) -> None:
-        self.link.arducopter_arm()
+        self.mavlink.send(self.link.arducopter_arm)
         logger.info("Arm command sent")
 
     def disarm(self) -> None:
         self.turn_off_relays()
-        self.link.arducopter_disarm()
+        self.mavlink.send(self.link.arducopter_disarm)
         logger.info("Disarm command sent")
 
     def is_connected(self) -> bool:
@@ -105,30 +228,49 @@ class VehicleControl(QObject):
     def is_armed(self) -> bool:
         return self.armed
 
-    def set_rc_input_pwms(self, pwms: t.Dict[int, int]) -> None:
-        """Sets and RC input channel pwm value. PWM values should be between 1100 and 1900"""
+    def set_rc_input_pwms(self, pwms: t.Dict[int, int], event_times: t.Optional[t.Dict[int, float]] = None) -> None:
+        """
+        Sets and RC input channel pwm value. PWM values should be between 1100 and 1900. event_times can give the
+        time.monotonic() of the input event behind each channel to trace its latency
+        """
         if not self.is_connected() or not self.is_armed():
             return
 
-        rc_channel_values = [65535] * 18  # 65535 Means "ignore this field"
-
         for channel_id, pwm in pwms.items():
-            if channel_id < 1 or channel_id > 18:
+            if channel_id < 1 or channel_id > NUM_CHANNELS:
                 raise ValueError(f"Channel id does not exist: {channel_id}")
 
             if not 1100 <= pwm <= 1900:
                 raise ValueError(f"PWM values must be between 1100 and 1900, not f{pwm}")
 
-            rc_channel_values[channel_id - 1] = pwm
+        if event_times:
+            self.input_latency.set(pwms, event_times, time.monotonic())
+        self.rc_output.set(pwms)
 
+    def _send_rc_overrides(self, rc_channel_values: t.List[int]) -> None:
+        self.mavlink.send(self._write_rc_overrides, rc_channel_values)
+
+    def _write_rc_overrides(self, rc_channel_values: t.List[int]) -> None:
+        """Called on the I/O loop"""
         self.link.mav.rc_channels_override_send(
             self.link.target_system,  # target_system
             self.link.target_component,  # target_component
             *rc_channel_values  # RC channel list, in microseconds.
         )
+        self.input_latency.sent(rc_channel_values, time.monotonic())
+
+    def register_rc_input_callback(self, callback):
+        self.rc_input_callbacks.append(callback)
+
+    def set_rc_inputs(self, values: t.Dict[InputChannel, float],
+                      event_times: t.Optional[t.Dict[InputChannel, float]] = None) -> None:
+        """
+        Sets inputs to the pixhawk using values between -1 (full reverse) and 1 (full forward). event_times can give
+        the time.monotonic() of the input event behind each value to trace its latency
+        """
+        for callback in self.rc_input_callbacks:
+            callback(values)
 
-    def set_rc_inputs(self, values: t.Dict[InputChannel, float]) -> None:
-        """Sets inputs to the pixhawk using values between -1 (full reverse) and 1 (full forward)"""
         pwms = {}
         for channel, val in values.items():
             if not -1 <= val <= 1:
@@ -138,7 +280,9 @@ class VehicleControl(QObject):
             pwm = min(max(pwm, 1100), 1900)  # Clamp to acceptable pwm range in case of float weirdness
             pwms[channel.value] = pwm
 
-        self.set_rc_input_pwms(pwms)
+        if event_times is not None:
+            event_times = {channel.value: event_time for channel, event_time in event_times.items()}
+        self.set_rc_input_pwms(pwms, event_times)
 
     def stop_thrusters(self) -> None:
         self.set_rc_inputs({
@@ -154,31 +298,60 @@ class VehicleControl(QObject):
     @pyqtSlot(str)
     def set_mode(self, mode: str) -> None:
         logger.info(f'Setting mode: {mode}')
-        if mode in self.link.mode_mapping():
-            mode_id = self.link.mode_mapping()[mode]
-            self.link.set_mode(mode_id)
-        else:
+        if self.mode_table is None or mode not in self.mode_table:
             logger.info(f"Unknown mode: {mode}")
+            return
+
+        mode_id = self.mode_table.id(mode)
+        self.mode_request = ModeRequest(mode, mode_id, time.monotonic())
+        self.mavlink.send(
+            self.link.mav.command_long_send,
+            self.link.target_system,
+            self.link.target_component,
+            mavutil.mavlink.MAV_CMD_DO_SET_MODE,
+            0,  # confirmation
+            mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+            mode_id,
+            0, 0, 0, 0, 0
+        )
 
     def set_relay(self, relay: Relay, state: bool) -> None:
-        if not self.is_connected() or (not self.is_armed() and state):
+        self.set_relays({relay: state})
+
+    def set_relays(self, states: t.Dict[Relay, bool]) -> None:
+        """
+        Sets any number of relays in one message of [relay, state] pairs. A relay is skipped only if the server was
+        last sent the same state and no other command for it is still on the way. Relays can't be turned on while
+        disarmed
+        """
+        if not self.is_connected():
+            return
+
+        with self._relay_lock:
+            changes = {relay: state for relay, state in states.items()
+                       if (state is False or self.is_armed())
+                       and (self._relays_in_flight.get(relay) or self.relay_states.get(relay) != state)}
+            for relay in changes:
+                self._relays_in_flight[relay] = self._relays_in_flight.get(relay, 0) + 1
+        if not changes:
             return
 
-        def task():
-            logger.debug(f"Setting relay {relay.value} to {state}")
+        logger.debug(f"Setting relays {', '.join(f'{relay.value}: {state}' for relay, state in changes.items())}")
+        self.relay_channel.send(b''.join(bytes([relay.value, int(state)]) for relay, state in changes.items()))
 
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                try:
-                    sock.connect((HOST, RELAY_SOCKET_PORT))
-                    sock.sendall(bytes([relay.value, int(state)]))
-                except Exception as e:
-                    logger.error(f'Exception in relay socket sending: {e}')
-        
-        self._thread_manager.start(task)
+    def _on_relays_sent(self, commands):
+        """Called on the I/O loop once a batch of relay commands has been written to the server"""
+        with self._relay_lock:
+            for command in commands:
+                for i in range(0, len(command.payload), 2):
+                    relay = Relay(command.payload[i])
+                    self.relay_states[relay] = bool(command.payload[i + 1])
+                    self._relays_in_flight[relay] -= 1
+            states = dict(self.relay_states)
+        self.relays_set_signal.emit(states)
 
     def turn_off_relays(self) -> None:
-        for relay in Relay:
-            self.set_relay(relay, False)
+        self.set_relays({relay: False for relay in Relay})
 
     def set_camera_enabled(self, cam: Camera, enabled: bool) -> None:
         if not self.is_connected():
@@ -191,16 +364,7 @@ class VehicleControl(QObject):
     def send_camera_state(self) -> None:
         cams_dict = {cam.value: val for cam, val in self.camera_states.items()}
 
-        def task():
-            logger.debug(f"Setting enabled cameras to {cams_dict}")
-
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                try:
-                    sock.connect((HOST, CAMERA_SOCKET_PORT))
-                    sock.sendall(bytes(json.dumps(cams_dict) + '\n', 'utf-8'))
-                except Exception as e:
-                    logger.error(f'Exception in camera socket sending: {e}')
+        logger.debug(f"Setting enabled cameras to {cams_dict}")
+        self.camera_channel.send(bytes(json.dumps(cams_dict) + '\n', 'utf-8'), key="cameras")
 
         self.cameras_set_signal.emit(self.camera_states)
-        self._thread_manager.start(task)
-
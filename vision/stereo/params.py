@@ -27,18 +27,52 @@ class StereoParameters:
         return np.concatenate((left, right), axis=1)
     
     def triangulate_stereo_coord(self, point):
-        point_l = np.array([[point.xl], [point.y]], dtype=np.float64)
-        point_r = np.array([[point.xr], [point.y]], dtype=np.float64)
-        triangulated = cv2.triangulatePoints(self.proj_l, self.proj_r, point_l, point_r).reshape(4)
-        #print(triangulated)
-        triangulated /= triangulated[3]
-        return triangulated[0:3]
+        return self.triangulate_points(np.array([[point.xl, point.y]]), np.array([[point.xr, point.y]]))[0]
 
     def triangulate(self, point_l, point_r):
-        point = cv2.triangulatePoints(self.proj_l, self.proj_r, point_l, point_r).reshape(4)
-        point /= point[3]
-        return point[0:3]
+        return self.triangulate_points(np.reshape(point_l, (1, 2)), np.reshape(point_r, (1, 2)))[0]
 
+    def triangulate_points(self, points_l: np.ndarray, points_r: np.ndarray, closed_form: bool = False) -> np.ndarray:
+        """
+        Triangulate N points at once from N x 2 arrays of their (x, y) pixels in the rectified left and right images,
+        returning an N x 3 array. closed_form uses the rectified disparity formula instead of cv2's SVD per point
+        """
+        points_l = np.asarray(points_l, dtype=np.float64).reshape(-1, 2)
+        points_r = np.asarray(points_r, dtype=np.float64).reshape(-1, 2)
+        if closed_form:
+            return self._triangulate_rectified(points_l, points_r)
+        # cv2 rejects empty point arrays
+        if len(points_l) == 0:
+            return np.empty((0, 3))
+
+        homogeneous = cv2.triangulatePoints(self.proj_l, self.proj_r, points_l.T, points_r.T)
+        return (homogeneous[:3] / homogeneous[3]).T
+
+    def triangulate_segments(self, points_l: np.ndarray, points_r: np.ndarray,
+                             closed_form: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Triangulate the ends of N segments, e.g. the head and tail of every annotated fish, from N x 2 x 2 arrays of
+        their (start, end) pixels in each image. Returns the N x 2 x 3 ends and the N segment lengths
+        """
+        points_l = np.asarray(points_l, dtype=np.float64)
+        ends = self.triangulate_points(points_l.reshape(-1, 2), points_r, closed_form).reshape(len(points_l), 2, 3)
+        return ends, np.linalg.norm(ends[:, 1] - ends[:, 0], axis=1)
+
+    def _triangulate_rectified(self, points_l: np.ndarray, points_r: np.ndarray) -> np.ndarray:
+        # cv2.stereoRectify gives both cameras the same intrinsics, apart from cx, with the right one shifted along x
+        # by the baseline: proj_r[0, 3] = -fx * baseline. Depth then follows from the disparity directly
+        fx, cx_l, fy, cy = self.proj_l[0, 0], self.proj_l[0, 2], self.proj_l[1, 1], self.proj_l[1, 2]
+        if not (np.allclose(self.proj_l[:, 3], 0) and np.allclose(self.proj_r[1:, 3], 0)
+                and np.allclose(np.delete(self.proj_l[:, :3], 2, axis=1), np.delete(self.proj_r[:, :3], 2, axis=1))):
+            raise ValueError("The closed form needs the horizontal rectified projections cv2.stereoRectify makes")
+        cx_r = self.proj_r[0, 2]
+
+        x_l = points_l[:, 0] - cx_l
+        disparity = x_l - (points_r[:, 0] - cx_r)
+        z = -self.proj_r[0, 3] / disparity
+        # The rows should match after rectification, the mean splits any difference like the SVD would
+        y = (points_l[:, 1] + points_r[:, 1]) / 2 - cy
+        return np.stack((x_l * z / fx, y * z / fy, z), axis=1)
 
     @staticmethod
     def _file_path(name: str):
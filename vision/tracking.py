@@ -0,0 +1,140 @@
+import dataclasses
+import math
+import typing as t
+
+import numpy as np
+
+# Chi-squared value for 4 degrees of freedom at 99.9%. Measurements further than this from the prediction
+# (in Mahalanobis distance squared) are rejected as outliers
+GATE_THRESHOLD = 18.47
+
+# After this many outliers in a row, assume the target really moved and restart the track on the new measurement
+MAX_CONSECUTIVE_REJECTS = 5
+
+# Number of accepted measurements before the track reaches full confidence
+MIN_HITS = 3
+
+# Confidence decays by a factor of e every CONFIDENCE_DECAY seconds without an accepted measurement
+CONFIDENCE_DECAY = 0.5
+
+
+@dataclasses.dataclass
+class TrackEstimate:
+    """Estimated box of a tracked target, in pixels"""
+    x: float
+    y: float
+    vx: float
+    vy: float
+    width: float
+    height: float
+    confidence: float
+
+
+class BoxTracker:
+    """
+    A constant velocity Kalman filter over the center, velocity and size of a box in the image.
+
+    State: [x, y, vx, vy, width, height]. Measurement: [x, y, width, height].
+    update() feeds in detections as they arrive, and predict() extrapolates the box to any later time, so a control
+    loop can run faster than detection. Times are in seconds on any monotonic clock.
+    """
+
+    def __init__(self, acceleration_std=400.0, size_std=50.0, position_measurement_std=8.0,
+                 size_measurement_std=15.0):
+        self.acceleration_std = acceleration_std
+        self.size_std = size_std
+
+        self.H = np.zeros((4, 6))
+        self.H[0, 0] = self.H[1, 1] = self.H[2, 4] = self.H[3, 5] = 1
+        self.R = np.diag([position_measurement_std ** 2, position_measurement_std ** 2,
+                          size_measurement_std ** 2, size_measurement_std ** 2])
+
+        self.reset()
+
+    def reset(self):
+        self.state = None
+        self.P = None
+        self.time = None
+        self.hits = 0
+        self.consecutive_rejects = 0
+        self.rejected_total = 0
+
+    def _transition(self, dt: float) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Returns the state transition and process noise matrices for a time step"""
+        F = np.eye(6)
+        F[0, 2] = F[1, 3] = dt
+
+        # Discrete white noise acceleration for each position/velocity pair, random walk for the size
+        q = self.acceleration_std ** 2
+        Q = np.zeros((6, 6))
+        for pos, vel in ((0, 2), (1, 3)):
+            Q[pos, pos] = q * dt ** 4 / 4
+            Q[pos, vel] = Q[vel, pos] = q * dt ** 3 / 2
+            Q[vel, vel] = q * dt ** 2
+        Q[4, 4] = Q[5, 5] = self.size_std ** 2 * dt
+
+        return F, Q
+
+    def _start(self, z: np.ndarray, timestamp: float):
+        self.state = np.array([z[0], z[1], 0, 0, z[2], z[3]], dtype=np.float64)
+        self.P = np.diag([self.R[0, 0], self.R[1, 1], 500.0 ** 2, 500.0 ** 2, self.R[2, 2], self.R[3, 3]])
+        self.time = timestamp
+        self.hits = 1
+        self.consecutive_rejects = 0
+
+    def update(self, x: float, y: float, width: float, height: float, timestamp: float) -> bool:
+        """Add a detection. Returns whether it was accepted"""
+        z = np.array([x, y, width, height], dtype=np.float64)
+
+        if self.state is None:
+            self._start(z, timestamp)
+            return True
+
+        # Ignore detections older than the filter
+        if timestamp < self.time:
+            return False
+
+        F, Q = self._transition(timestamp - self.time)
+        state = F @ self.state
+        P = F @ self.P @ F.T + Q
+
+        innovation = z - self.H @ state
+        S = self.H @ P @ self.H.T + self.R
+        S_inv = np.linalg.inv(S)
+
+        if innovation @ S_inv @ innovation > GATE_THRESHOLD:
+            self.rejected_total += 1
+            self.consecutive_rejects += 1
+            if self.consecutive_rejects >= MAX_CONSECUTIVE_REJECTS:
+                self._start(z, timestamp)
+                return True
+            return False
+
+        K = P @ self.H.T @ S_inv
+        self.state = state + K @ innovation
+        self.P = (np.eye(6) - K @ self.H) @ P
+        self.time = timestamp
+        self.hits += 1
+        self.consecutive_rejects = 0
+        return True
+
+    @property
+    def confirmed(self) -> bool:
+        """Whether the current track has had MIN_HITS accepted detections, so one stray detection isn't acted on"""
+        return self.hits >= MIN_HITS
+
+    def confidence(self, timestamp: float) -> float:
+        """In [0, 1]. Grows with accepted detections and decays while coasting without them"""
+        if self.state is None:
+            return 0.0
+        age = max(timestamp - self.time, 0.0)
+        return min(self.hits / MIN_HITS, 1.0) * math.exp(-age / CONFIDENCE_DECAY)
+
+    def predict(self, timestamp: float) -> t.Optional[TrackEstimate]:
+        """Extrapolate the box to the given time without changing the filter. Returns None if nothing is tracked"""
+        if self.state is None:
+            return None
+
+        dt = max(timestamp - self.time, 0.0)
+        x, y, vx, vy, width, height = self.state.tolist()
+        return TrackEstimate(x + vx * dt, y + vy * dt, vx, vy, width, height, self.confidence(timestamp))